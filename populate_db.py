@@ -43,10 +43,10 @@ import django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'quickcart.settings')
 django.setup()
 
+from django.conf import settings
 from django.core.management import call_command
-from django.core.files import File
+from shop.catalog_import import CatalogImporter
 from shop.models import User, Product
-import shutil
 from pathlib import Path
 
 # Применяем миграции
@@ -179,66 +179,34 @@ products_data = [
     },
 ]
 
-# Создаём папку для изображений, если её нет
-from django.conf import settings
-media_products_dir = settings.MEDIA_ROOT / 'products'
-media_products_dir.mkdir(parents=True, exist_ok=True)
-
 # Путь к папке с исходными изображениями
 imgs_dir = Path(__file__).parent / 'imgs'
 
-# Добавляем товары в базу
+
+def image_filename(name):
+    """Имя файла изображения на основе названия товара."""
+    # Заменяем пробелы и специальные символы на подчёркивания, убираем скобки
+    safe_name = name.replace(' ', '_').replace('(', '').replace(')', '').replace('+', '_')
+    return f'{safe_name}.jpg'
+
+
+# Добавляем товары в базу тем же импортом, что и manage.py import_catalog:
+# пачкой, с upsert по slug, поэтому скрипт можно запускать повторно
 print('\nДобавление товаров в базу...')
-created_count = 0
-updated_count = 0
+records = []
 for product_data in products_data:
-    # Генерируем имя файла изображения на основе названия товара
-    # Заменяем пробелы и специальные символы на подчёркивания, убираем скобки
-    safe_name = product_data['name'].replace(' ', '_').replace('(', '').replace(')', '').replace('+', '_')
-    image_filename = f"{safe_name}.jpg"
-    image_path = imgs_dir / image_filename
-    
-    # Проверяем, существует ли уже такой товар
-    product = Product.objects.filter(name=product_data['name']).first()
-    
-    if product:
-        # Если товар существует, обновляем изображение из папки imgs
-        if image_path.exists():
-            # Копируем изображение из папки imgs
-            try:
-                with open(image_path, 'rb') as f:
-                    product.image.save(image_filename, File(f), save=True)
-                updated_count += 1
-                print(f'Изображение обновлено для товара "{product.name}"')
-            except Exception as e:
-                print(f'Ошибка при копировании изображения для {product_data["name"]}: {e}')
-        else:
-            print(f'Предупреждение: изображение не найдено для товара "{product_data["name"]}": {image_path}')
-        continue
-    
-    # Создаём новый товар
-    product = Product.objects.create(
-        name=product_data['name'],
-        description=product_data['description'],
-        price=product_data['price'],
-        is_active=True
-    )
-    
-    # Привязываем изображение, если оно существует
-    if image_path.exists():
-        try:
-            with open(image_path, 'rb') as f:
-                product.image.save(image_filename, File(f), save=True)
-        except Exception as e:
-            print(f'Ошибка при сохранении изображения для {product_data["name"]}: {e}')
+    record = dict(product_data)
+    filename = image_filename(product_data['name'])
+    if (imgs_dir / filename).exists():
+        record['image'] = filename
     else:
-        print(f'Предупреждение: изображение не найдено для товара "{product_data["name"]}": {image_path}')
-    
-    created_count += 1
-    print(f'Товар "{product.name}" создан (цена: {product.price} ₽)')
+        print(f'Предупреждение: изображение не найдено для товара "{product_data["name"]}": {imgs_dir / filename}')
+    records.append(record)
 
-print(f'\nСоздано новых товаров: {created_count}')
-print(f'Обновлено изображений: {updated_count}')
-print(f'Всего товаров в базе: {Product.objects.count()}')
-print(f'Изображения товаров сохранены в: {media_products_dir}')
+importer = CatalogImporter(images_dir=imgs_dir, log=print)
+stats = importer.run(enumerate(records))
 
+print(f'\nСохранено товаров: {stats["imported"]}')
+print(f'Скопировано изображений: {stats["images_copied"]}')
+print(f'Всего товаров в базе: {Product.objects.count()}')
+print(f'Изображения товаров сохранены в: {settings.MEDIA_ROOT / "products"}')
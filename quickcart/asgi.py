@@ -5,6 +5,14 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Поток статусов заказов (shop.views.order_events) держит соединение
+открытым, поэтому сайт нужно запускать ASGI-сервером, например:
+
+    uvicorn quickcart.asgi:application --workers 4
+
+При нескольких процессах включите ORDER_EVENTS_BACKEND =
+'shop.events.PostgresBroker', чтобы события доходили до всех процессов.
 """
 
 import os
@@ -41,6 +41,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первыми, чтобы в замеры попадали запросы остальных middleware
+    'shop.metrics.MetricsMiddleware',
+    'shop.profiling.ProfilingMiddleware',
+    'shop.slowlog.SlowQueryMiddleware',
+    # До middleware, которые обращаются к базе: следит за записями запроса
+    'shop.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,7 +60,8 @@ ROOT_URLCONF = 'quickcart.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates с замером времени рендера для shop.profiling
+        'BACKEND': 'shop.profiling.ProfilingTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -87,6 +94,15 @@ DATABASES = {
     }
 }
 
+# Реплики для чтения каталога и истории заказов (shop/routers.py), например:
+# DATABASES['replica'] = {**DATABASES['default'], 'HOST': 'replica', 'TEST': {'MIRROR': 'default'}}
+# DATABASE_REPLICAS = ['replica']
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ['shop.routers.ReplicaRouter']
+REPLICA_STICKY_SECONDS = 5  # сколько после записи посетитель читает из основной базы
+REPLICA_HEALTH_CHECK_INTERVAL = 5  # секунды между проверками реплики
+REPLICA_MAX_LAG_SECONDS = 10  # реплика с большим отставанием исключается (PostgreSQL)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -107,6 +123,31 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Кэш
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# В продакшене с несколькими процессами используйте общий кэш
+# (Redis или Memcached), иначе инвалидация будет действовать только
+# внутри одного процесса.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'quickcart',
+    }
+}
+
+# Сессии
+# Корзина гостя хранится в сессии (shop/cart.py). С движком signed_cookies
+# она живёт целиком в подписанной cookie и не создаёт записей в базе;
+# движок по умолчанию (db) хранит сессию в таблице django_session.
+SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+
+# Кэш страниц каталога для анонимных пользователей (секунды)
+PAGE_CACHE_TIMEOUT = 300
+# Сколько ещё отдавать устаревшую копию, пока один запрос её пересчитывает
+PAGE_CACHE_STALE_TIMEOUT = 60
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -129,6 +170,9 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Ширины уменьшенных копий фотографий товаров (WebP и JPEG), см. shop/images.py
+PRODUCT_IMAGE_WIDTHS = [80, 160, 320, 640, 1024]
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -137,6 +181,13 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Используем кастомную модель пользователя
 AUTH_USER_MODEL = 'shop.User'
 
+# Pub/sub событий заказов для потока SSE (shop/events.py). Для нескольких
+# процессов ASGI-сервера: 'shop.events.PostgresBroker' (LISTEN/NOTIFY)
+ORDER_EVENTS_BACKEND = 'shop.events.InProcessBroker'
+
+# Страница входа для представлений с @login_required
+LOGIN_URL = 'shop:login'
+
 # НАСТРОЙКИ ДЛЯ ОТПРАВКИ EMAIL 
 # Переменная для включения/отключения отправки email. 
 #ENABLE_EMAIL_SENDING = True
@@ -151,3 +202,33 @@ EMAIL_USE_TLS = False # TLS и SSL взаимоисключающие
 EMAIL_HOST_USER = 'kakoyto@mail.ru'  # логин
 EMAIL_HOST_PASSWORD = 'kakoyto'  # пароль
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
+EMAIL_TIMEOUT = 10  # секунды; медленный SMTP не должен подвешивать обработчик очереди
+
+# Очередь писем (shop/mail.py): письма отправляет manage.py send_outbox
+EMAIL_OUTBOX_BATCH_SIZE = 100
+EMAIL_OUTBOX_MAX_ATTEMPTS = 8  # после этого письмо помечается как недоставленное
+EMAIL_OUTBOX_RETRY_DELAY = 60  # секунды; удваивается после каждой ошибки
+EMAIL_OUTBOX_MAX_RETRY_DELAY = 3600
+EMAIL_OUTBOX_LEASE = 300  # секунды; письмо за обработчиком, пока он его отправляет
+
+# Сколько товаров «часто покупают вместе» хранить и показывать на странице
+# товара (shop/recommendations.py); пересчёт — manage.py refresh_recommendations
+RECOMMENDATIONS_PER_PRODUCT = 8
+
+# Профилирование запросов (shop/profiling.py): время, запросы к базе, N+1.
+# Сводка для сотрудников — /profiling/, заголовки Server-Timing — при DEBUG
+REQUEST_PROFILING = DEBUG
+REQUEST_PROFILING_REPEAT_THRESHOLD = 3  # столько одинаковых запросов — признак N+1
+
+# Метрики Prometheus (shop/metrics.py) на /metrics. Токен — для заголовка
+# «Authorization: Bearer ...»; None — эндпоинт открыт (закройте его на балансировщике)
+METRICS_TOKEN = None
+# Каталог для сложения метрик нескольких воркеров gunicorn; None — метрики процесса
+METRICS_MULTIPROCESS_DIR = None
+METRICS_FLUSH_INTERVAL = 5  # секунды между записями значений процесса в файл
+
+# Журнал медленных SQL-запросов (shop/slowlog.py); сводка — manage.py slow_queries
+SLOW_QUERY_LOG = True
+SLOW_QUERY_THRESHOLD_MS = 200
+SLOW_QUERY_SAMPLE_RATE = 1.0  # доля медленных запросов, попадающих в журнал
+SLOW_QUERY_LOG_MAX_ROWS = 10000  # старые записи удаляются
@@ -1,6 +1,75 @@
-from django.contrib import admin
+import datetime
+import re
+
+from django.contrib import admin, messages
+from django.contrib.admin.options import IncorrectLookupParameters
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, Product, Cart, CartItem, Order, OrderItem
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+from . import analytics, exports, services
+from .models import User, Category, Product, Cart, CartItem, Order, OrderItem, OutboxEmail, DailySales, SlowQuery
+from .pagination import EstimatedCountPaginator
+from .search import get_backend
+
+ID_FILTER_RE = re.compile(r'^\s*(\d+)\s*(?:-\s*(\d+)\s*)?$')
+
+
+class IdFilter(admin.SimpleListFilter):
+    """
+    Фильтр по id связанной записи (123) или диапазону id (100-200).
+    Стандартный фильтр по внешнему ключу выводит в боковой панели
+    все связанные записи, что на больших таблицах неприменимо.
+    """
+    template = 'admin/shop/id_filter.html'
+    field_name = None
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if not value:
+            return queryset
+        match = ID_FILTER_RE.match(value)
+        if match is None:
+            raise IncorrectLookupParameters(value)
+        start, end = match.groups()
+        if end is None:
+            return queryset.filter(**{f'{self.field_name}__id': start})
+        return queryset.filter(**{f'{self.field_name}__id__range': (start, end)})
+
+    def choices(self, changelist):
+        yield {
+            'value': self.value() or '',
+            'query_parts': [
+                (name, value) for name, value in changelist.params.items()
+                if name != self.parameter_name
+            ],
+        }
+
+
+def id_filter(field_name, title):
+    """Создаёт IdFilter для внешнего ключа field_name."""
+    return type(f'{field_name.title()}IdFilter', (IdFilter,), {
+        'field_name': field_name,
+        'parameter_name': f'{field_name}_id',
+        'title': title,
+    })
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Базовый класс для списков больших таблиц: оценка числа строк
+    вместо COUNT(*) и без второго COUNT(*) по всей таблице при фильтрации.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(User)
@@ -25,21 +94,30 @@ class UserAdmin(BaseUserAdmin):
     )
 
 
+@admin.register(Category)
+class CategoryAdmin(admin.ModelAdmin):
+    """Категории каталога."""
+    list_display = ['name', 'slug']
+    search_fields = ['name']
+    prepopulated_fields = {'slug': ('name',)}
+
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     """
     Административная панель для управления товарами.
     Позволяет добавлять, редактировать и удалять товары с загрузкой фотографий.
     """
-    list_display = ['name', 'price', 'is_active', 'created_at', 'image_preview']
-    list_filter = ['is_active', 'created_at']
+    list_display = ['name', 'category', 'price', 'is_active', 'created_at', 'image_preview']
+    list_filter = ['is_active', 'category', 'created_at']
+    list_select_related = ['category']
     search_fields = ['name', 'description']
     prepopulated_fields = {'slug': ('name',)}
     readonly_fields = ['created_at', 'image_preview']
     
     fieldsets = (
         ('Основная информация', {
-            'fields': ('name', 'slug', 'description', 'price', 'is_active')
+            'fields': ('name', 'slug', 'category', 'description', 'price', 'is_active')
         }),
         ('Изображение', {
             'fields': ('image', 'image_preview')
@@ -50,6 +128,12 @@ class ProductAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_search_results(self, request, queryset, search_term):
+        """Ищет по полнотекстовому индексу вместо ILIKE по search_fields."""
+        if not search_term:
+            return queryset, False
+        return get_backend().filter(queryset, search_term), False
+
     def image_preview(self, obj):
         """Отображает миниатюру фотографии товара в списке и форме."""
         if obj.image:
@@ -60,52 +144,214 @@ class ProductAdmin(admin.ModelAdmin):
 
 
 @admin.register(Cart)
-class CartAdmin(admin.ModelAdmin):
+class CartAdmin(LargeTableAdmin):
     """Административная панель для просмотра корзин пользователей."""
     list_display = ['user', 'created_at', 'updated_at']
+    list_select_related = ['user']
     search_fields = ['user__email', 'user__username']
     readonly_fields = ['created_at', 'updated_at']
 
 
 @admin.register(CartItem)
-class CartItemAdmin(admin.ModelAdmin):
+class CartItemAdmin(LargeTableAdmin):
     """Административная панель для просмотра позиций в корзинах."""
     list_display = ['cart', 'product', 'quantity', 'price']
-    list_filter = ['cart']
+    list_filter = [id_filter('cart', 'ID корзины')]
+    list_select_related = ['cart__user', 'product']
+    autocomplete_fields = ['cart', 'product']
 
 
 class OrderItemInline(admin.TabularInline):
     """Встроенная форма для отображения позиций заказа."""
     model = OrderItem
-    readonly_fields = ['product', 'quantity', 'price']
+    fields = ['product_name', 'quantity', 'price']
+    readonly_fields = ['product_name', 'quantity', 'price']
     extra = 0
     can_delete = False
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(LargeTableAdmin):
     """Административная панель для управления заказами."""
     list_display = ['id', 'user', 'status', 'total_amount', 'created_at']
-    list_filter = ['status', 'created_at']
+    list_filter = ['status', 'created_at', id_filter('user', 'ID пользователя')]
+    list_select_related = ['user']
     search_fields = ['user__email', 'user__username']
     readonly_fields = ['user', 'total_amount', 'created_at']
     inlines = [OrderItemInline]
     fields = ['user', 'status', 'total_amount', 'created_at']
+    actions = ['move_to_assembly', 'move_to_ready', 'move_to_delivered', 'export_csv', 'export_jsonl']
+    change_list_template = 'admin/shop/order/change_list.html'
     
     def has_add_permission(self, request):
         # Запрещаем создание заказов через админку
         return False
 
+    def get_urls(self):
+        return [
+            path('export/', self.admin_site.admin_view(self.export_view), name='shop_order_export'),
+        ] + super().get_urls()
+
+    def export_view(self, request):
+        """
+        Потоковая выгрузка заказов с позициями.
+        Параметры: format (csv|jsonl), date_from и date_to (ГГГГ-ММ-ДД,
+        включительно), status (можно несколько раз).
+        """
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        fmt = request.GET.get('format', 'csv')
+        statuses = request.GET.getlist('status')
+        if fmt not in exports.FORMATS:
+            return HttpResponseBadRequest('Неизвестный формат выгрузки')
+        if not set(statuses) <= set(dict(Order.STATUS_CHOICES)):
+            return HttpResponseBadRequest('Неизвестный статус заказа')
+        try:
+            dates = [
+                datetime.date.fromisoformat(value) if value else None
+                for value in (request.GET.get('date_from'), request.GET.get('date_to'))
+            ]
+        except ValueError:
+            return HttpResponseBadRequest('Дата должна быть в формате ГГГГ-ММ-ДД')
+        orders = exports.filter_orders(Order.objects.all(), *dates, statuses=statuses)
+        return self._export_response(orders, fmt)
+
+    def _export_response(self, orders, fmt):
+        response = StreamingHttpResponse(
+            exports.stream(exports.export_rows(orders), fmt),
+            content_type=exports.CONTENT_TYPES[fmt],
+        )
+        response['Content-Disposition'] = f'attachment; filename="orders-{timezone.localdate():%Y%m%d}.{fmt}"'
+        return response
+
+    @admin.action(description='Выгрузить выбранные заказы в CSV', permissions=['view'])
+    def export_csv(self, request, queryset):
+        return self._export_response(queryset, 'csv')
+
+    @admin.action(description='Выгрузить выбранные заказы в JSONL', permissions=['view'])
+    def export_jsonl(self, request, queryset):
+        return self._export_response(queryset, 'jsonl')
+
+    def _transition(self, request, queryset, status):
+        """Переводит выбранные заказы одним UPDATE и сообщает, сколько перешло."""
+        selected = queryset.count()
+        moved = services.transition_orders(queryset, status)
+        status_display = dict(Order.STATUS_CHOICES)[status]
+        self.message_user(request, f'Переведено в статус «{status_display}»: {moved} из {selected}.')
+        if moved < selected:
+            allowed = ', '.join(
+                f'«{dict(Order.STATUS_CHOICES)[source]}»' for source in Order.STATUS_TRANSITIONS[status]
+            )
+            self.message_user(
+                request,
+                f'Пропущено заказов: {selected - moved} — перевод возможен только из статуса {allowed}.',
+                level=messages.WARNING,
+            )
+
+    @admin.action(description='Перевести в сборку', permissions=['change'])
+    def move_to_assembly(self, request, queryset):
+        self._transition(request, queryset, Order.STATUS_IN_ASSEMBLY)
+
+    @admin.action(description='Отметить готовыми к выдаче', permissions=['change'])
+    def move_to_ready(self, request, queryset):
+        self._transition(request, queryset, Order.STATUS_READY)
+
+    @admin.action(description='Отметить выданными', permissions=['change'])
+    def move_to_delivered(self, request, queryset):
+        self._transition(request, queryset, Order.STATUS_DELIVERED)
+
 
 @admin.register(OrderItem)
-class OrderItemAdmin(admin.ModelAdmin):
+class OrderItemAdmin(LargeTableAdmin):
     """Административная панель для просмотра позиций в заказах."""
-    list_display = ['order', 'product', 'quantity', 'price']
-    list_filter = ['order']
-    readonly_fields = ['order', 'product', 'quantity', 'price']
+    list_display = ['order', 'product_name', 'quantity', 'price']
+    list_filter = [id_filter('order', 'ID заказа')]
+    list_select_related = ['order__user']
+    readonly_fields = ['order', 'product', 'product_name', 'product_slug', 'quantity', 'price']
     
     def has_add_permission(self, request):
         return False
     
     def has_change_permission(self, request, obj=None):
         return False
+
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(LargeTableAdmin):
+    """Административная панель очереди писем."""
+    list_display = ['id', 'recipient', 'subject', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['status']
+    search_fields = ['recipient']
+    readonly_fields = ['recipient', 'subject', 'body', 'status', 'attempts',
+                       'next_attempt_at', 'last_error', 'created_at', 'sent_at']
+    actions = ['retry_sending']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='Повторить отправку')
+    def retry_sending(self, request, queryset):
+        """Возвращает недоставленные письма в очередь."""
+        count = queryset.exclude(status=OutboxEmail.STATUS_SENT).update(
+            status=OutboxEmail.STATUS_PENDING,
+            attempts=0,
+            next_attempt_at=timezone.now(),
+        )
+        self.message_user(request, f'Возвращено в очередь писем: {count}')
+
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(LargeTableAdmin):
+    """Журнал медленных SQL-запросов (только просмотр); сводка — manage.py slow_queries."""
+    list_display = ['id', 'duration_ms', 'view', 'short_sql', 'created_at']
+    list_filter = ['view']
+    search_fields = ['fingerprint']
+    readonly_fields = ['fingerprint', 'sql', 'view', 'stack', 'stack_fingerprint',
+                       'duration_ms', 'plan', 'created_at']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description='SQL')
+    def short_sql(self, obj):
+        return obj.sql[:120]
+
+
+@admin.register(DailySales)
+class SalesDashboardAdmin(admin.ModelAdmin):
+    """
+    Панель аналитики продаж: выручка по дням, лучшие товары и заказы
+    по статусам. Читает только таблицы сводок, поэтому время ответа
+    не зависит от числа заказов.
+    """
+    PERIODS = [7, 30, 90, 365]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            days = int(request.GET.get('days', 30))
+        except ValueError:
+            days = 30
+        if days not in self.PERIODS:
+            days = 30
+        context = {
+            **self.admin_site.each_context(request),
+            **analytics.dashboard(days=days),
+            'opts': self.model._meta,
+            'periods': self.PERIODS,
+            'title': 'Аналитика продаж',
+        }
+        return TemplateResponse(request, 'admin/shop/sales_dashboard.html', context)
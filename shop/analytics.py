@@ -0,0 +1,152 @@
+"""
+Сводки продаж (rollups) для панели аналитики в админке.
+
+Вместо агрегирования OrderItem по всей таблице при каждом просмотре
+панель читает небольшие таблицы сводок:
+
+* DailySales — заказы, товары и выручка за день;
+* ProductDailySales — продажи каждого товара за день;
+* OrderStatusCount — число заказов в каждом статусе.
+
+Сводки обновляются в транзакции оформления заказа и смены статуса
+одним INSERT ... ON CONFLICT DO UPDATE на таблицу. Для заполнения по уже
+существующим заказам и исправления расхождений есть команда
+rebuild_sales_rollups.
+"""
+import datetime
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .db import increment
+from .models import DailySales, Order, OrderItem, OrderStatusCount, Product, ProductDailySales
+
+REBUILD_BATCH_SIZE = 2000
+
+
+def record_order(order, lines):
+    """
+    Учитывает новый заказ в сводках по дням и товарам.
+    lines — кортежи (product_id, название, количество, цена).
+    """
+    day = timezone.localdate(order.created_at)
+    increment(DailySales, ['date'], {(day,): {
+        'order_count': 1,
+        'item_count': sum(quantity for _, _, quantity, _ in lines),
+        'revenue': order.total_amount,
+    }})
+    products = {}
+    for product_id, name, quantity, price in lines:
+        row = products.setdefault((day, product_id), {
+            'product_name': name, 'quantity': 0, 'order_count': 1, 'revenue': 0,
+        })
+        row['quantity'] += quantity
+        row['revenue'] += price * quantity
+    increment(ProductDailySales, ['date', 'product'], products, replace=['product_name'])
+
+
+def record_status_change(old_status, new_status, count=1):
+    """
+    Переносит count заказов между счётчиками статусов.
+    old_status=None — заказы только что созданы.
+    """
+    if not count or old_status == new_status:
+        return
+    rows = {(new_status,): {'order_count': count}}
+    if old_status is not None:
+        rows[(old_status,)] = {'order_count': -count}
+    increment(OrderStatusCount, ['status'], rows)
+
+
+def _bulk_create(model, objects):
+    batch = []
+    for obj in objects:
+        batch.append(obj)
+        if len(batch) >= REBUILD_BATCH_SIZE:
+            model.objects.bulk_create(batch)
+            batch = []
+    model.objects.bulk_create(batch)
+
+
+def rebuild(since=None):
+    """
+    Пересчитывает сводки по заказам. since — дата, начиная с которой
+    пересчитываются сводки по дням; счётчики статусов пересчитываются целиком.
+    Возвращает число дней в пересчитанных сводках.
+
+    У позиций удалённого товара ссылка на товар обнулена, и по ним сводку
+    товара не восстановить. Поэтому сводки удалённых товаров не пересчитываются,
+    а остаются такими, какими их вёл record_order. Итоги пересчёта совпадают
+    с итогами, накопленными при оформлении заказов.
+    """
+    orders = Order.objects.all()
+    lines = OrderItem.objects.filter(product__isnull=False)
+    daily = DailySales.objects.all()
+    product_daily = ProductDailySales.objects.filter(product_id__in=Product.objects.values('id'))
+    if since is not None:
+        orders = orders.filter(created_at__date__gte=since)
+        lines = lines.filter(order__created_at__date__gte=since)
+        daily = daily.filter(date__gte=since)
+        product_daily = product_daily.filter(date__gte=since)
+
+    with transaction.atomic():
+        daily.delete()
+        product_daily.delete()
+        OrderStatusCount.objects.all().delete()
+
+        days = list(
+            orders.annotate(day=TruncDate('created_at')).values('day')
+            .annotate(orders=Count('id'), units=Sum('item_count'), revenue=Sum('total_amount'))
+            .order_by()
+        )
+        _bulk_create(DailySales, (
+            DailySales(date=row['day'], order_count=row['orders'],
+                       item_count=row['units'] or 0, revenue=row['revenue'] or 0)
+            for row in days
+        ))
+        products = (
+            lines.annotate(day=TruncDate('order__created_at')).values('day', 'product_id')
+            .annotate(
+                name=Max('product_name'),
+                quantity_sum=Sum('quantity'),
+                orders=Count('order_id', distinct=True),
+                revenue=Sum(F('price') * F('quantity')),
+            )
+            .order_by()
+        )
+        _bulk_create(ProductDailySales, (
+            ProductDailySales(date=row['day'], product_id=row['product_id'], product_name=row['name'],
+                              quantity=row['quantity_sum'], order_count=row['orders'], revenue=row['revenue'])
+            for row in products.iterator(chunk_size=REBUILD_BATCH_SIZE)
+        ))
+        OrderStatusCount.objects.bulk_create([
+            OrderStatusCount(status=row['status'], order_count=row['count'])
+            for row in Order.objects.values('status').annotate(count=Count('id')).order_by()
+        ])
+    return len(days)
+
+
+def dashboard(days=30, top=10):
+    """Данные панели аналитики — только из таблиц сводок."""
+    since = timezone.localdate() - datetime.timedelta(days=days - 1)
+    revenue = list(DailySales.objects.filter(date__gte=since).order_by('date'))
+    top_products = list(
+        ProductDailySales.objects.filter(date__gte=since)
+        .values('product_id')
+        .annotate(name=Max('product_name'), sold=Sum('quantity'), total=Sum('revenue'))
+        .order_by('-total')[:top]
+    )
+    counts = defaultdict(int, OrderStatusCount.objects.values_list('status', 'order_count'))
+    statuses = [(label, counts[code]) for code, label in Order.STATUS_CHOICES]
+    return {
+        'days': days,
+        'revenue_by_day': revenue,
+        'max_revenue': max((row.revenue for row in revenue), default=0),
+        'total_revenue': sum(row.revenue for row in revenue),
+        'total_orders': sum(row.order_count for row in revenue),
+        'top_products': top_products,
+        'statuses': statuses,
+    }
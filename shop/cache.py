@@ -0,0 +1,162 @@
+"""
+Кэш готовых страниц каталога для анонимных посетителей.
+
+Страницы хранятся целиком вместе со «мягким» сроком жизни. Когда он истекает,
+пересчитывает страницу только один запрос (захвативший блокировку), остальные
+в это время получают устаревшую копию — так горячий ключ не вызывает лавину
+одинаковых запросов к базе.
+
+Персональные фрагменты (flash-сообщения, CSRF-токен) никогда не попадают
+в кэш: при рендере для кэша вместо них выводятся маркеры, которые при отдаче
+подменяются фрагментами, отрисованными для текущего запроса.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+
+from . import metrics
+
+MESSAGES_PLACEHOLDER = '<!--quickcart:messages-->'
+CSRF_PLACEHOLDER = '<!--quickcart:csrf-->'
+
+# Маркер -> шаблон фрагмента, который рендерится заново на каждый запрос
+PLACEHOLDERS = {
+    MESSAGES_PLACEHOLDER: 'shop/includes/messages.html',
+    CSRF_PLACEHOLDER: 'shop/includes/csrf_token.html',
+}
+
+CATALOG_GENERATION_KEY = 'shop:page:catalog-generation'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def catalog_generation():
+    """Текущее поколение каталога; меняется при любом изменении товаров."""
+    generation = cache.get(CATALOG_GENERATION_KEY)
+    if generation is None:
+        cache.add(CATALOG_GENERATION_KEY, 1, None)
+        generation = cache.get(CATALOG_GENERATION_KEY, 1)
+    return generation
+
+
+def product_list_key(request):
+    """
+    Ключ страницы каталога: поколение каталога + проверенные параметры
+    страницы (catalog.canonical_params) в постоянном порядке.
+    """
+    from .catalog import canonical_params  # catalog импортирует этот модуль
+    query = '&'.join(sorted(canonical_params(request.GET).urlencode().split('&')))
+    digest = hashlib.md5(query.encode()).hexdigest()
+    return f'shop:page:list:{catalog_generation()}:{digest}'
+
+
+def product_detail_key(request, slug):
+    """
+    Ключ страницы товара: поколение каталога + slug. Страница показывает
+    карточки рекомендованных товаров, поэтому устаревает при изменении
+    любого товара, а не только своего.
+    """
+    digest = hashlib.md5(slug.encode()).hexdigest()
+    return f'shop:page:product:{catalog_generation()}:{digest}'
+
+
+def invalidate_catalog():
+    """Сбрасывает все страницы каталога и товаров сменой поколения."""
+    try:
+        cache.incr(CATALOG_GENERATION_KEY)
+    except ValueError:
+        cache.set(CATALOG_GENERATION_KEY, 2, None)
+
+
+def invalidate_products(slugs):
+    """Сбрасывает страницы нескольких товаров одним обращением к кэшу."""
+    cache.delete_many([product_detail_key(None, slug) for slug in slugs if slug])
+
+
+def _fill_placeholders(request, content):
+    """Подставляет фрагменты текущего запроса вместо маркеров."""
+    for placeholder, template_name in PLACEHOLDERS.items():
+        marker = placeholder.encode()
+        if marker in content:
+            rendered = render_to_string(template_name, request=request)
+            content = content.replace(marker, rendered.encode())
+    return content
+
+
+def _serve(request, entry, state):
+    metrics.CACHE_REQUESTS.inc(cache='page', result=state.lower())
+    response = HttpResponse(
+        _fill_placeholders(request, entry['content']),
+        content_type=entry['content_type'],
+    )
+    response['X-Page-Cache'] = state
+    return response
+
+
+def _render_and_store(view, key, request, args, kwargs):
+    request.page_cache_placeholder = True
+    try:
+        response = view(request, *args, **kwargs)
+        if response.status_code != 200 or response.streaming or response.cookies:
+            # Ответ не подходит для кэша (404, редирект и т. п.): отдаём как есть
+            if not response.streaming:
+                response.content = _fill_placeholders(request, response.content)
+            return response
+        timeout = _setting('PAGE_CACHE_TIMEOUT', 300)
+        stale_timeout = _setting('PAGE_CACHE_STALE_TIMEOUT', 60)
+        entry = {
+            'content': response.content,
+            'content_type': response['Content-Type'],
+            'expires': time.time() + timeout,
+        }
+        cache.set(key, entry, timeout + stale_timeout)
+    finally:
+        # Даже если представление упало, остальные запросы не должны ждать
+        cache.delete(f'{key}:lock')
+    return _serve(request, entry, 'MISS')
+
+
+def cache_anonymous_page(key_func):
+    """
+    Декоратор представления: кэширует GET-ответы для анонимных пользователей.
+    key_func(request, *args, **kwargs) возвращает ключ кэша страницы.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+
+            key = key_func(request, *args, **kwargs)
+            lock_key = f'{key}:lock'
+            lock_timeout = _setting('PAGE_CACHE_LOCK_TIMEOUT', 10)
+            entry = cache.get(key)
+
+            if entry is not None:
+                if entry['expires'] > time.time():
+                    return _serve(request, entry, 'HIT')
+                # Мягкий срок истёк: пересчитывает только один запрос
+                if cache.add(lock_key, 1, lock_timeout):
+                    return _render_and_store(view, key, request, args, kwargs)
+                return _serve(request, entry, 'STALE')
+
+            if cache.add(lock_key, 1, lock_timeout):
+                return _render_and_store(view, key, request, args, kwargs)
+
+            # Страницу уже кто-то считает: недолго ждём готовый результат
+            deadline = time.time() + _setting('PAGE_CACHE_WAIT', 2)
+            while time.time() < deadline:
+                time.sleep(0.05)
+                entry = cache.get(key)
+                if entry is not None:
+                    return _serve(request, entry, 'HIT')
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,166 @@
+"""
+Хранилища корзины.
+
+SessionCart держит корзину гостя в сессии и не пишет в таблицы корзин;
+DatabaseCart работает с моделями Cart/CartItem для вошедших пользователей.
+Представления получают нужное хранилище через get_cart(request) и не зависят
+от того, где лежит корзина. При входе гостевая корзина переносится в базу
+одним запросом (merge_session_cart).
+"""
+from decimal import Decimal
+
+from django.http import Http404
+
+from . import metrics, services
+from .models import CartItem, Product
+
+SESSION_KEY = 'cart'
+
+
+class CartLine:
+    """Позиция корзины гостя с тем же интерфейсом, что и CartItem в шаблонах."""
+
+    def __init__(self, product, quantity, price):
+        self.id = product.id
+        self.product = product
+        self.quantity = quantity
+        self.price = price
+
+    def get_subtotal(self):
+        """Рассчитывает промежуточную сумму по позиции."""
+        return self.price * self.quantity
+
+
+class SessionCart:
+    """
+    Корзина в сессии: {product_id: [quantity, price]}.
+    Идентификатор позиции — id товара.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.data = session.get(SESSION_KEY, {})
+
+    def _save(self):
+        self.session[SESSION_KEY] = self.data
+        self.session.modified = True
+
+    def add(self, product, quantity=1):
+        key = str(product.id)
+        if key in self.data:
+            self.data[key][0] += quantity
+        else:
+            self.data[key] = [quantity, str(product.price)]
+        self._save()
+        return self.data[key][0], self.data[key][0] == quantity
+
+    def set_quantity(self, item_id, quantity):
+        key = str(item_id)
+        if key not in self.data:
+            raise Http404('Позиция корзины не найдена')
+        if quantity > 0:
+            self.data[key][0] = quantity
+        else:
+            del self.data[key]
+        self._save()
+
+    def remove(self, item_id):
+        key = str(item_id)
+        if key not in self.data:
+            raise Http404('Позиция корзины не найдена')
+        del self.data[key]
+        self._save()
+        return Product.objects.filter(id=item_id).values_list('name', flat=True).first()
+
+    def items(self):
+        products = Product.objects.in_bulk([int(key) for key in self.data])
+        return [
+            CartLine(products[int(key)], quantity, Decimal(price))
+            for key, (quantity, price) in self.data.items()
+            if int(key) in products
+        ]
+
+    def get_total(self):
+        return sum((line.get_subtotal() for line in self.items()), Decimal('0.00'))
+
+    def is_empty(self):
+        return not self.data
+
+    def clear(self):
+        self.data = {}
+        self.session.pop(SESSION_KEY, None)
+
+
+class DatabaseCart:
+    """
+    Корзина пользователя в таблицах Cart/CartItem.
+    Чтение не создаёт строку Cart: она появляется при первом добавлении.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    def _lines(self):
+        return CartItem.objects.filter(cart__user=self.user)
+
+    def _line(self, item_id):
+        try:
+            return self._lines().with_products().get(id=item_id)
+        except CartItem.DoesNotExist:
+            raise Http404('Позиция корзины не найдена')
+
+    def add(self, product, quantity=1):
+        return services.add_to_cart(self.user, product, quantity)
+
+    def set_quantity(self, item_id, quantity):
+        if quantity > 0:
+            updated = self._lines().filter(id=item_id).update(quantity=quantity)
+        else:
+            updated, _ = self._lines().filter(id=item_id).delete()
+        if not updated:
+            raise Http404('Позиция корзины не найдена')
+
+    def remove(self, item_id):
+        line = self._line(item_id)
+        line.delete()
+        return line.product.name
+
+    def items(self):
+        return self._lines().with_products()
+
+    def get_total(self):
+        return self._lines().total()
+
+    def is_empty(self):
+        return not self._lines().exists()
+
+    def clear(self):
+        self._lines().delete()
+
+
+def get_cart(request):
+    """Возвращает хранилище корзины для текущего посетителя."""
+    if request.user.is_authenticated:
+        return DatabaseCart(request.user)
+    return SessionCart(request.session)
+
+
+def merge_session_cart(request, user):
+    """
+    Переносит гостевую корзину из сессии в корзину пользователя в базе.
+    Количества одинаковых товаров складываются; неактивные товары пропускаются.
+    """
+    session_cart = SessionCart(request.session)
+    if session_cart.is_empty():
+        return
+    active = set(
+        Product.objects.filter(id__in=[int(key) for key in session_cart.data], is_active=True)
+        .values_list('id', flat=True)
+    )
+    services.add_lines_to_cart(user, [
+        (int(key), quantity, Decimal(price))
+        for key, (quantity, price) in session_cart.data.items()
+        if int(key) in active
+    ])
+    session_cart.clear()
+    metrics.CART_MUTATIONS.inc(action='merge')
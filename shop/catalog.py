@@ -0,0 +1,208 @@
+"""
+Фильтры, сортировка и фасеты каталога.
+
+Параметры страницы каталога:
+
+* category — slug категории;
+* price_min, price_max — границы цены в рублях включительно (ввод покупателя);
+* price_range — номер диапазона из PRICE_RANGES (ссылки фасета): нижняя
+  граница включительно, верхняя — нет, поэтому цена на границе попадает
+  ровно в один диапазон;
+* sort — new (сначала новые), price_asc, price_desc.
+
+Каждое сочетание фильтров и сортировки обслуживается индексом товаров
+(is_active, price, id), (is_active, created_at, id) или теми же индексами
+с ведущей колонкой category — см. Product.Meta.indexes. Страницы
+выбираются курсором по ключу сортировки, без OFFSET.
+
+Счётчики фасетов (товаров в каждой категории и ценовом диапазоне)
+кэшируются вместе с поколением каталога, поэтому сбрасываются при любом
+изменении товаров или категорий.
+
+Ключ кэша страницы каталога и ссылки на ней строятся по canonical_params:
+посторонние параметры и неверные значения отбрасываются, поэтому
+произвольная строка запроса не создаёт новую запись в кэше.
+"""
+import hashlib
+from decimal import Decimal, InvalidOperation
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.http import QueryDict
+
+from . import metrics
+from .cache import catalog_generation
+from .models import Category, Product
+from .pagination import InvalidCursor, decode_cursor
+
+# Сортировка -> (ключ курсора, по убыванию)
+SORTS = {
+    'new': ('created_at', True),
+    'price_asc': ('price', False),
+    'price_desc': ('price', True),
+}
+SORT_LABELS = {
+    'new': 'Сначала новые',
+    'price_asc': 'Сначала дешёвые',
+    'price_desc': 'Сначала дорогие',
+}
+DEFAULT_SORT = 'new'
+
+# Ценовые диапазоны фасета: [от, до) в рублях, None — без границы
+PRICE_RANGES = [
+    (None, 1000),
+    (1000, 5000),
+    (5000, 10000),
+    (10000, 30000),
+    (30000, 100000),
+    (100000, None),
+]
+
+FACETS_TIMEOUT = 60 * 60
+
+
+def _price(value):
+    try:
+        price = Decimal(value)
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+    return price if price.is_finite() and price >= 0 else None
+
+
+def _price_range(value):
+    try:
+        index = int(value)
+    except (TypeError, ValueError):
+        return None
+    return index if 0 <= index < len(PRICE_RANGES) else None
+
+
+def parse_filters(params):
+    """Фильтры из параметров запроса; неверные значения отбрасываются."""
+    sort = params.get('sort')
+    return {
+        'category': params.get('category') or None,
+        'price_min': _price(params.get('price_min')),
+        'price_max': _price(params.get('price_max')),
+        'price_range': _price_range(params.get('price_range')),
+        'sort': sort if sort in SORTS else DEFAULT_SORT,
+    }
+
+
+def category_slugs():
+    """Slug всех категорий, из кэша до изменения каталога."""
+    cache_key = f'shop:categories:{catalog_generation()}'
+    slugs = cache.get(cache_key)
+    if slugs is None:
+        slugs = set(Category.objects.values_list('slug', flat=True))
+        cache.set(cache_key, slugs, FACETS_TIMEOUT)
+    return slugs
+
+
+def _cursor(token, sort):
+    key, _ = SORTS[sort]
+    try:
+        decode_cursor(token, key, Product._meta.get_field(key).to_python)
+    except InvalidCursor:
+        return None
+    return token
+
+
+def _page(value):
+    # Paginator.get_page открывает первую страницу вместо нечислового номера
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 1
+
+
+def canonical_params(params):
+    """
+    Параметры страницы каталога в исходном порядке, без посторонних
+    и неверных значений: неизвестной категории, неверного курсора,
+    сортировки по умолчанию.
+    """
+    filters = parse_filters(params)
+    category = filters['category']
+    values = {
+        'category': category if category and category in category_slugs() else None,
+        'price_min': filters['price_min'],
+        'price_max': filters['price_max'],
+        'price_range': filters['price_range'],
+        'sort': filters['sort'] if filters['sort'] != DEFAULT_SORT else None,
+    }
+    if params.get('cursor'):
+        values['cursor'] = _cursor(params['cursor'], filters['sort'])
+    if 'page' in params:
+        values['page'] = _page(params['page'])
+    canonical = QueryDict(mutable=True)
+    for name in params:
+        if values.get(name) is not None:
+            canonical[name] = str(values[name])
+    canonical._mutable = False
+    return canonical
+
+
+def filter_products(filters, queryset=None):
+    """Активные товары, отобранные по filters (без сортировки)."""
+    if queryset is None:
+        queryset = Product.objects.all()
+    queryset = queryset.filter(is_active=True)
+    if filters['category']:
+        queryset = queryset.filter(category__slug=filters['category'])
+    if filters['price_min'] is not None:
+        queryset = queryset.filter(price__gte=filters['price_min'])
+    if filters['price_max'] is not None:
+        queryset = queryset.filter(price__lte=filters['price_max'])
+    if filters.get('price_range') is not None:
+        queryset = queryset.filter(_range_q(*PRICE_RANGES[filters['price_range']]))
+    return queryset
+
+
+def _range_q(low, high):
+    # Верхняя граница не включается: соседние диапазоны не пересекаются
+    q = Q()
+    if low is not None:
+        q &= Q(price__gte=low)
+    if high is not None:
+        q &= Q(price__lt=high)
+    return q
+
+
+def _count_facets(filters):
+    # Счётчики каждого фасета считаются с остальными фильтрами, но без его
+    # собственного: так видно, сколько товаров даст выбор другого значения
+    by_category = dict(
+        filter_products({**filters, 'category': None})
+        .values_list('category_id')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    categories = [
+        {'slug': slug, 'name': name, 'count': by_category.get(pk, 0)}
+        for pk, slug, name in Category.objects.values_list('id', 'slug', 'name')
+    ]
+    by_price = filter_products({**filters, 'price_min': None, 'price_max': None, 'price_range': None}).aggregate(**{
+        f'range_{index}': Count('id', filter=_range_q(low, high))
+        for index, (low, high) in enumerate(PRICE_RANGES)
+    })
+    prices = [
+        {'min': low, 'max': high, 'count': by_price[f'range_{index}']}
+        for index, (low, high) in enumerate(PRICE_RANGES)
+    ]
+    return {'categories': categories, 'prices': prices}
+
+
+def facet_counts(filters):
+    """Счётчики фасетов для текущих фильтров, из кэша до изменения каталога."""
+    key = '|'.join(f'{name}={filters.get(name)}' for name in ('category', 'price_min', 'price_max', 'price_range'))
+    digest = hashlib.md5(key.encode()).hexdigest()
+    cache_key = f'shop:facets:{catalog_generation()}:{digest}'
+    facets = cache.get(cache_key)
+    if facets is None:
+        metrics.CACHE_REQUESTS.inc(cache='facets', result='miss')
+        facets = _count_facets(filters)
+        cache.set(cache_key, facets, FACETS_TIMEOUT)
+    else:
+        metrics.CACHE_REQUESTS.inc(cache='facets', result='hit')
+    return facets
@@ -0,0 +1,219 @@
+"""
+Потоковый импорт каталога из CSV или JSONL.
+
+Записи читаются по одной, товары сохраняются пачками одним
+INSERT ... ON CONFLICT (slug) DO UPDATE, фотографии копируются в MEDIA_ROOT
+пулом потоков. Имя скопированной фотографии содержит хэш её содержимого:
+products/phone_<sha256[:12]>.jpg, поэтому одноимённые файлы из разных
+каталогов не затирают друг друга, а изменённый файл копируется заново. Повторный импорт того же файла ничего не меняет, поэтому его
+можно запускать по расписанию.
+
+Поля записи: name, description, price, slug (необязательно — строится из name),
+image (путь к файлу относительно images_dir, необязательно),
+is_active (необязательно, по умолчанию true).
+"""
+import csv
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+
+from django.core.files import File
+from django.db import transaction
+from django.utils.text import slugify
+
+from . import cache, search
+from .models import Product
+
+UPDATE_FIELDS = ['name', 'description', 'excerpt', 'price', 'image', 'is_active']
+
+TRUE_VALUES = {'1', 'true', 'yes', 'да'}
+
+_price_field = Product._meta.get_field('price')
+# Цена должна поместиться в DecimalField(max_digits, decimal_places)
+MAX_PRICE = Decimal(10) ** (_price_field.max_digits - _price_field.decimal_places)
+
+
+class CatalogImportError(ValueError):
+    """Запись каталога не прошла проверку."""
+
+
+def read_records(path, fmt=None):
+    """
+    Построчно читает файл каталога, выдаёт пары (номер записи, dict).
+    Вместо строки JSONL, которая не разбирается в объект, выдаётся
+    CatalogImportError — она учитывается как ошибка записи.
+    Формат определяется по расширению, если не указан явно.
+    """
+    fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower()
+    with open(path, encoding='utf-8', newline='') as source:
+        if fmt == 'csv':
+            yield from enumerate(csv.DictReader(source))
+        elif fmt in ('jsonl', 'ndjson'):
+            number = 0
+            for line_number, line in enumerate(source, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as exc:
+                    record = CatalogImportError(f'строка {line_number}: некорректный JSON: {exc.msg}')
+                else:
+                    if not isinstance(record, dict):
+                        record = CatalogImportError(f'строка {line_number}: ожидался объект JSON')
+                yield number, record
+                number += 1
+        else:
+            raise CatalogImportError(f'Неизвестный формат файла каталога: {fmt}')
+
+
+class CatalogImporter:
+    """Импорт записей каталога пачками с upsert по slug."""
+
+    def __init__(self, images_dir=None, batch_size=1000, workers=8, dry_run=False, log=None):
+        self.images_dir = images_dir
+        self.batch_size = batch_size
+        self.workers = workers
+        self.dry_run = dry_run
+        self.log = log or (lambda message: None)
+        self.storage = Product._meta.get_field('image').storage
+        self.stats = {'records': 0, 'imported': 0, 'errors': 0, 'images_copied': 0}
+
+    def clean(self, record):
+        """Проверяет запись и возвращает несохранённый Product и путь к фото."""
+        if isinstance(record, CatalogImportError):
+            raise record
+        name = (record.get('name') or '').strip()
+        if not name:
+            raise CatalogImportError('не указано название')
+        slug = (record.get('slug') or '').strip() or slugify(name)
+        if not slug:
+            raise CatalogImportError(f'не удалось построить slug из названия «{name}»')
+        try:
+            price = Decimal(str(record.get('price'))).quantize(Decimal('0.01'))
+        except (InvalidOperation, ValueError):
+            raise CatalogImportError(f'некорректная цена: {record.get("price")!r}')
+        if not price.is_finite():
+            raise CatalogImportError(f'некорректная цена: {record.get("price")!r}')
+        if price < 0:
+            raise CatalogImportError(f'отрицательная цена: {price}')
+        if price >= MAX_PRICE:
+            raise CatalogImportError(f'слишком большая цена: {price}')
+
+        is_active = record.get('is_active', True)
+        if isinstance(is_active, str):
+            is_active = is_active.strip().lower() in TRUE_VALUES
+
+        source = None
+        if record.get('image'):
+            source = record['image']
+            if self.images_dir and not os.path.isabs(source):
+                source = os.path.join(self.images_dir, source)
+            if not os.path.exists(source):
+                raise CatalogImportError(f'фотография не найдена: {source}')
+
+        description = record.get('description') or ''
+        product = Product(
+            name=name,
+            slug=slug,
+            description=description,
+            # bulk_create не вызывает save(), поэтому краткое описание считаем здесь
+            excerpt=Product.make_excerpt(description),
+            price=price,
+            # Имя фотографии зависит от содержимого и назначается при сохранении пачки
+            image='',
+            is_active=bool(is_active),
+        )
+        return product, source
+
+    def _copy_image(self, source):
+        """
+        Копирует фотографию под именем с хэшем содержимого, если такой ещё нет.
+        Возвращает пару (имя в хранилище, скопирована ли).
+        """
+        digest = hashlib.sha256()
+        with open(source, 'rb') as image:
+            for chunk in iter(lambda: image.read(1 << 16), b''):
+                digest.update(chunk)
+        stem, extension = os.path.splitext(os.path.basename(source))
+        name = f'products/{stem}_{digest.hexdigest()[:12]}{extension.lower()}'
+        if self.storage.exists(name):
+            return name, False
+        with open(source, 'rb') as image:
+            return self.storage.save(name, File(image)), True
+
+    def _flush(self, batch, pool):
+        """Сохраняет пачку: копирует фото и выполняет один upsert."""
+        # Одинаковые slug внутри пачки: побеждает последняя запись
+        products = {product.slug: (product, source) for product, source in batch}
+        sources = {source for _, source in products.values() if source}
+        copied = 0
+        if not self.dry_run:
+            stored = dict(zip(sources, pool.map(self._copy_image, sources)))
+            copied = sum(was_copied for _, was_copied in stored.values())
+            for product, source in products.values():
+                if source:
+                    product.image = stored[source][0]
+            with transaction.atomic():
+                old_images = dict(Product.objects.filter(slug__in=products).values_list('slug', 'image'))
+                Product.objects.bulk_create(
+                    [product for product, _ in products.values()],
+                    update_conflicts=True,
+                    unique_fields=['slug'],
+                    update_fields=UPDATE_FIELDS,
+                )
+                replaced = [
+                    slug for slug, (product, _) in products.items()
+                    if slug in old_images and old_images[slug] != product.image.name
+                ]
+                if replaced:
+                    # Фото заменилось — старые уменьшенные копии больше не годятся
+                    Product.objects.filter(slug__in=replaced).update(image_variants=[])
+            cache.invalidate_products(products)
+        self.stats['imported'] += len(products)
+        self.stats['images_copied'] += copied
+
+    def run(self, records, offset=0):
+        """
+        Импортирует записи, пропуская первые offset.
+        records — итерируемое пар (номер записи, dict).
+        """
+        started = time.perf_counter()
+        batch = []
+        last_number = offset - 1
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for number, record in records:
+                if number < offset:
+                    continue
+                self.stats['records'] += 1
+                last_number = number
+                try:
+                    batch.append(self.clean(record))
+                except CatalogImportError as exc:
+                    self.stats['errors'] += 1
+                    self.log(f'Запись {number}: {exc}')
+                    continue
+                if len(batch) >= self.batch_size:
+                    self._flush(batch, pool)
+                    batch = []
+                    self._report(started, last_number)
+            if batch:
+                self._flush(batch, pool)
+        if not self.dry_run and self.stats['imported']:
+            cache.invalidate_catalog()
+            search.invalidate_index()
+        self._report(started, last_number)
+        return self.stats
+
+    def _report(self, started, last_number):
+        elapsed = time.perf_counter() - started
+        rate = self.stats['records'] / elapsed if elapsed else 0
+        self.log(
+            f'Обработано записей: {self.stats["records"]} '
+            f'(продолжить можно с --offset {last_number + 1}), '
+            f'сохранено: {self.stats["imported"]}, ошибок: {self.stats["errors"]}, '
+            f'скопировано фото: {self.stats["images_copied"]}, '
+            f'{rate:.0f} записей/с'
+        )
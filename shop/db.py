@@ -0,0 +1,46 @@
+"""
+Вспомогательные SQL-запросы, которых нет в ORM.
+"""
+from django.db import connection
+
+
+def increment(model, keys, rows, replace=()):
+    """
+    Прибавляет значения к счётчикам одним INSERT ... ON CONFLICT DO UPDATE
+    (PostgreSQL и SQLite); отсутствующие строки создаются.
+
+    keys — поля уникального ограничения; rows — {кортеж значений полей keys:
+    {поле: значение}}; поля из replace перезаписываются, остальные
+    прибавляются к текущим значениям. Строки обновляются в порядке ключей,
+    чтобы параллельные транзакции не блокировали друг друга крест-накрест.
+    Если параметров больше, чем допускает база, запрос делится на пачки.
+    """
+    if not rows:
+        return
+    meta = model._meta
+    qn = connection.ops.quote_name
+    table = qn(meta.db_table)
+    values_fields = list(next(iter(rows.values())))
+    fields = [meta.get_field(name) for name in (*keys, *values_fields)]
+    columns = ', '.join(qn(field.column) for field in fields)
+    conflict = ', '.join(qn(field.column) for field in fields[:len(keys)])
+    updates = ', '.join(
+        f'{qn(field.column)} = EXCLUDED.{qn(field.column)}' if field.name in replace
+        else f'{qn(field.column)} = {table}.{qn(field.column)} + EXCLUDED.{qn(field.column)}'
+        for field in fields[len(keys):]
+    )
+    placeholders = '(' + ', '.join(['%s'] * len(fields)) + ')'
+    ordered = sorted(rows.items())
+    batch_size = connection.ops.bulk_batch_size(fields, ordered)
+    with connection.cursor() as cursor:
+        for start in range(0, len(ordered), batch_size):
+            batch = ordered[start:start + batch_size]
+            params = []
+            for key, values in batch:
+                for field, value in zip(fields, (*key, *(values[name] for name in values_fields))):
+                    params.append(field.get_db_prep_save(value, connection))
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) VALUES {", ".join([placeholders] * len(batch))} '
+                f'ON CONFLICT ({conflict}) DO UPDATE SET {updates}',
+                params,
+            )
@@ -0,0 +1,203 @@
+"""
+Публикация и подписка на события заказов (pub/sub) для потока SSE.
+
+Изменение статуса заказа публикуется в канал его владельца (см.
+shop/signals.py), а представление order_events отдаёт события
+подписчикам этого канала через server-sent events.
+
+Реализация выбирается настройкой ORDER_EVENTS_BACKEND:
+
+* shop.events.InProcessBroker — подписчики в памяти процесса. Подходит,
+  когда сайт работает одним процессом ASGI-сервера.
+* shop.events.PostgresBroker — события проходят через LISTEN/NOTIFY
+  PostgreSQL, поэтому доходят до подписчиков во всех процессах и на всех
+  серверах. Каждый процесс держит одно слушающее соединение с базой.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connections
+from django.utils.module_loading import import_string
+
+from .models import Order
+
+logger = logging.getLogger(__name__)
+
+# Сколько событий может ждать медленного подписчика; старые вытесняются
+SUBSCRIPTION_QUEUE_SIZE = 100
+
+
+def user_channel(user_id):
+    """Канал событий заказов пользователя."""
+    return f'user:{user_id}'
+
+
+def format_sse(data, event=None):
+    """Форматирует сообщение по протоколу text/event-stream."""
+    lines = []
+    if event:
+        lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data, ensure_ascii=False)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+class Subscription:
+    """
+    Подписка на канал. Создаётся внутри цикла событий подписчика;
+    публиковать в неё можно из любого потока.
+    """
+
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=SUBSCRIPTION_QUEUE_SIZE)
+
+    def deliver(self, message):
+        try:
+            self._loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # Цикл событий подписчика уже закрыт
+            self.close()
+
+    def _put(self, message):
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(message)
+
+    async def get(self, timeout=None):
+        """Ждёт следующее сообщение; по истечении timeout — TimeoutError."""
+        return await asyncio.wait_for(self._queue.get(), timeout)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """Pub/sub в памяти процесса."""
+
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.channel]
+
+    def subscriber_count(self, channel):
+        with self._lock:
+            return len(self._subscriptions.get(channel, ()))
+
+    def publish(self, channel, message):
+        self.dispatch(channel, message)
+
+    def dispatch(self, channel, message):
+        """Раздаёт сообщение подписчикам канала в этом процессе."""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.deliver(message)
+
+
+class PostgresBroker(InProcessBroker):
+    """
+    Pub/sub через LISTEN/NOTIFY PostgreSQL.
+
+    publish выполняет pg_notify; уведомление доставляется после фиксации
+    транзакции. Фоновый поток процесса слушает канал на отдельном
+    соединении и раздаёт сообщения местным подписчикам.
+    """
+    NOTIFY_CHANNEL = 'quickcart_events'
+    RECONNECT_DELAY = 5
+
+    def __init__(self, using='default'):
+        super().__init__()
+        self.using = using
+        self._listener = None
+
+    def publish(self, channel, message):
+        payload = json.dumps({'channel': channel, 'message': message}, ensure_ascii=False)
+        with connections[self.using].cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.NOTIFY_CHANNEL, payload])
+
+    def subscribe(self, channel):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='order-events-listener', daemon=True)
+                self._listener.start()
+        return super().subscribe(channel)
+
+    def _listen(self):
+        while True:
+            connection = connections.create_connection(self.using)
+            try:
+                connection.ensure_connection()
+                connection.set_autocommit(True)
+                with connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN {self.NOTIFY_CHANNEL}')
+                for payload in self._notifications(connection.connection):
+                    data = json.loads(payload)
+                    self.dispatch(data['channel'], data['message'])
+            except Exception:
+                logger.exception('Соединение для событий заказов потеряно, переподключение')
+                time.sleep(self.RECONNECT_DELAY)
+            finally:
+                connection.close()
+
+    @staticmethod
+    def _notifications(raw):
+        """Блокирующий генератор payload уведомлений для psycopg 3 и psycopg2."""
+        if hasattr(raw, 'notifies') and callable(raw.notifies):
+            for notify in raw.notifies():
+                yield notify.payload
+            return
+        while True:
+            select.select([raw], [], [], 60)
+            raw.poll()
+            while raw.notifies:
+                yield raw.notifies.pop(0).payload
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Возвращает экземпляр брокера из настройки ORDER_EVENTS_BACKEND."""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                path = getattr(settings, 'ORDER_EVENTS_BACKEND', 'shop.events.InProcessBroker')
+                _broker = import_string(path)()
+    return _broker
+
+
+def publish_status(order_id, user_id, status):
+    """Публикует новый статус заказа в канал его владельца."""
+    get_broker().publish(user_channel(user_id), {
+        'id': order_id,
+        'status': status,
+        'status_display': dict(Order.STATUS_CHOICES).get(status, status),
+    })
+
+
+def publish_order_status(order):
+    """Публикует текущий статус заказа."""
+    publish_status(order.id, order.user_id, order.status)
@@ -0,0 +1,101 @@
+"""
+Потоковая выгрузка заказов и их позиций в CSV или JSONL.
+
+Одна строка выгрузки — позиция заказа вместе с данными заказа и email
+покупателя. Строки читаются курсором на стороне сервера
+(QuerySet.iterator(chunk_size=...)) и сразу пишутся в ответ или файл,
+поэтому память не растёт с объёмом выгрузки.
+"""
+import csv
+import json
+
+from .models import Order, OrderItem
+
+FORMATS = ('csv', 'jsonl')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+# Колонка выгрузки -> поле OrderItem
+COLUMNS = {
+    'order_id': 'order_id',
+    'created_at': 'order__created_at',
+    'status': 'order__status',
+    'user_email': 'order__user__email',
+    'total_amount': 'order__total_amount',
+    'line_id': 'id',
+    'product_id': 'product_id',
+    'product_name': 'product_name',
+    'quantity': 'quantity',
+    'price': 'price',
+}
+
+CHUNK_SIZE = 2000
+
+
+def filter_orders(orders, date_from=None, date_to=None, statuses=None):
+    """Отбирает заказы по дате создания (включительно) и статусам."""
+    if date_from:
+        orders = orders.filter(created_at__date__gte=date_from)
+    if date_to:
+        orders = orders.filter(created_at__date__lte=date_to)
+    if statuses:
+        orders = orders.filter(status__in=statuses)
+    return orders
+
+
+def export_rows(orders=None, chunk_size=CHUNK_SIZE):
+    """Итератор кортежей значений COLUMNS по позициям выбранных заказов."""
+    if orders is None:
+        orders = Order.objects.all()
+    lines = (
+        OrderItem.objects.filter(order__in=orders.order_by().values('id'))
+        .order_by('order_id', 'id')
+        .values_list(*COLUMNS.values())
+    )
+    return lines.iterator(chunk_size=chunk_size)
+
+
+def _json_value(value):
+    # Даты — в ISO 8601, суммы — строками, чтобы не терять точность
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if value is None or isinstance(value, (int, str)):
+        return value
+    return str(value)
+
+
+def _csv_value(value):
+    return '' if value is None else _json_value(value)
+
+
+class _Echo:
+    """Псевдофайл для csv.writer: возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(list(COLUMNS))
+    for row in rows:
+        yield writer.writerow([_csv_value(value) for value in row])
+
+
+def jsonl_lines(rows):
+    names = list(COLUMNS)
+    for row in rows:
+        record = dict(zip(names, (_json_value(value) for value in row)))
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def stream(rows, fmt):
+    """Строки выгрузки в формате fmt ('csv' или 'jsonl')."""
+    if fmt == 'csv':
+        return csv_lines(rows)
+    if fmt == 'jsonl':
+        return jsonl_lines(rows)
+    raise ValueError(f'Неизвестный формат выгрузки: {fmt}')
@@ -0,0 +1,398 @@
+"""
+Генератор синтетических данных для нагрузочного тестирования
+(manage.py generate_fake_data).
+
+Распределения приближены к настоящему магазину:
+
+* популярность товаров — закон Ципфа (ранг популярности не связан
+  с id товара);
+* число позиций в заказе — распределение Парето с тяжёлым хвостом:
+  обычно одна-две позиции, изредка — десятки;
+* статусы заказов — в основном выданные, меньше — в работе;
+* заказы равномерно распределены по последним --days дням, и время
+  заказа растёт вместе с id, как в рабочей базе.
+
+Строки вставляются без ORM: на PostgreSQL — через COPY, на других
+базах — executemany пачками. id назначаются заранее, от текущего
+максимума каждой таблицы, поэтому пачки независимы и вставляются
+параллельно несколькими процессами. Каждая пачка генерируется своим
+генератором случайных чисел от (seed, таблица, номер пачки), так что
+при одном seed данные не зависят от числа процессов.
+
+Товары создаются в главном процессе (их цены нужны всем пачкам заказов
+и корзин), пользователи, заказы и корзины — в процессах-воркерах.
+Генерация не атомарна: каждая пачка фиксируется своей транзакцией.
+"""
+import multiprocessing
+import random
+from array import array
+from bisect import bisect
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from itertools import accumulate
+
+import django
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, connections, models, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Cart, CartItem, Category, Order, OrderItem, Product, User
+
+CHUNK_SIZE = 10_000  # строк главной таблицы в одной пачке
+FAKE_PASSWORD = 'fake-password'
+ZIPF_EXPONENT = 1.1
+ORDER_SIZE_ALPHA = 1.6  # показатель Парето: в среднем около двух позиций
+MAX_ORDER_LINES = 50
+MAX_CART_LINES = 10
+ORDER_STATUSES = [
+    (Order.STATUS_DELIVERED, 80),
+    (Order.STATUS_READY, 5),
+    (Order.STATUS_IN_ASSEMBLY, 7),
+    (Order.STATUS_CREATED, 8),
+]
+QUANTITIES = [(1, 80), (2, 15), (3, 3), (4, 1), (5, 1)]
+INACTIVE_SHARE = 0.05
+# Заглушка из media/products: у всех сгенерированных товаров одна фотография
+PRODUCT_IMAGE = 'products/placeholder.jpg'
+
+USER_FIELDS = ['id', 'password', 'is_superuser', 'first_name', 'last_name', 'is_staff',
+               'is_active', 'date_joined', 'email']
+PRODUCT_FIELDS = ['id', 'name', 'description', 'price', 'image', 'slug', 'category',
+                  'is_active', 'created_at', 'excerpt', 'image_variants']
+ORDER_FIELDS = ['id', 'user', 'status', 'total_amount', 'created_at', 'item_count',
+                'preview_image', 'preview_image_variants']
+ORDER_ITEM_FIELDS = ['id', 'order', 'product', 'product_name', 'product_slug', 'product_image',
+                     'product_image_variants', 'quantity', 'price']
+CART_FIELDS = ['id', 'user', 'created_at', 'updated_at']
+CART_ITEM_FIELDS = ['id', 'cart', 'product', 'quantity', 'price']
+
+# Состояние воркера (см. _init_worker)
+_state = None
+
+
+def _rng(seed, table, chunk):
+    # Строковый seed хэшируется детерминированно (SHA-512), в отличие от hash()
+    return random.Random(f'{seed}:{table}:{chunk}')
+
+
+def _chunks(count):
+    return [(start, min(CHUNK_SIZE, count - start)) for start in range(0, count, CHUNK_SIZE)]
+
+
+def _line_counts(seed, table, chunk, count, limit):
+    """Число позиций каждого заказа (корзины) пачки; отдельный генератор, чтобы id позиций считались заранее."""
+    rng = _rng(seed, f'{table}-sizes', chunk)
+    return [min(limit, int(rng.paretovariate(ORDER_SIZE_ALPHA))) for _ in range(count)]
+
+
+# Запись строк
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+
+def write_rows(model, fields, rows, use_copy=True):
+    """Вставляет кортежи значений полей fields в таблицу model: COPY на PostgreSQL, иначе executemany."""
+    if not rows:
+        return
+    meta = model._meta
+    field_objects = [meta.get_field(name) for name in fields]
+    datetimes = [index for index, field in enumerate(field_objects) if isinstance(field, models.DateTimeField)]
+    if datetimes:
+        adapt = connection.ops.adapt_datetimefield_value
+        rows = [list(row) for row in rows]
+        for row in rows:
+            for index in datetimes:
+                row[index] = adapt(row[index])
+    quote = connection.ops.quote_name
+    table = quote(meta.db_table)
+    columns = ', '.join(quote(field.column) for field in field_objects)
+    with connection.cursor() as cursor:
+        raw = cursor.cursor
+        if use_copy and connection.vendor == 'postgresql':
+            data = StringIO(''.join('\t'.join(map(_copy_value, row)) + '\n' for row in rows))
+            statement = f'COPY {table} ({columns}) FROM STDIN'
+            if hasattr(raw, 'copy_expert'):  # psycopg2
+                raw.copy_expert(statement, data)
+                return
+            if hasattr(raw, 'copy'):  # psycopg 3
+                with raw.copy(statement) as copy:
+                    copy.write(data.getvalue())
+                return
+        placeholders = ', '.join(['%s'] * len(fields))
+        cursor.executemany(f'INSERT INTO {table} ({columns}) VALUES ({placeholders})', rows)
+
+
+# Пачки
+
+def _users(start, count):
+    state = _state
+    rng = _rng(state['seed'], 'users', start)
+    rows = []
+    for index in range(start, start + count):
+        user_id = state['bases']['user'] + index
+        joined = state['since'] - timedelta(days=365) + timedelta(seconds=rng.uniform(0, state['span'] + 365 * 86400))
+        rows.append((user_id, state['password'], False, '', '', False, True, joined,
+                     f'fake-{user_id}@example.com'))
+    write_rows(User, USER_FIELDS, rows, state['use_copy'])
+    return count
+
+
+def _pick_products(rng, count):
+    state = _state
+    popular = state['popular']
+    weights = state['weights']
+    total = weights[-1]
+    chosen = []
+    seen = set()
+    while len(chosen) < count:
+        # То же, что rng.choices(..., cum_weights=weights), но без лишних списков
+        product = popular[bisect(weights, rng.random() * total)]
+        if product not in seen:
+            seen.add(product)
+            chosen.append(product)
+    return chosen
+
+
+def _orders(start, count, line_start):
+    state = _state
+    seed = state['seed']
+    rng = _rng(seed, 'orders', start)
+    sizes = _line_counts(seed, 'orders', start, count, state['max_order_lines'])
+    statuses, status_weights = zip(*ORDER_STATUSES)
+    status_weights = list(accumulate(status_weights))
+    quantities, quantity_weights = zip(*QUANTITIES)
+    quantity_weights = list(accumulate(quantity_weights))
+    product_base = state['bases']['product']
+    prices = state['prices']
+    total_orders = state['orders']
+    orders = []
+    lines = []
+    line_id = state['bases']['order_item'] + line_start
+    for index, size in zip(range(start, start + count), sizes):
+        order_id = state['bases']['order'] + index
+        total = 0
+        items = 0
+        products = _pick_products(rng, size)
+        for product in products:
+            quantity = quantities[bisect(quantity_weights, rng.random() * quantity_weights[-1])]
+            price = prices[product]
+            total += price * quantity
+            items += quantity
+            lines.append((line_id, order_id, product_base + product, f'Товар {product_base + product}',
+                          f'fake-product-{product_base + product}', PRODUCT_IMAGE, '[]', quantity,
+                          Decimal(price)))
+            line_id += 1
+        # Время растёт вместе с id заказа
+        created = state['since'] + timedelta(seconds=state['span'] * (index + rng.random()) / total_orders)
+        orders.append((order_id, state['bases']['user'] + rng.randrange(state['users']),
+                       statuses[bisect(status_weights, rng.random() * status_weights[-1])], Decimal(total), created,
+                       items, PRODUCT_IMAGE, '[]'))
+    with transaction.atomic():
+        write_rows(Order, ORDER_FIELDS, orders, state['use_copy'])
+        write_rows(OrderItem, ORDER_ITEM_FIELDS, lines, state['use_copy'])
+    return len(lines)
+
+
+def _carts(start, count, line_start):
+    state = _state
+    seed = state['seed']
+    rng = _rng(seed, 'carts', start)
+    sizes = _line_counts(seed, 'carts', start, count, state['max_cart_lines'])
+    product_base = state['bases']['product']
+    carts = []
+    lines = []
+    line_id = state['bases']['cart_item'] + line_start
+    for index, size in zip(range(start, start + count), sizes):
+        cart_id = state['bases']['cart'] + index
+        updated = state['now'] - timedelta(seconds=rng.uniform(0, 30 * 86400))
+        # Корзины — у первых пользователей: у каждого не больше одной
+        carts.append((cart_id, state['bases']['user'] + index, updated - timedelta(hours=rng.uniform(0, 72)), updated))
+        for product in _pick_products(rng, size):
+            lines.append((line_id, cart_id, product_base + product, 1, Decimal(state['prices'][product])))
+            line_id += 1
+    with transaction.atomic():
+        write_rows(Cart, CART_FIELDS, carts, state['use_copy'])
+        write_rows(CartItem, CART_ITEM_FIELDS, lines, state['use_copy'])
+    return len(lines)
+
+
+_TASKS = {'users': _users, 'orders': _orders, 'carts': _carts}
+
+
+def _init_worker(state):
+    global _state
+    if not apps.ready:
+        # Воркер запущен через spawn, а не fork
+        django.setup()
+    popular = list(range(state['products']))
+    _rng(state['seed'], 'popularity', 0).shuffle(popular)
+    _state = {
+        **state,
+        'popular': popular,
+        'weights': list(accumulate(1 / rank ** ZIPF_EXPONENT for rank in range(1, state['products'] + 1))),
+    }
+
+
+def _run_task(task):
+    kind, *args = task
+    return kind, _TASKS[kind](*args)
+
+
+# Главный процесс
+
+def _next_id(model):
+    return (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+
+
+def _create_products(state, categories):
+    prices = []
+    for start, count in _chunks(state['products']):
+        rng = _rng(state['seed'], 'products', start)
+        rows = []
+        for index in range(start, start + count):
+            product_id = state['bases']['product'] + index
+            # Логнормальные цены: много недорогих товаров, мало дорогих
+            price = max(50, min(500_000, int(rng.lognormvariate(8, 1.2))))
+            prices.append(price)
+            description = f'Описание товара {product_id}.'
+            created = state['since'] + timedelta(seconds=rng.uniform(0, state['span']))
+            rows.append((product_id, f'Товар {product_id}', description, Decimal(price), PRODUCT_IMAGE,
+                         f'fake-product-{product_id}', rng.choice(categories) if categories else None,
+                         rng.random() >= INACTIVE_SHARE, created, description, '[]'))
+        with transaction.atomic():
+            write_rows(Product, PRODUCT_FIELDS, rows, state['use_copy'])
+    return array('l', prices)
+
+
+def _create_categories(count):
+    start = _next_id(Category)
+    return [
+        category.id for category in Category.objects.bulk_create([
+            Category(name=f'Категория {start + index}', slug=f'fake-category-{start + index}')
+            for index in range(count)
+        ])
+    ]
+
+
+def _tasks(state, kind, count, limit):
+    tasks = []
+    line_start = 0
+    for start, size in _chunks(count):
+        if kind == 'users':
+            tasks.append((kind, start, size))
+            continue
+        tasks.append((kind, start, size, line_start))
+        line_start += sum(_line_counts(state['seed'], kind, start, size, limit))
+    return tasks
+
+
+def _run_pool(state, tasks, workers, progress):
+    totals = {}
+    if workers <= 1:
+        _init_worker(state)
+        results = map(_run_task, tasks)
+        for kind, rows in results:
+            totals[kind] = totals.get(kind, 0) + rows
+            progress(kind, totals[kind])
+        return totals
+    # Воркеры не должны унаследовать открытое соединение родителя
+    connections.close_all()
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+    with context.Pool(workers, initializer=_init_worker, initargs=(state,)) as pool:
+        for kind, rows in pool.imap_unordered(_run_task, tasks):
+            totals[kind] = totals.get(kind, 0) + rows
+            progress(kind, totals[kind])
+    return totals
+
+
+def _reset_sequences():
+    statements = connection.ops.sequence_reset_sql(no_style(), [User, Category, Product, Order, OrderItem,
+                                                                  Cart, CartItem])
+    if statements:
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+
+
+def generate(users, products, orders, carts=0, categories=20, days=365, seed=42, workers=1,
+             use_copy=True, progress=lambda kind, rows: None):
+    """
+    Создаёт синтетические данные. Возвращает {таблица: число строк}:
+    users, products, orders, order_lines, carts, cart_lines.
+    """
+    if orders and not users:
+        raise ValueError('Для заказов нужны пользователи')
+    if (orders or carts) and not products:
+        raise ValueError('Для заказов и корзин нужны товары')
+    if carts > users:
+        raise ValueError('Корзин не может быть больше, чем пользователей')
+    # SQLite не принимает записи из нескольких процессов одновременно
+    if connection.vendor == 'sqlite':
+        workers = 1
+    now = timezone.now()
+    state = {
+        'seed': seed,
+        'users': users,
+        'products': products,
+        'orders': orders,
+        'carts': carts,
+        'now': now,
+        'since': now - timedelta(days=days),
+        'span': days * 86400,
+        'use_copy': use_copy,
+        'max_order_lines': min(MAX_ORDER_LINES, products),
+        'max_cart_lines': min(MAX_CART_LINES, products),
+        'password': make_password(FAKE_PASSWORD),  # хэш считается долго — один на всех
+        'bases': {
+            'user': _next_id(User),
+            'product': _next_id(Product),
+            'order': _next_id(Order),
+            'order_item': _next_id(OrderItem),
+            'cart': _next_id(Cart),
+            'cart_item': _next_id(CartItem),
+        },
+    }
+    if connection.vendor == 'sqlite' and not connection.in_atomic_block:
+        # Без fsync на каждую транзакцию: при сбое данные всё равно генерируются
+        # заново. Внутри транзакции SQLite не позволяет менять эту настройку
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            synchronous = cursor.fetchone()[0]
+            cursor.execute('PRAGMA synchronous = OFF')
+        try:
+            return _generate(state, categories, workers, progress)
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(f'PRAGMA synchronous = {int(synchronous)}')
+    return _generate(state, categories, workers, progress)
+
+
+def _generate(state, categories, workers, progress):
+    category_ids = _create_categories(categories) if state['products'] else []
+    state['prices'] = _create_products(state, category_ids)
+    progress('products', state['products'])
+    # Сначала пользователи: на них ссылаются заказы и корзины
+    totals = _run_pool(state, _tasks(state, 'users', state['users'], 0), workers, progress)
+    totals.update(_run_pool(
+        state,
+        _tasks(state, 'orders', state['orders'], state['max_order_lines'])
+        + _tasks(state, 'carts', state['carts'], state['max_cart_lines']),
+        workers, progress,
+    ))
+    _reset_sequences()
+    return {
+        'users': state['users'],
+        'products': state['products'],
+        'orders': state['orders'],
+        'order_lines': totals.get('orders', 0),
+        'carts': state['carts'],
+        'cart_lines': totals.get('carts', 0),
+    }
@@ -0,0 +1,78 @@
+"""
+Уменьшенные копии (варианты) фотографий товаров.
+
+Для каждой фотографии создаются варианты заданной ширины в форматах WebP
+и JPEG; они лежат рядом с оригиналом: products/phone.jpg ->
+products/phone_320w.webp, products/phone_320w.jpg. Ширины, для которых
+варианты уже созданы, хранятся в Product.image_variants — по ним тег
+{% responsive_image %} строит srcset без обращений к файловой системе.
+
+Функция render_variants работает только с путями к файлам, поэтому её можно
+выполнять в отдельных процессах (см. команду generate_image_variants).
+"""
+import os
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+# Формат -> (расширение, параметры сохранения Pillow)
+FORMATS = {
+    'webp': ('.webp', {'format': 'WEBP', 'quality': 80, 'method': 4}),
+    'jpeg': ('.jpg', {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def variant_widths():
+    """Ширины вариантов из настроек."""
+    return sorted(getattr(settings, 'PRODUCT_IMAGE_WIDTHS', [80, 160, 320, 640, 1024]))
+
+
+def variant_name(name, width, fmt):
+    """Имя файла варианта рядом с оригиналом."""
+    root, _ = os.path.splitext(name)
+    extension, _ = FORMATS[fmt]
+    return f'{root}_{width}w{extension}'
+
+
+def render_variants(source_path, widths, formats=tuple(FORMATS)):
+    """
+    Создаёт варианты изображения рядом с исходным файлом.
+    Больше оригинала изображение не растягивается: вместо ширин не меньше
+    оригинала создаётся один вариант шириной с оригинал. Возвращает список
+    созданных ширин.
+    """
+    with Image.open(source_path) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGB')
+        produced = sorted(width for width in set(widths) if width < image.width)
+        if any(width >= image.width for width in widths):
+            produced.append(image.width)
+        for width in produced:
+            height = round(image.height * width / image.width)
+            resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+            for fmt in formats:
+                _, options = FORMATS[fmt]
+                output = resized.convert('RGB') if fmt == 'jpeg' else resized
+                output.save(variant_name(source_path, width, fmt), **options)
+    return produced
+
+
+def delete_variants(storage, name, widths):
+    """Удаляет варианты изображения из хранилища."""
+    for width in widths:
+        for fmt in FORMATS:
+            storage.delete(variant_name(name, width, fmt))
+
+
+def generate_for_product(product):
+    """
+    Создаёт варианты фотографии товара и сохраняет список ширин в базе.
+    Ожидает файловое хранилище (FileSystemStorage) с доступом по пути.
+    """
+    if not product.image or not product.image.storage.exists(product.image.name):
+        return []
+    widths = render_variants(product.image.path, variant_widths())
+    type(product).objects.filter(pk=product.pk).update(image_variants=widths)
+    product.image_variants = widths
+    return widths
@@ -0,0 +1,338 @@
+"""
+Нагрузочный прогон витрины для manage.py bench_storefront.
+
+Данные: seed() создаёт N товаров, M покупателей и K прошлых заказов с
+префиксом BENCH_PREFIX; популярность товаров распределена по закону Ципфа.
+Данные фиксируются в базе, потому что их должны видеть и потоки
+виртуальных пользователей, и сервер в другом процессе; cleanup() удаляет
+их и пересчитывает сводки продаж за дни прогона.
+
+Каждый виртуальный пользователь в своём потоке входит в систему и
+повторяет сценарий покупки (FLOW): каталог, страница товара, добавление
+в корзину, корзина, оформление заказа, история заказов. Запросы идут через:
+
+* ClientSession — тестовый клиент Django в том же процессе;
+* HttpSession — HTTP к настоящему серверу: встроенному многопоточному
+  WSGI-серверу (serve_wsgi) или внешнему, например gunicorn или uvicorn.
+
+Для каждого шага собираются задержки (p50/p95/p99), ошибки и число
+SQL-запросов. Внешний сервер сообщает число запросов заголовком
+X-Query-Count, только если работает с DEBUG (см. shop/profiling.py).
+"""
+import http.client
+import math
+import random
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+from decimal import Decimal
+from http.cookies import SimpleCookie
+from itertools import accumulate
+from urllib.parse import urlencode, urlsplit
+
+from django.contrib.auth.hashers import make_password
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.db import connection, connections
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from . import analytics, profiling
+from .fakedata import PRODUCT_IMAGE
+from .models import Cart, Order, OrderItem, Product, User
+
+BENCH_PREFIX = 'bench-flow-'
+BENCH_PASSWORD = 'bench-password'
+ZIPF_EXPONENT = 1.1
+BATCH_SIZE = 2000
+
+FLOW = ['product_list', 'product_detail', 'add_to_cart', 'cart_view', 'checkout', 'order_list']
+
+
+def percentile(values, fraction):
+    """Процентиль по методу ближайшего ранга; values должны быть отсортированы."""
+    if not values:
+        return None
+    rank = max(1, math.ceil(fraction * len(values)))
+    return values[min(rank, len(values)) - 1]
+
+
+class BenchData:
+    def __init__(self, products, users, started):
+        self.products = products  # (id, slug), самые популярные — первыми
+        self.users = users  # email
+        self.started = started
+        self.weights = list(accumulate(1 / rank ** ZIPF_EXPONENT for rank in range(1, len(products) + 1)))
+
+    def product(self, rng):
+        return rng.choices(self.products, cum_weights=self.weights)[0]
+
+
+def _bulk_create(model, objects):
+    created = []
+    for start in range(0, len(objects), BATCH_SIZE):
+        created.extend(model.objects.bulk_create(objects[start:start + BATCH_SIZE]))
+    return created
+
+
+def seed(products, users, orders, seed=42):
+    """Создаёт синтетические товары, покупателей и прошлые заказы."""
+    rng = random.Random(seed)
+    started = timezone.localdate()
+    product_objects = _bulk_create(Product, [
+        Product(name=f'Товар {i}', slug=f'{BENCH_PREFIX}{i}', description='',
+                price=Decimal(rng.randint(100, 100000)), image=PRODUCT_IMAGE)
+        for i in range(products)
+    ])
+    password = make_password(BENCH_PASSWORD)  # хэш считается долго — один на всех
+    user_objects = _bulk_create(User, [
+        User(email=f'{BENCH_PREFIX}{i}@test.local', password=password) for i in range(users)
+    ])
+    data = BenchData([(product.id, product.slug) for product in product_objects],
+                     [user.email for user in user_objects], started)
+    by_id = {product.id: product for product in product_objects}
+    statuses = [code for code, _ in Order.STATUS_CHOICES]
+    for start in range(0, orders, BATCH_SIZE):
+        baskets = [
+            [(by_id[data.product(rng)[0]], rng.randint(1, 3)) for _ in range(rng.randint(1, 4))]
+            for _ in range(min(BATCH_SIZE, orders - start))
+        ]
+        order_objects = Order.objects.bulk_create([
+            Order(user=rng.choice(user_objects), status=rng.choice(statuses),
+                  total_amount=sum(product.price * quantity for product, quantity in basket),
+                  item_count=sum(quantity for _, quantity in basket),
+                  preview_image=basket[0][0].image)
+            for basket in baskets
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, product_name=product.name, product_slug=product.slug,
+                      product_image=product.image, quantity=quantity, price=product.price)
+            for order, basket in zip(order_objects, baskets)
+            for product, quantity in basket
+        ])
+    return data
+
+
+def cleanup(since=None):
+    """
+    Удаляет данные прогона. Заказы, оформленные во время прогона, попали
+    в сводки продаж, поэтому сводки с даты since пересчитываются.
+    """
+    users = User.objects.filter(email__startswith=BENCH_PREFIX)
+    OrderItem.objects.filter(order__user__in=users).delete()
+    Order.objects.filter(user__in=users).delete()
+    Cart.objects.filter(user__in=users).delete()
+    if since is not None:
+        analytics.rebuild(since=since)
+    users.delete()
+    Product.objects.filter(slug__startswith=BENCH_PREFIX).delete()
+
+
+class StepStats:
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []  # секунды
+        self.queries = []
+        self.errors = 0
+
+    def add(self, latency, queries, ok):
+        self.latencies.append(latency)
+        if queries is not None:
+            self.queries.append(queries)
+        if not ok:
+            self.errors += 1
+
+    def merge(self, other):
+        self.latencies.extend(other.latencies)
+        self.queries.extend(other.queries)
+        self.errors += other.errors
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+        milliseconds = {
+            key: round(value * 1000, 2) if value is not None else None
+            for key, value in (
+                ('p50_ms', percentile(latencies, 0.50)),
+                ('p95_ms', percentile(latencies, 0.95)),
+                ('p99_ms', percentile(latencies, 0.99)),
+                ('mean_ms', sum(latencies) / len(latencies) if latencies else None),
+                ('max_ms', latencies[-1] if latencies else None),
+            )
+        }
+        return {
+            'requests': len(latencies),
+            'errors': self.errors,
+            **milliseconds,
+            'queries_avg': round(sum(self.queries) / len(self.queries), 2) if self.queries else None,
+            'queries_max': max(self.queries) if self.queries else None,
+        }
+
+
+class ClientSession:
+    """Виртуальный пользователь на тестовом клиенте Django: запросы выполняются в этом же потоке."""
+
+    def __init__(self, email):
+        self.client = Client()
+        self.client.force_login(User.objects.get(email=email))
+
+    def request(self, method, path, data=None):
+        profile = profiling.RequestProfile()
+        with ExitStack() as stack:
+            for db in connections.all():
+                stack.enter_context(db.execute_wrapper(profile))
+            response = getattr(self.client, method.lower())(path, data)
+        return response.status_code, profile.query_count
+
+    def close(self):
+        connection.close()
+
+
+class HttpSession:
+    """Виртуальный пользователь по HTTP: cookies сессии и CSRF, одно keep-alive соединение."""
+
+    def __init__(self, base_url, email):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port
+        self.prefix = parts.path.rstrip('/')
+        self.cookies = {}
+        self.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        # Форма входа выдаёт cookie csrftoken
+        self.request('GET', reverse('shop:login'))
+        status, _ = self.request('POST', reverse('shop:login'), {'email': email, 'password': BENCH_PASSWORD})
+        if status != 302:
+            raise RuntimeError(f'Не удалось войти как {email}: HTTP {status}')
+
+    def _send(self, method, path, body, headers):
+        self.connection.request(method, self.prefix + path, body, headers)
+        return self.connection.getresponse()
+
+    def request(self, method, path, data=None):
+        headers = {}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+        body = None
+        if method == 'POST':
+            token = self.cookies.get('csrftoken', '')
+            body = urlencode({**(data or {}), 'csrfmiddlewaretoken': token})
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        try:
+            response = self._send(method, path, body, headers)
+        except (http.client.RemoteDisconnected, ConnectionError):
+            # Сервер закрыл keep-alive соединение. GET повторяем по новому,
+            # POST — нет: он мог выполниться, и шаг засчитывается как ошибка
+            self.connection.close()
+            if method != 'GET':
+                raise
+            response = self._send(method, path, body, headers)
+        response.read()
+        for header in response.headers.get_all('Set-Cookie') or []:
+            for name, morsel in SimpleCookie(header).items():
+                self.cookies[name] = morsel.value
+        queries = response.headers.get('X-Query-Count')
+        return response.status, int(queries) if queries is not None else None
+
+    def close(self):
+        self.connection.close()
+
+
+# Успешный ответ: страница или перенаправление после формы
+_EXPECTED = {'GET': 200, 'POST': 302}
+
+
+def _run_flow(session, data, rng, stats):
+    product_id, slug = data.product(rng)
+    steps = [
+        ('product_list', 'GET', reverse('shop:product_list'), None),
+        ('product_detail', 'GET', reverse('shop:product_detail', args=[slug]), None),
+        ('add_to_cart', 'POST', reverse('shop:add_to_cart', args=[product_id]), None),
+        ('cart_view', 'GET', reverse('shop:cart'), None),
+        ('checkout', 'POST', reverse('shop:checkout'), {'checkout_token': str(uuid.uuid4())}),
+        ('order_list', 'GET', reverse('shop:order_list'), None),
+    ]
+    for name, method, path, form in steps:
+        started = time.perf_counter()
+        try:
+            status, queries = session.request(method, path, form)
+        except Exception:
+            status, queries = None, None
+        latency = time.perf_counter() - started
+        if stats is not None:
+            stats[name].add(latency, queries, status == _EXPECTED[method])
+
+
+def run(data, session_factory, users, iterations, warmup=1, seed=42):
+    """
+    Прогоняет сценарий users виртуальными пользователями по iterations раз
+    (после warmup неучтённых повторов). Возвращает ({шаг: StepStats}, время в секундах).
+    """
+    totals = {name: StepStats(name) for name in FLOW}
+    lock = threading.Lock()
+    ready = threading.Barrier(users + 1)
+    errors = []
+
+    def virtual_user(index):
+        stats = {name: StepStats(name) for name in FLOW}
+        rng = random.Random(seed * 1000 + index)
+        session = None
+        try:
+            session = session_factory(data.users[index % len(data.users)])
+            for _ in range(warmup):
+                _run_flow(session, data, rng, None)
+        except Exception as exc:
+            errors.append(exc)
+        ready.wait()
+        try:
+            if session is not None:
+                for _ in range(iterations):
+                    _run_flow(session, data, rng, stats)
+        finally:
+            if session is not None:
+                session.close()
+            with lock:
+                for name in FLOW:
+                    totals[name].merge(stats[name])
+
+    threads = [threading.Thread(target=virtual_user, args=(index,)) for index in range(users)]
+    for thread in threads:
+        thread.start()
+    # Замер начинается, когда все пользователи вошли и прогрелись
+    ready.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if errors:
+        raise errors[0]
+    return totals, elapsed
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def _counting_queries(application):
+    """WSGI-приложение, которое отдаёт число SQL-запросов в заголовке X-Query-Count."""
+    def wrapped(environ, start_response):
+        profile = profiling.RequestProfile()
+
+        def counted_start_response(status, headers, exc_info=None):
+            return start_response(status, [*headers, ('X-Query-Count', str(profile.query_count))], exc_info)
+
+        with ExitStack() as stack:
+            for db in connections.all():
+                stack.enter_context(db.execute_wrapper(profile))
+            return application(environ, counted_start_response)
+    return wrapped
+
+
+def serve_wsgi():
+    """Запускает многопоточный WSGI-сервер Django на свободном порту. Возвращает (сервер, адрес)."""
+    server = ThreadedWSGIServer(('127.0.0.1', 0), _QuietRequestHandler, allow_reuse_address=True)
+    server.set_app(_counting_queries(WSGIHandler()))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    return server, f'http://{host}:{port}'
@@ -0,0 +1,226 @@
+"""
+Очередь исходящих писем (transactional outbox).
+
+Письмо записывается в таблицу OutboxEmail в той же транзакции, что и заказ:
+если заказ откатился, письма нет, а если заказ сохранён — письмо не
+потеряется, даже когда SMTP-сервер недоступен. Отправляет письма отдельный
+процесс (manage.py send_outbox) пачками через одно SMTP-соединение.
+Пачка забирается короткой транзакцией: письма получают аренду —
+next_attempt_at сдвигается на EMAIL_OUTBOX_LEASE секунд, — и отправляются
+уже вне транзакции, поэтому медленный SMTP-сервер не держит блокировки.
+Если обработчик упал посреди пачки, письма вернутся в работу после
+истечения аренды.
+Неудачная отправка повторяется с экспоненциальной отсрочкой; после
+EMAIL_OUTBOX_MAX_ATTEMPTS попыток письмо помечается как недоставленное
+и остаётся в таблице для разбора.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from . import metrics
+from .models import Order, OutboxEmail, User
+
+logger = logging.getLogger(__name__)
+
+# Результаты постановки подтверждения заказа в очередь
+CONFIRMATION_QUEUED = 'queued'
+CONFIRMATION_DISABLED = 'disabled'
+CONFIRMATION_SKIPPED = 'skipped'
+CONFIRMATION_INVALID = 'invalid'
+
+# Домены, на которые письма не отправляются (тестовые пользователи)
+SKIPPED_DOMAINS = {'test.local'}
+
+
+def outbox_batch_size():
+    return getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', 100)
+
+
+def outbox_max_attempts():
+    return getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 8)
+
+
+def outbox_lease():
+    """Сколько письмо остаётся за обработчиком, забравшим его в работу."""
+    return timedelta(seconds=getattr(settings, 'EMAIL_OUTBOX_LEASE', 300))
+
+
+def retry_delay(attempts):
+    """Отсрочка перед следующей попыткой: удваивается с каждой ошибкой."""
+    base = getattr(settings, 'EMAIL_OUTBOX_RETRY_DELAY', 60)
+    limit = getattr(settings, 'EMAIL_OUTBOX_MAX_RETRY_DELAY', 3600)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), limit))
+
+
+def confirmation_status(email):
+    """Определяет, нужно ли отправлять подтверждение заказа на этот адрес."""
+    if not settings.ENABLE_EMAIL_SENDING:
+        return CONFIRMATION_DISABLED
+    if '@' not in email:
+        return CONFIRMATION_INVALID
+    if email.rsplit('@', 1)[1] in SKIPPED_DOMAINS:
+        return CONFIRMATION_SKIPPED
+    return CONFIRMATION_QUEUED
+
+
+def queue_order_confirmation(order):
+    """
+    Ставит в очередь письмо с подтверждением заказа.
+    Вызывается внутри транзакции оформления заказа.
+    """
+    email = order.user.email
+    status = confirmation_status(email)
+    if status == CONFIRMATION_SKIPPED:
+        logger.info('Пропуск отправки email на тестовый домен: %s', email)
+    elif status == CONFIRMATION_INVALID:
+        logger.error('Некорректный формат email для получателя: %s', email)
+    elif status == CONFIRMATION_QUEUED:
+        OutboxEmail.objects.create(
+            recipient=email,
+            subject=f'Заказ #{order.id} в магазине QuickCart успешно оформлен!',
+            body=(
+                f'Здравствуйте, {email}!\n\n'
+                f'Ваш заказ #{order.id} на сумму {order.total_amount} ₽ был успешно создан.\n'
+                f'Вы можете отследить его статус в личном кабинете на нашем сайте.\n\n'
+                'Спасибо за покупку!'
+            ),
+        )
+    return status
+
+
+def queue_status_emails(orders, status):
+    """
+    Ставит в очередь уведомления о новом статусе заказов.
+    orders — пары (id заказа, id пользователя); одна вставка на все письма.
+    """
+    if not orders:
+        return 0
+    status_display = dict(Order.STATUS_CHOICES).get(status, status)
+    emails = dict(User.objects.filter(id__in={user_id for _, user_id in orders}).values_list('id', 'email'))
+    queued = [
+        OutboxEmail(
+            recipient=emails[user_id],
+            subject=f'Заказ #{order_id}: {status_display}',
+            body=(
+                f'Здравствуйте, {emails[user_id]}!\n\n'
+                f'Статус вашего заказа #{order_id} изменился: {status_display}.\n'
+                f'Подробности — в личном кабинете на нашем сайте.\n\n'
+                'Спасибо за покупку!'
+            ),
+        )
+        for order_id, user_id in orders
+        if user_id in emails and confirmation_status(emails[user_id]) == CONFIRMATION_QUEUED
+    ]
+    OutboxEmail.objects.bulk_create(queued)
+    return len(queued)
+
+
+class OutboxSender:
+    """
+    Отправляет письма из очереди через одно SMTP-соединение.
+    Соединение открывается при первой отправке и переиспользуется
+    между пачками; после ошибки отправки оно переоткрывается.
+    """
+
+    def __init__(self, connection=None, batch_size=None, max_attempts=None):
+        self.connection = connection or get_connection()
+        self.batch_size = batch_size or outbox_batch_size()
+        self.max_attempts = max_attempts or outbox_max_attempts()
+        self._opened = False
+
+    def _open(self):
+        if not self._opened:
+            self.connection.open()
+            self._opened = True
+
+    def close(self):
+        if self._opened:
+            try:
+                self.connection.close()
+            except Exception:
+                logger.exception('Ошибка при закрытии SMTP-соединения')
+            self._opened = False
+
+    def _send(self, email):
+        message = EmailMessage(
+            email.subject,
+            email.body,
+            from_email=None,  # DEFAULT_FROM_EMAIL из settings.py
+            to=[email.recipient],
+            connection=self.connection,
+        )
+        message.send()
+
+    def claim_batch(self):
+        """
+        Забирает в работу пачку писем, срок которых наступил: короткой
+        транзакцией с SKIP LOCKED сдвигает их next_attempt_at на срок аренды,
+        поэтому другие обработчики эти письма не возьмут.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            batch = list(
+                OutboxEmail.objects
+                .filter(status=OutboxEmail.STATUS_PENDING, next_attempt_at__lte=now)
+                .select_for_update(skip_locked=True)[:self.batch_size]
+            )
+            OutboxEmail.objects.filter(pk__in=[email.pk for email in batch]).update(
+                next_attempt_at=now + outbox_lease(),
+            )
+        return batch
+
+    def _save(self, email, fields):
+        OutboxEmail.objects.filter(pk=email.pk).update(**{field: getattr(email, field) for field in fields})
+
+    def send_batch(self):
+        """
+        Отправляет одну пачку писем, срок которых наступил.
+        Письма отправляются вне транзакции, результат каждого сохраняется
+        сразу после отправки. Если не удаётся открыть соединение, аренда
+        неотправленных писем снимается без учёта попытки, а исключение
+        пробрасывается.
+        Возвращает словарь {'sent', 'failed', 'dead'}.
+        """
+        stats = {'sent': 0, 'failed': 0, 'dead': 0}
+        batch = self.claim_batch()
+        for index, email in enumerate(batch):
+            try:
+                self._open()
+            except Exception:
+                # Сервер недоступен: остальные письма сразу возвращаются в очередь
+                OutboxEmail.objects.filter(pk__in=[rest.pk for rest in batch[index:]]).update(
+                    next_attempt_at=timezone.now(),
+                )
+                raise
+            email.attempts += 1
+            started = time.perf_counter()
+            try:
+                self._send(email)
+            except Exception as exc:
+                metrics.EMAIL_SEND_DURATION.observe(time.perf_counter() - started, result='error')
+                email.last_error = f'{type(exc).__name__}: {exc}'
+                if email.attempts >= self.max_attempts:
+                    email.status = OutboxEmail.STATUS_DEAD
+                    stats['dead'] += 1
+                    logger.error('Письмо #%s на %s не доставлено: %s', email.pk, email.recipient, exc)
+                else:
+                    email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+                    stats['failed'] += 1
+                    logger.warning('Ошибка отправки письма #%s на %s: %s', email.pk, email.recipient, exc)
+                self._save(email, ['status', 'attempts', 'next_attempt_at', 'last_error'])
+                # Соединение могло оборваться: следующее письмо откроет новое
+                self.close()
+            else:
+                metrics.EMAIL_SEND_DURATION.observe(time.perf_counter() - started, result='sent')
+                email.status = OutboxEmail.STATUS_SENT
+                email.sent_at = timezone.now()
+                email.last_error = ''
+                stats['sent'] += 1
+                self._save(email, ['status', 'attempts', 'last_error', 'sent_at'])
+        return stats
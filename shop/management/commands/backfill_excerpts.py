@@ -0,0 +1,34 @@
+"""
+Заполняет краткое описание (Product.excerpt) для уже существующих товаров.
+"""
+from django.core.management.base import BaseCommand
+
+from shop import cache
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает краткие описания товаров пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        batch = []
+        updated = 0
+        products = Product.objects.only('id', 'description', 'excerpt').order_by('id')
+        for product in products.iterator(chunk_size=batch_size):
+            excerpt = Product.make_excerpt(product.description)
+            if excerpt != product.excerpt:
+                product.excerpt = excerpt
+                batch.append(product)
+            if len(batch) >= batch_size:
+                Product.objects.bulk_update(batch, ['excerpt'])
+                updated += len(batch)
+                batch = []
+        Product.objects.bulk_update(batch, ['excerpt'])
+        updated += len(batch)
+        if updated:
+            cache.invalidate_catalog()
+        self.stdout.write(self.style.SUCCESS(f'Обновлено кратких описаний: {updated}'))
@@ -0,0 +1,77 @@
+"""
+Микробенчмарк страницы каталога с длинными описаниями: полная загрузка
+строк и фильтр truncatewords против загрузки только полей карточки
+и готового Product.excerpt.
+
+Товары создаются внутри транзакции, которая в конце откатывается.
+"""
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template import engines
+from django.template.loader import get_template
+
+from shop.models import Product
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает загрузку и рендер карточек каталога до и после выноса краткого описания'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=12)
+        parser.add_argument('--words', type=int, default=3000, help='Длина описания в словах')
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._seed(options['products'], options['words'])
+                self._run(options['products'], options['repeat'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _seed(self, count, words):
+        description = ' '.join(f'слово{i % 97}' for i in range(words))
+        for i in range(count):
+            Product.objects.create(
+                name=f'Бенчмарк-товар {i}',
+                slug=f'bench-render-{i}',
+                description=description,
+                price=Decimal('1000.00'),
+                image='products/bench.jpg',
+            )
+
+    def _run(self, count, repeat):
+        card = get_template('shop/includes/product_card.html').template.source
+        loop = '{%% load shop_images %%}{%% for product in products %%}%s{%% endfor %%}'
+        before_template = engines['django'].from_string(
+            loop % card.replace('{{ product.excerpt }}', '{{ product.description|truncatewords:15 }}')
+        )
+        after_template = engines['django'].from_string(loop % card)
+        active = Product.objects.filter(is_active=True)
+
+        def before():
+            return before_template.render({'products': list(active[:count])})
+
+        def after():
+            return after_template.render({'products': list(active.for_cards()[:count])})
+
+        self.stdout.write(f'До:    {self._measure(before, repeat):.2f} мс')
+        self.stdout.write(f'После: {self._measure(after, repeat):.2f} мс')
+
+    @staticmethod
+    def _measure(func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
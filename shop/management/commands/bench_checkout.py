@@ -0,0 +1,62 @@
+"""
+Бенчмарк оформления заказа: число запросов к базе и время place_order
+для корзин разного размера.
+
+Все данные создаются внутри транзакции, которая в конце откатывается.
+"""
+import time
+import uuid
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from shop.models import Cart, CartItem, Product, User
+from shop.services import place_order
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Показывает число запросов и время оформления заказа в зависимости от размера корзины'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100, 500])
+
+    def handle(self, *args, **options):
+        sizes = options['sizes']
+        try:
+            with transaction.atomic():
+                self._run(sizes)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, sizes):
+        products = Product.objects.bulk_create([
+            Product(
+                name=f'Бенчмарк-товар {i}',
+                slug=f'bench-checkout-{uuid.uuid4().hex}',
+                description='Синтетический товар для бенчмарка',
+                price=Decimal('499.00'),
+                image='products/bench.jpg',
+            )
+            for i in range(max(sizes))
+        ])
+        for size in sizes:
+            user = User.objects.create_user(email=f'bench-{uuid.uuid4().hex}@test.local')
+            cart = Cart.objects.create(user=user)
+            CartItem.objects.bulk_create([
+                CartItem(cart=cart, product=product, quantity=2, price=product.price)
+                for product in products[:size]
+            ])
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                place_order(user, uuid.uuid4())
+                elapsed = (time.perf_counter() - started) * 1000
+            self.stdout.write(
+                f'Позиций в корзине: {size:>5}  запросов: {len(queries):>2}  время: {elapsed:.2f} мс'
+            )
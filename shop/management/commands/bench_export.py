@@ -0,0 +1,121 @@
+"""
+Бенчмарк выгрузки заказов: скорость и пиковая память при экспорте
+большого числа позиций (по умолчанию 1 000 000).
+
+Синтетические заказы создаются внутри транзакции, которая в конце
+откатывается, поэтому команду можно запускать на рабочей базе.
+Команда завершается ошибкой, если рост памяти процесса за время выгрузки
+превысил --max-rss-mb: выгрузка должна идти потоком, а не собираться в памяти.
+"""
+import gc
+import os
+import random
+import resource
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from shop import exports
+from shop.models import Order, OrderItem, Product, User
+
+LINES_PER_ORDER = 5
+
+
+class _Rollback(Exception):
+    pass
+
+
+def current_rss():
+    """Текущий размер резидентной памяти процесса в байтах."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        # Не Linux: пиковое значение (в КБ на Linux, в байтах на macOS)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Command(BaseCommand):
+    help = 'Измеряет скорость и память потоковой выгрузки заказов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=1_000_000)
+        parser.add_argument('--format', choices=exports.FORMATS, default='csv')
+        parser.add_argument('--chunk-size', type=int, default=exports.CHUNK_SIZE)
+        parser.add_argument('--max-rss-mb', type=float, default=64,
+                            help='Допустимый рост памяти за время выгрузки')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        try:
+            with transaction.atomic():
+                self._seed(options['lines'])
+                growth = self._run(options['format'], options['chunk_size'])
+                raise _Rollback
+        except _Rollback:
+            pass
+        limit = options['max_rss_mb']
+        if growth > limit:
+            raise CommandError(f'Рост памяти при выгрузке {growth:.1f} МБ превышает {limit} МБ')
+        self.stdout.write(self.style.SUCCESS(f'Рост памяти в пределах {limit} МБ.'))
+
+    def _seed(self, lines):
+        self.stdout.write(f'Создаём {lines} синтетических позиций заказов...')
+        users = User.objects.bulk_create([
+            User(email=f'bench-export-{i}@example.com', password='!') for i in range(1000)
+        ])
+        products = Product.objects.bulk_create([
+            Product(name=f'Товар {i}', slug=f'bench-export-{i}', description='',
+                    price=Decimal(random.randint(100, 100000)), image='products/bench.jpg')
+            for i in range(500)
+        ])
+        statuses = [code for code, _ in Order.STATUS_CHOICES]
+        remaining = lines
+        while remaining > 0:
+            batch = min(remaining, 5000)
+            orders = Order.objects.bulk_create([
+                Order(user=random.choice(users), status=random.choice(statuses), total_amount=Decimal('0'))
+                for _ in range(-(-batch // LINES_PER_ORDER))
+            ])
+            items = []
+            for index in range(batch):
+                product = random.choice(products)
+                items.append(OrderItem(
+                    order=orders[index // LINES_PER_ORDER],
+                    product=product,
+                    product_name=product.name,
+                    product_slug=product.slug,
+                    quantity=random.randint(1, 5),
+                    price=product.price,
+                ))
+            OrderItem.objects.bulk_create(items)
+            remaining -= batch
+
+    def _run(self, fmt, chunk_size):
+        gc.collect()
+        baseline = peak = current_rss()
+        rows = 0
+        size = 0
+        started = time.perf_counter()
+        with open(os.devnull, 'w', encoding='utf-8') as output:
+            for line in exports.stream(exports.export_rows(chunk_size=chunk_size), fmt):
+                output.write(line)
+                size += len(line)
+                rows += 1
+                if rows % 10_000 == 0:
+                    peak = max(peak, current_rss())
+        peak = max(peak, current_rss())
+        elapsed = time.perf_counter() - started
+        growth = (peak - baseline) / 2 ** 20
+        self.stdout.write(
+            f'Выгружено строк: {rows} ({size / 2 ** 20:.0f} МБ {fmt}) за {elapsed:.1f} с, '
+            f'{rows / elapsed:.0f} строк/с'
+        )
+        self.stdout.write(
+            f'Память: до выгрузки {baseline / 2 ** 20:.0f} МБ, пик {peak / 2 ** 20:.0f} МБ, '
+            f'рост {growth:.1f} МБ'
+        )
+        return growth
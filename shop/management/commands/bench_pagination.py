@@ -0,0 +1,94 @@
+"""
+Бенчмарк пагинации каталога: классический Paginator (COUNT + OFFSET)
+против курсорной пагинации по (created_at, id).
+
+Синтетические товары создаются внутри транзакции, которая в конце
+откатывается, поэтому команду можно запускать на рабочей базе.
+"""
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.db import transaction
+
+from shop.models import Product
+from shop.pagination import KeysetPaginator, encode_cursor
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает задержку страниц каталога для OFFSET и курсорной пагинации'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--per-page', type=int, default=12)
+        parser.add_argument('--pages', type=int, nargs='+', default=[1, 5000],
+                            help='Номера страниц для замера')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        per_page = options['per_page']
+        pages = options['pages']
+        needed = per_page * max(pages)
+        try:
+            with transaction.atomic():
+                self._seed(needed)
+                self._run(per_page, pages, options['repeat'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _seed(self, count):
+        existing = Product.objects.filter(is_active=True).count()
+        missing = max(count - existing, 0)
+        self.stdout.write(f'Создаём {missing} синтетических товаров...')
+        batch = [
+            Product(
+                name=f'Бенчмарк-товар {i}',
+                slug=f'bench-product-{i}',
+                description='Синтетический товар для бенчмарка',
+                price=Decimal('1000.00'),
+                image='products/bench.jpg',
+            )
+            for i in range(missing)
+        ]
+        Product.objects.bulk_create(batch, batch_size=2000)
+
+    def _run(self, per_page, pages, repeat):
+        queryset = Product.objects.filter(is_active=True)
+        keyset = KeysetPaginator(queryset, per_page)
+        ordered = keyset.queryset
+
+        for number in pages:
+            def offset_page():
+                return list(Paginator(queryset, per_page).get_page(number))
+
+            # Курсор на конец предыдущей страницы считаем заранее: пользователь
+            # получил бы его из ссылки «Следующая», это не часть замера
+            token = None
+            if number > 1:
+                last = ordered.values('created_at', 'id')[(number - 1) * per_page - 1]
+                token = encode_cursor(last['created_at'], last['id'])
+
+            def keyset_page():
+                return list(keyset.get_page(token))
+
+            assert [p.id for p in offset_page()] == [p.id for p in keyset_page()]
+            self.stdout.write(
+                f'Страница {number}: '
+                f'OFFSET {self._measure(offset_page, repeat):.2f} мс, '
+                f'cursor {self._measure(keyset_page, repeat):.2f} мс'
+            )
+
+    @staticmethod
+    def _measure(func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
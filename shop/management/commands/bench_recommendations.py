@@ -0,0 +1,110 @@
+"""
+Бенчмарк построения матрицы совместных покупок: время и рост памяти
+recommendations.rebuild() на большом числе позиций (по умолчанию 5 000 000).
+
+Синтетические заказы создаются внутри транзакции, которая в конце
+откатывается, поэтому команду можно запускать на рабочей базе. Популярность
+товаров распределена по закону Ципфа, как в настоящем каталоге.
+Команда завершается ошибкой, если рост памяти превысил --max-rss-mb:
+позиции должны обрабатываться пачками, а не собираться в памяти.
+"""
+import gc
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from shop import recommendations
+from shop.management.commands.bench_export import current_rss
+from shop.models import Order, OrderItem, Product, ProductPair, User
+
+LINES_PER_ORDER = 5
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Измеряет время и память построения рекомендаций «часто покупают вместе»'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=5_000_000)
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--max-rss-mb', type=float, default=256,
+                            help='Допустимый рост памяти за время построения')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        backend = 'NumPy/SciPy' if recommendations.sparse is not None else 'чистый Python'
+        self.stdout.write(f'Подсчёт пар: {backend}')
+        try:
+            with transaction.atomic():
+                self._seed(options['lines'], options['products'])
+                growth = self._run()
+                raise _Rollback
+        except _Rollback:
+            pass
+        limit = options['max_rss_mb']
+        if growth > limit:
+            raise CommandError(f'Рост памяти при построении {growth:.1f} МБ превышает {limit} МБ')
+        self.stdout.write(self.style.SUCCESS(f'Рост памяти в пределах {limit} МБ.'))
+
+    def _seed(self, lines, product_count):
+        self.stdout.write(f'Создаём {lines} синтетических позиций заказов...')
+        users = User.objects.bulk_create([
+            User(email=f'bench-recs-{i}@example.com', password='!') for i in range(1000)
+        ])
+        products = Product.objects.bulk_create([
+            Product(name=f'Товар {i}', slug=f'bench-recs-{i}', description='',
+                    price=Decimal(random.randint(100, 100000)), image='products/bench.jpg')
+            for i in range(product_count)
+        ])
+        # Закон Ципфа: вес товара обратно пропорционален его месту
+        weights = list(accumulate(1 / rank for rank in range(1, product_count + 1)))
+        remaining = lines
+        while remaining > 0:
+            batch = min(remaining, 5000)
+            orders = Order.objects.bulk_create([
+                Order(user=random.choice(users), total_amount=Decimal('0'))
+                for _ in range(-(-batch // LINES_PER_ORDER))
+            ])
+            items = []
+            for index in range(batch):
+                product = random.choices(products, cum_weights=weights)[0]
+                items.append(OrderItem(
+                    order=orders[index // LINES_PER_ORDER],
+                    product=product,
+                    product_name=product.name,
+                    product_slug=product.slug,
+                    quantity=1,
+                    price=product.price,
+                ))
+            OrderItem.objects.bulk_create(items)
+            remaining -= batch
+        # Пересчёт не берёт заказы моложе REFRESH_LAG
+        Order.objects.update(created_at=timezone.now() - timedelta(days=1))
+
+    def _run(self):
+        gc.collect()
+        baseline = current_rss()
+        started = time.perf_counter()
+        products = recommendations.rebuild()
+        elapsed = time.perf_counter() - started
+        peak = current_rss()
+        growth = (peak - baseline) / 2 ** 20
+        self.stdout.write(
+            f'Матрица построена за {elapsed:.1f} с: пар {ProductPair.objects.count() // 2}, '
+            f'товаров с рекомендациями {products}'
+        )
+        self.stdout.write(
+            f'Память: до построения {baseline / 2 ** 20:.0f} МБ, после {peak / 2 ** 20:.0f} МБ, '
+            f'рост {growth:.1f} МБ'
+        )
+        return growth
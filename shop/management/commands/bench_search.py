@@ -0,0 +1,104 @@
+"""
+Бенчмарк поиска по каталогу: полнотекстовый поиск из shop/search.py
+против icontains (ILIKE '%...%') по названию и описанию.
+
+Синтетический каталог создаётся внутри транзакции, которая в конце
+откатывается, поэтому команду можно запускать на рабочей базе.
+"""
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+
+from shop import search
+from shop.models import Product
+
+BRANDS = ['Xiaomi', 'Samsung', 'Apple', 'Honor', 'Realme', 'ASUS', 'Acer', 'Lenovo', 'HP', 'Dell']
+KINDS = ['Смартфон', 'Ноутбук', 'Планшет', 'Наушники', 'Телевизор', 'Монитор']
+WORDS = [
+    'экран', 'камера', 'аккумулятор', 'процессор', 'память', 'быстрая', 'зарядка',
+    'корпус', 'металлический', 'лёгкий', 'яркий', 'дисплей', 'звук', 'игровой',
+    'беспроводной', 'защита', 'влаги', 'подсветка', 'клавиатура', 'тонкий',
+]
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает полнотекстовый поиск с icontains на синтетическом каталоге'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=200_000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--queries', nargs='+', default=['смартфон xiaomi', 'ноут', 'беспроводной звук'])
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        try:
+            with transaction.atomic():
+                self._seed(options['products'])
+                self._run(options['queries'], options['repeat'])
+                raise _Rollback
+        except _Rollback:
+            pass
+        search.invalidate_index()
+
+    def _seed(self, count):
+        self.stdout.write(f'Создаём {count} синтетических товаров...')
+        batch = []
+        for i in range(count):
+            name = f'{random.choice(KINDS)} {random.choice(BRANDS)} модель {i}'
+            batch.append(Product(
+                name=name,
+                slug=f'bench-search-{i}',
+                description=' '.join(random.choices(WORDS, k=30)),
+                price=Decimal(random.randint(1000, 200000)),
+                image='products/bench.jpg',
+            ))
+            if len(batch) == 5000:
+                Product.objects.bulk_create(batch)
+                batch = []
+        Product.objects.bulk_create(batch)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE shop_product')
+        # Резервный индекс строится при первом запросе; строим заранее
+        search.invalidate_index()
+        if connection.vendor != 'postgresql':
+            started = time.perf_counter()
+            search.get_backend().get_index()
+            self.stdout.write(f'Построение индекса в памяти: {(time.perf_counter() - started) * 1000:.0f} мс')
+
+    def _run(self, queries, repeat):
+        active = Product.objects.filter(is_active=True)
+        self.stdout.write(f'Поиск: {type(search.get_backend()).__name__}')
+        for text in queries:
+            def full_text():
+                return list(search.search_products(text).values_list('id', flat=True)[:12])
+
+            def icontains():
+                condition = Q()
+                for term in text.split():
+                    condition &= Q(name__icontains=term) | Q(description__icontains=term)
+                return list(active.filter(condition).values_list('id', flat=True)[:12])
+
+            self.stdout.write(
+                f'«{text}»: полнотекстовый {self._measure(full_text, repeat):.2f} мс, '
+                f'icontains {self._measure(icontains, repeat):.2f} мс'
+            )
+
+    @staticmethod
+    def _measure(func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
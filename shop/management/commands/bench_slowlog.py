@@ -0,0 +1,75 @@
+"""
+Бенчмарк накладных расходов журнала медленных запросов (см. shop/slowlog.py)
+на быстрых запросах — тех, что в журнал не попадают.
+
+Одни и те же запросы выполняются попеременно без обработчика журнала и с ним,
+по --rounds раз; для каждого варианта берётся лучший раунд, чтобы отсечь
+шум планировщика. Меряются простейший SQL через курсор (худший случай:
+своей работы у запроса почти нет) и типичный запрос ORM по первичному ключу.
+Команда завершается ошибкой, если журнал добавляет к быстрому запросу
+больше --max-overhead-us микросекунд.
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from shop import slowlog
+from shop.models import Product
+
+
+def _raw_query():
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT %s', [1])
+        cursor.fetchone()
+
+
+def _orm_query():
+    Product.objects.filter(pk=0).first()
+
+
+class Command(BaseCommand):
+    help = 'Измеряет накладные расходы журнала медленных запросов на быстрых запросах'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=20_000,
+                            help='Запросов в каждом раунде')
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument('--max-overhead-us', type=float, default=10,
+                            help='Допустимая добавка к одному быстрому запросу, мкс')
+
+    def handle(self, *args, **options):
+        queries = options['queries']
+        queued = slowlog._queue.qsize()
+        worst = 0.0
+        for name, query in (('SQL через курсор', _raw_query), ('ORM по первичному ключу', _orm_query)):
+            plain = logged = float('inf')
+            for _ in range(options['rounds']):
+                plain = min(plain, self._measure(query, queries, logged=False))
+                logged = min(logged, self._measure(query, queries, logged=True))
+            overhead = (logged - plain) * 1e6
+            worst = max(worst, overhead)
+            self.stdout.write(
+                f'{name}: без журнала {plain * 1e6:.1f} мкс, с журналом {logged * 1e6:.1f} мкс '
+                f'на запрос ({overhead:+.2f} мкс, {overhead / (plain * 1e6):+.1%})'
+            )
+        if slowlog._queue.qsize() != queued:
+            raise CommandError('Быстрые запросы попали в журнал медленных запросов')
+        limit = options['max_overhead_us']
+        if worst > limit:
+            raise CommandError(f'Накладные расходы {worst:.2f} мкс на запрос превышают {limit} мкс')
+        self.stdout.write(self.style.SUCCESS(f'Накладные расходы в пределах {limit} мкс на запрос.'))
+
+    @staticmethod
+    def _measure(query, count, logged):
+        """Среднее время одного запроса в секундах."""
+        if logged:
+            with slowlog.log_slow_queries(label='bench'):
+                started = time.perf_counter()
+                for _ in range(count):
+                    query()
+                return (time.perf_counter() - started) / count
+        started = time.perf_counter()
+        for _ in range(count):
+            query()
+        return (time.perf_counter() - started) / count
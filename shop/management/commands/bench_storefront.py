@@ -0,0 +1,157 @@
+"""
+Нагрузочный бенчмарк витрины (см. shop/loadtest.py): задержки p50/p95/p99,
+пропускная способность и число SQL-запросов на каждом шаге сценария
+покупки при --users одновременных виртуальных пользователях.
+
+Цель прогона (--target):
+
+* client — тестовый клиент Django в этом процессе;
+* wsgi — встроенный многопоточный WSGI-сервер на свободном порту;
+* --url — внешний сервер (gunicorn, uvicorn и т. п.) с той же базой.
+
+Синтетические данные записываются в базу и удаляются в конце прогона
+(кроме --keep-data), поэтому запускайте бенчмарк на отдельной базе —
+SQLite или локальном PostgreSQL. С --json результаты сохраняются в файл
+для сравнения между коммитами; --compare печатает изменение задержек
+относительно такого файла.
+"""
+import datetime
+import json
+import subprocess
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from shop import loadtest
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _format(value, digits=1):
+    return '—' if value is None else f'{value:.{digits}f}'
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный прогон сценария покупки с задержками по шагам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--customers', type=int, default=100,
+                            help='Покупателей в синтетических данных')
+        parser.add_argument('--orders', type=int, default=5000,
+                            help='Прошлых заказов в синтетических данных')
+        parser.add_argument('--users', type=int, default=8,
+                            help='Одновременных виртуальных пользователей')
+        parser.add_argument('--iterations', type=int, default=20,
+                            help='Повторов сценария на виртуального пользователя')
+        parser.add_argument('--warmup', type=int, default=1,
+                            help='Неучитываемых повторов перед замером')
+        parser.add_argument('--target', choices=['client', 'wsgi'], default='client')
+        parser.add_argument('--url', help='Адрес внешнего сервера вместо --target')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--json', help='Сохранить результаты в файл JSON')
+        parser.add_argument('--compare', help='Сравнить с результатами из файла JSON')
+        parser.add_argument('--keep-data', action='store_true',
+                            help='Не удалять синтетические данные после прогона')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as source:
+                baseline = json.load(source)
+        target = 'url' if options['url'] else options['target']
+
+        # Остатки прерванного прогона
+        loadtest.cleanup()
+        self.stdout.write(
+            f'Создаём данные: товаров {options["products"]}, покупателей {options["customers"]}, '
+            f'заказов {options["orders"]}...'
+        )
+        data = loadtest.seed(options['products'], options['customers'], options['orders'], options['seed'])
+        server = None
+        try:
+            if target == 'client':
+                factory = loadtest.ClientSession
+            else:
+                url = options['url']
+                if target == 'wsgi':
+                    server, url = loadtest.serve_wsgi()
+                factory = lambda email: loadtest.HttpSession(url, email)  # noqa: E731
+            self.stdout.write(
+                f'Прогон: цель {target}, пользователей {options["users"]}, '
+                f'повторов {options["iterations"]}...'
+            )
+            # Адреса тестового клиента и встроенного сервера
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver', '127.0.0.1']):
+                stats, elapsed = loadtest.run(data, factory, options['users'], options['iterations'],
+                                              options['warmup'], options['seed'])
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+            if not options['keep_data']:
+                loadtest.cleanup(since=data.started)
+
+        results = self._results(options, target, stats, elapsed)
+        self._report(results, baseline)
+        if options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as output:
+                json.dump(results, output, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Результаты сохранены в {options["json"]}')
+        errors = sum(step['errors'] for step in results['steps'].values())
+        if errors:
+            raise CommandError(f'Ошибок при прогоне: {errors}')
+
+    def _results(self, options, target, stats, elapsed):
+        requests = sum(len(step.latencies) for step in stats.values())
+        return {
+            'commit': _git_commit(),
+            'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'target': target,
+            'dataset': {key: options[key] for key in ('products', 'customers', 'orders', 'seed')},
+            'users': options['users'],
+            'iterations': options['iterations'],
+            'duration_s': round(elapsed, 3),
+            'requests': requests,
+            'throughput_rps': round(requests / elapsed, 1) if elapsed else None,
+            'flows_per_s': round(options['users'] * options['iterations'] / elapsed, 2) if elapsed else None,
+            'steps': {name: step.summary() for name, step in stats.items()},
+        }
+
+    def _report(self, results, baseline):
+        self.stdout.write(
+            f'{"Шаг":<16}{"запросов":>9}{"ошибок":>8}{"p50, мс":>9}{"p95, мс":>9}{"p99, мс":>9}'
+            f'{"SQL ср.":>9}{"SQL макс":>9}'
+        )
+        for name, step in results['steps'].items():
+            line = (
+                f'{name:<16}{step["requests"]:>9}{step["errors"]:>8}{_format(step["p50_ms"]):>9}'
+                f'{_format(step["p95_ms"]):>9}{_format(step["p99_ms"]):>9}'
+                f'{_format(step["queries_avg"]):>9}{_format(step["queries_max"], 0):>9}'
+            )
+            old = (baseline or {}).get('steps', {}).get(name)
+            if old and old.get('p95_ms') and step['p95_ms'] is not None:
+                line += f'  p95 {step["p95_ms"] / old["p95_ms"] - 1:+.0%}'
+                if step['queries_max'] is not None and old.get('queries_max') is not None:
+                    line += f', SQL {step["queries_max"] - old["queries_max"]:+d}'
+            self.stdout.write(line)
+        self.stdout.write(
+            f'Всего запросов: {results["requests"]} за {results["duration_s"]:.1f} с, '
+            f'{results["throughput_rps"]} запросов/с, {results["flows_per_s"]} сценариев/с'
+        )
+        if baseline:
+            self.stdout.write(
+                f'Базовый прогон: коммит {baseline.get("commit") or "—"}, '
+                f'{baseline.get("throughput_rps")} запросов/с'
+            )
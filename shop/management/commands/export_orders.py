@@ -0,0 +1,47 @@
+"""
+Выгрузка заказов с позициями и email покупателя в CSV или JSONL.
+
+Примеры:
+    python manage.py export_orders --date-from 2026-10-01 --date-to 2026-10-01 -o orders.csv
+    python manage.py export_orders --format jsonl --status delivered > delivered.jsonl
+"""
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from shop import exports
+from shop.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Потоково выгружает заказы и их позиции в CSV/JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=exports.FORMATS, default='csv')
+        parser.add_argument('--date-from', type=datetime.date.fromisoformat,
+                            help='Заказы, созданные с этой даты включительно (ГГГГ-ММ-ДД)')
+        parser.add_argument('--date-to', type=datetime.date.fromisoformat,
+                            help='Заказы, созданные по эту дату включительно (ГГГГ-ММ-ДД)')
+        parser.add_argument('--status', action='append', choices=[code for code, _ in Order.STATUS_CHOICES],
+                            help='Статус заказа; можно указать несколько раз')
+        parser.add_argument('-o', '--output', help='Файл выгрузки (по умолчанию — stdout)')
+        parser.add_argument('--chunk-size', type=int, default=exports.CHUNK_SIZE,
+                            help='Сколько строк читать из базы за раз')
+
+    def handle(self, *args, **options):
+        orders = exports.filter_orders(
+            Order.objects.all(), options['date_from'], options['date_to'], options['status'],
+        )
+        lines = exports.stream(exports.export_rows(orders, options['chunk_size']), options['format'])
+        if options['output']:
+            count = 0
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                for line in lines:
+                    output.write(line)
+                    count += 1
+            if options['format'] == 'csv':
+                count -= 1  # заголовок
+            self.stderr.write(f'Выгружено строк: {count}')
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
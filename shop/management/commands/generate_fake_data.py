@@ -0,0 +1,75 @@
+"""
+Наполняет базу синтетическими данными для нагрузочного тестирования
+(см. shop/fakedata.py): пользователи, товары, корзины и заказы
+с реалистичными распределениями.
+
+На PostgreSQL строки вставляются через COPY в --workers процессов;
+10 млн позиций заказов (--orders 5000000) создаются за минуты. На SQLite
+работает один процесс. При одном --seed данные воспроизводимы.
+После генерации пересчитываются сводки продаж и сбрасывается кэш каталога.
+
+Пароль всех созданных пользователей — shop.fakedata.FAKE_PASSWORD.
+"""
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop import analytics, cache, fakedata
+
+
+class Command(BaseCommand):
+    help = 'Создаёт синтетических пользователей, товары, корзины и заказы'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100_000)
+        parser.add_argument('--products', type=int, default=50_000)
+        parser.add_argument('--orders', type=int, default=500_000,
+                            help='Заказов; позиций в среднем около двух на заказ')
+        parser.add_argument('--carts', type=int, default=10_000,
+                            help='Непустых корзин (не больше --users)')
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--days', type=int, default=365,
+                            help='За сколько последних дней распределить заказы')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Процессов для вставки (на SQLite всегда один)')
+        parser.add_argument('--no-copy', action='store_true',
+                            help='INSERT пачками вместо COPY на PostgreSQL')
+        parser.add_argument('--skip-rollups', action='store_true',
+                            help='Не пересчитывать сводки продаж')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        started = time.perf_counter()
+        try:
+            totals = fakedata.generate(
+                users=options['users'],
+                products=options['products'],
+                orders=options['orders'],
+                carts=options['carts'],
+                categories=options['categories'],
+                days=options['days'],
+                seed=options['seed'],
+                workers=options['workers'],
+                use_copy=not options['no_copy'],
+                progress=self._progress,
+            )
+        except ValueError as exc:
+            raise CommandError(exc)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано за {elapsed:.1f} с: пользователей {totals["users"]}, товаров {totals["products"]}, '
+            f'заказов {totals["orders"]} (позиций {totals["order_lines"]}), '
+            f'корзин {totals["carts"]} (позиций {totals["cart_lines"]}); '
+            f'{totals["order_lines"] / elapsed:.0f} позиций заказов/с'
+        ))
+        if not options['skip_rollups'] and totals['orders']:
+            self.stdout.write('Пересчёт сводок продаж...')
+            analytics.rebuild()
+        cache.invalidate_catalog()
+        self.stdout.write('Рекомендации: manage.py refresh_recommendations --rebuild')
+
+    def _progress(self, kind, rows):
+        if self.verbosity >= 2:
+            self.stdout.write(f'  {kind}: {rows}')
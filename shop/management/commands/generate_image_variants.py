@@ -0,0 +1,69 @@
+"""
+Создаёт уменьшенные копии фотографий для уже существующих товаров.
+
+Декодирование, ресайз и кодирование изображений нагружают процессор, поэтому
+фотографии обрабатываются параллельно в пуле процессов; база обновляется
+пачками из основного процесса.
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+
+from shop import cache
+from shop.images import render_variants, variant_widths
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Создаёт WebP/JPEG-варианты фотографий товаров заданных ширин'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Число процессов (по умолчанию — по числу ядер)')
+        parser.add_argument('--force', action='store_true',
+                            help='Пересоздать варианты и для товаров, где они уже есть')
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        widths = variant_widths()
+        products = Product.objects.exclude(image='')
+        if not options['force']:
+            products = products.filter(image_variants=[])
+
+        jobs = {}
+        for product in products.only('id', 'image').iterator():
+            if product.image.storage.exists(product.image.name):
+                jobs[product.id] = product.image.path
+            else:
+                self.stderr.write(f'Файл не найден для товара #{product.id}: {product.image.name}')
+        if not jobs:
+            self.stdout.write('Нет фотографий для обработки.')
+            return
+
+        started = time.perf_counter()
+        done = []
+        errors = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {pool.submit(render_variants, path, widths): pk for pk, path in jobs.items()}
+            for future in as_completed(futures):
+                pk = futures[future]
+                try:
+                    done.append(Product(id=pk, image_variants=future.result()))
+                except Exception as exc:
+                    # Повреждённый файл или «бомба» распаковки (Image.DecompressionBombError)
+                    # не прерывает обработку остальных фотографий
+                    errors += 1
+                    self.stderr.write(f'Ошибка обработки фотографии товара #{pk}: {exc}')
+                if len(done) >= options['batch_size']:
+                    Product.objects.bulk_update(done, ['image_variants'])
+                    done = []
+        Product.objects.bulk_update(done, ['image_variants'])
+        cache.invalidate_catalog()
+
+        elapsed = time.perf_counter() - started
+        processed = len(jobs) - errors
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано фотографий: {processed}, ошибок: {errors}, '
+            f'время: {elapsed:.1f} с ({processed / elapsed:.1f} фото/с)'
+        ))
@@ -0,0 +1,49 @@
+"""
+Импорт каталога товаров из CSV или JSONL.
+
+Примеры:
+    python manage.py import_catalog feed.jsonl --images-dir /data/feed/images
+    python manage.py import_catalog feed.csv --dry-run
+    python manage.py import_catalog feed.csv --offset 250000
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.catalog_import import CatalogImporter, CatalogImportError, read_records
+
+
+class Command(BaseCommand):
+    help = 'Потоково импортирует товары из CSV/JSONL с upsert по slug'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл каталога (.csv или .jsonl)')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default=None,
+                            help='Формат файла, если он не следует из расширения')
+        parser.add_argument('--images-dir', default=None,
+                            help='Каталог, относительно которого указаны фотографии')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Число потоков для копирования фотографий')
+        parser.add_argument('--offset', type=int, default=0,
+                            help='Пропустить первые N записей (продолжение прерванного импорта)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только проверить записи, ничего не сохраняя')
+
+    def handle(self, *args, **options):
+        importer = CatalogImporter(
+            images_dir=options['images_dir'],
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            dry_run=options['dry_run'],
+            log=self.stdout.write,
+        )
+        try:
+            stats = importer.run(read_records(options['path'], options['format']), offset=options['offset'])
+        except (OSError, CatalogImportError, ValueError) as exc:
+            raise CommandError(f'Ошибка импорта: {exc}')
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('Пробный запуск: изменения не сохранены.'))
+        if stats['errors']:
+            self.stdout.write(self.style.WARNING(f'Пропущено записей с ошибками: {stats["errors"]}'))
+        self.stdout.write(self.style.SUCCESS('Импорт завершён.'))
+        if stats['images_copied']:
+            self.stdout.write('Для новых фотографий запустите generate_image_variants.')
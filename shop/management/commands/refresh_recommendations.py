@@ -0,0 +1,30 @@
+"""
+Пересчёт рекомендаций «часто покупают вместе» (см. shop/recommendations.py).
+
+Запускается по расписанию (например, cron раз в несколько минут) и учитывает
+только заказы, оформленные после прошлого запуска. С --rebuild матрица
+совместных покупок строится заново по всем заказам.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Обновляет рекомендации «часто покупают вместе» по новым заказам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Пересчитать по всем заказам, а не только по новым')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['rebuild']:
+            products = recommendations.rebuild()
+        else:
+            products = recommendations.refresh()
+        self.stdout.write(self.style.SUCCESS(
+            f'Рекомендации обновлены для товаров: {products}, {time.perf_counter() - started:.1f} с'
+        ))
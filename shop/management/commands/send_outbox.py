@@ -0,0 +1,58 @@
+"""
+Обработчик очереди писем: отправляет письма из OutboxEmail.
+
+Работает постоянно (например, как отдельный systemd-сервис) или
+с --once разбирает накопившуюся очередь и завершается (для cron).
+Все пачки отправляются через одно SMTP-соединение.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.mail import OutboxSender
+
+
+class Command(BaseCommand):
+    help = 'Отправляет письма из очереди пачками через одно SMTP-соединение'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Отправить всё, что готово к отправке, и завершиться')
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Пауза (с) между проверками пустой очереди')
+
+    def handle(self, *args, **options):
+        sender = OutboxSender(batch_size=options['batch_size'])
+        totals = {'sent': 0, 'failed': 0, 'dead': 0}
+        try:
+            while True:
+                try:
+                    stats = sender.send_batch()
+                except Exception as exc:
+                    # SMTP-сервер недоступен: письма остаются в очереди
+                    self.stderr.write(f'Не удалось подключиться к SMTP-серверу: {exc}')
+                    sender.close()
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+                    continue
+                for key, value in stats.items():
+                    totals[key] += value
+                if sum(stats.values()) >= sender.batch_size:
+                    # Пачка полная — в очереди, вероятно, есть ещё
+                    continue
+                if options['once']:
+                    break
+                # Пока очередь пуста, соединение не держим: сервер
+                # всё равно закроет его по таймауту простоя
+                sender.close()
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sender.close()
+        self.stdout.write(
+            f'Отправлено: {totals["sent"]}, ошибок: {totals["failed"]}, '
+            f'не доставлено: {totals["dead"]}'
+        )
@@ -0,0 +1,65 @@
+"""
+Сводка журнала медленных запросов (см. shop/slowlog.py): самые затратные
+запросы за последние --hours часов, сгруппированные по отпечатку SQL.
+
+Для каждого запроса выводятся число записей, суммарное, среднее
+и наибольшее время, представления, из которых он выполнялся, и стек
+вызовов последней записи; с --plans — последний сохранённый план EXPLAIN.
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Avg, Count, Max, Sum
+from django.utils import timezone
+
+from shop.models import SlowQuery
+from shop.profiling import fingerprint
+
+SQL_PREVIEW = 300
+
+
+class Command(BaseCommand):
+    help = 'Показывает самые затратные медленные SQL-запросы'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=24,
+                            help='За сколько последних часов строить сводку')
+        parser.add_argument('--top', type=int, default=10)
+        parser.add_argument('--view', help='Только запросы этого представления (имя URL)')
+        parser.add_argument('--plans', action='store_true', help='Показать планы EXPLAIN')
+
+    def handle(self, *args, **options):
+        entries = SlowQuery.objects.filter(created_at__gte=timezone.now() - timedelta(hours=options['hours']))
+        if options['view']:
+            entries = entries.filter(view=options['view'])
+        top = list(
+            entries.values('fingerprint')
+            .annotate(count=Count('id'), total=Sum('duration_ms'), avg=Avg('duration_ms'), max=Max('duration_ms'))
+            .order_by('-total')[:options['top']]
+        )
+        if not top:
+            self.stdout.write('Медленных запросов нет.')
+            return
+        views = {}
+        for row in (
+            entries.filter(fingerprint__in=[row['fingerprint'] for row in top])
+            .values('fingerprint', 'view').annotate(count=Count('id')).order_by('-count')
+        ):
+            views.setdefault(row['fingerprint'], []).append(f'{row["view"] or "—"} ({row["count"]})')
+
+        for number, row in enumerate(top, 1):
+            group = entries.filter(fingerprint=row['fingerprint']).order_by('-id')
+            latest = group.first()
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{number}. {row["count"]} раз, всего {row["total"]:.0f} мс, '
+                f'в среднем {row["avg"]:.0f} мс, максимум {row["max"]:.0f} мс'
+            ))
+            self.stdout.write(f'   Представления: {", ".join(views.get(row["fingerprint"], []))}')
+            self.stdout.write(f'   {fingerprint(latest.sql)[:SQL_PREVIEW]}')
+            for line in latest.stack.splitlines():
+                self.stdout.write(f'     {line}')
+            if options['plans']:
+                plan = group.exclude(plan='').values_list('plan', flat=True).first()
+                self.stdout.write('   План:' if plan else '   План: не сохранён')
+                for line in (plan or '').splitlines():
+                    self.stdout.write(f'     {line}')
@@ -0,0 +1,55 @@
+"""
+Массовый перевод заказов в следующий статус одним UPDATE.
+
+Примеры:
+    python manage.py transition_orders ready --ids 101 102 103
+    python manage.py transition_orders in_assembly --created-before 2026-10-01
+    python manage.py transition_orders delivered --all --dry-run
+"""
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop import services
+from shop.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Переводит выбранные заказы в новый статус одним запросом'
+
+    def add_arguments(self, parser):
+        parser.add_argument('status', choices=list(Order.STATUS_TRANSITIONS),
+                            help='Новый статус заказов')
+        parser.add_argument('--ids', type=int, nargs='+', help='Номера заказов')
+        parser.add_argument('--user-email', help='Только заказы этого покупателя')
+        parser.add_argument('--created-after', type=datetime.date.fromisoformat,
+                            help='Только заказы, созданные с этой даты (ГГГГ-ММ-ДД)')
+        parser.add_argument('--created-before', type=datetime.date.fromisoformat,
+                            help='Только заказы, созданные до этой даты (не включая её)')
+        parser.add_argument('--all', action='store_true',
+                            help='Перевести все заказы в подходящем статусе')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только посчитать заказы, которые будут переведены')
+
+    def handle(self, *args, **options):
+        orders = Order.objects.all()
+        if options['ids']:
+            orders = orders.filter(id__in=options['ids'])
+        if options['user_email']:
+            orders = orders.filter(user__email=options['user_email'])
+        if options['created_after']:
+            orders = orders.filter(created_at__date__gte=options['created_after'])
+        if options['created_before']:
+            orders = orders.filter(created_at__date__lt=options['created_before'])
+        if not orders.query.where and not options['all']:
+            raise CommandError('Укажите фильтр (--ids, --user-email, --created-after/--created-before) или --all.')
+
+        status = options['status']
+        if options['dry_run']:
+            count = orders.filter(status__in=Order.STATUS_TRANSITIONS[status]).count()
+            self.stdout.write(f'Будет переведено заказов: {count}')
+            return
+        moved = services.transition_orders(orders, status)
+        self.stdout.write(self.style.SUCCESS(
+            f'Переведено в статус «{dict(Order.STATUS_CHOICES)[status]}»: {moved}'
+        ))
@@ -0,0 +1,310 @@
+"""
+Метрики в текстовом формате Prometheus для эндпоинта /metrics.
+
+Счётчики и гистограммы обновляются без блокировок: у каждого потока свой
+словарь значений (threading.local), а при выдаче /metrics словари всех
+потоков складываются. Блокировка берётся один раз — при первой записи
+нового потока. Под ASGI каждый запрос может выполняться в новом потоке,
+поэтому значения завершившихся потоков переносятся в общий итог процесса,
+а их словари забываются — при появлении нового потока и при выдаче метрик.
+
+По умолчанию значения видны только процессу, который отвечает на запрос
+/metrics. Для нескольких воркеров gunicorn задайте METRICS_MULTIPROCESS_DIR:
+каждый процесс не чаще раза в METRICS_FLUSH_INTERVAL секунд (и при выходе)
+записывает свои значения в файл <pid>.json в этом каталоге, а /metrics
+складывает файлы всех процессов. Каталог нужно очищать при перезапуске
+сервиса, иначе значения остановленных воркеров будут учитываться и дальше.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Границы гистограмм по умолчанию, как в клиентских библиотеках Prometheus
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REGISTRY = {}
+
+_local = threading.local()
+_shards = []  # (поток, его словарь значений)
+_retired = {}  # значения завершившихся потоков
+_shards_lock = threading.Lock()
+_last_flush = 0.0
+
+
+def _merge(total, values):
+    for key, value in values.items():
+        metric = REGISTRY.get(key[0])
+        if metric is not None:
+            total[key] = metric.merge(total.get(key), value)
+
+
+def _retire_finished():
+    """Переносит значения завершившихся потоков в _retired; вызывается под _shards_lock."""
+    alive = []
+    for thread, values in _shards:
+        if thread.is_alive():
+            alive.append((thread, values))
+        else:
+            # Поток завершился и больше не пишет в свой словарь
+            _merge(_retired, values)
+    _shards[:] = alive
+
+
+def _values():
+    """Словарь значений текущего потока: {(метрика, значения меток): значение}."""
+    try:
+        return _local.values
+    except AttributeError:
+        values = _local.values = {}
+        with _shards_lock:
+            _retire_finished()
+            _shards.append((threading.current_thread(), values))
+        return values
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY[name] = self
+
+    def _key(self, labels):
+        return self.name, tuple(str(labels[name]) for name in self.labelnames)
+
+
+class Counter(Metric):
+    """Монотонный счётчик; имя по соглашению Prometheus оканчивается на _total."""
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        values = _values()
+        key = self._key(labels)
+        values[key] = values.get(key, 0) + amount
+
+    @staticmethod
+    def merge(total, value):
+        return (total or 0) + value
+
+    def samples(self, labels, value):
+        yield self.name, labels, value
+
+
+class Histogram(Metric):
+    """Гистограмма: число наблюдений по корзинам, их сумма и количество."""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        values = _values()
+        key = self._key(labels)
+        data = values.get(key)
+        if data is None:
+            # Наблюдения по корзинам (последняя — +Inf) и сумма наблюдений
+            data = values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        data[bisect_left(self.buckets, value)] += 1
+        data[-1] += value
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    @staticmethod
+    def merge(total, value):
+        if total is None:
+            return list(value)
+        return [a + b for a, b in zip(total, value)]
+
+    def samples(self, labels, value):
+        cumulative = 0
+        for bound, count in zip((*self.buckets, float('inf')), value):
+            cumulative += count
+            yield f'{self.name}_bucket', (*labels, ('le', _format_value(bound))), cumulative
+        yield f'{self.name}_sum', labels, value[-1]
+        yield f'{self.name}_count', labels, cumulative
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+def _format_value(value):
+    value = float(value)
+    if value == float('inf'):
+        return '+Inf'
+    if value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def snapshot():
+    """Значения всех потоков процесса: {(метрика, значения меток): значение}."""
+    merged = {}
+    with _shards_lock:
+        _retire_finished()
+        _merge(merged, _retired)
+        shards = [values for _, values in _shards]
+    for shard in shards:
+        # dict() копирует словарь целиком под GIL, даже если поток пишет в него
+        _merge(merged, dict(shard))
+    return merged
+
+
+def multiprocess_dir():
+    return getattr(settings, 'METRICS_MULTIPROCESS_DIR', None)
+
+
+def flush(force=False):
+    """В многопроцессном режиме записывает значения процесса в его файл."""
+    global _last_flush
+    directory = multiprocess_dir()
+    if not directory:
+        return
+    now = time.monotonic()
+    if not force and now - _last_flush < getattr(settings, 'METRICS_FLUSH_INTERVAL', 5):
+        return
+    _last_flush = now
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{os.getpid()}.json')
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as output:
+        json.dump([[name, labels, value] for (name, labels), value in snapshot().items()], output)
+    # Читатели видят либо старый файл, либо новый целиком
+    os.replace(tmp_path, path)
+
+
+atexit.register(flush, force=True)
+
+
+def _collect():
+    directory = multiprocess_dir()
+    if not directory:
+        return snapshot()
+    flush(force=True)
+    merged = {}
+    for filename in os.listdir(directory):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, filename), encoding='utf-8') as source:
+                entries = json.load(source)
+        except (OSError, ValueError):
+            continue
+        for name, labels, value in entries:
+            metric = REGISTRY.get(name)
+            if metric is not None:
+                key = (name, tuple(labels))
+                merged[key] = metric.merge(merged.get(key), value)
+    return merged
+
+
+def render():
+    """Все метрики в текстовом формате Prometheus."""
+    values = _collect()
+    by_metric = {}
+    for (name, labels), value in sorted(values.items()):
+        by_metric.setdefault(name, []).append((labels, value))
+    lines = []
+    for metric in REGISTRY.values():
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        for labels, value in by_metric.get(metric.name, []):
+            for sample, sample_labels, sample_value in metric.samples(tuple(zip(metric.labelnames, labels)), value):
+                lines.append(f'{sample}{_format_labels(sample_labels)} {_format_value(sample_value)}')
+    return '\n'.join(lines) + '\n'
+
+
+REQUEST_DURATION = Histogram(
+    'quickcart_request_duration_seconds',
+    'Время обработки запроса по имени URL',
+    ['view', 'method'],
+)
+REQUEST_QUERIES = Histogram(
+    'quickcart_request_db_queries',
+    'Число SQL-запросов на один HTTP-запрос',
+    ['view'],
+    buckets=(1, 2, 3, 5, 8, 13, 21, 50, 100),
+)
+CACHE_REQUESTS = Counter(
+    'quickcart_cache_requests_total',
+    'Обращения к кэшу страниц и фасетов по результату (hit, stale, miss)',
+    ['cache', 'result'],
+)
+CHECKOUTS = Counter(
+    'quickcart_checkouts_total',
+    'Попытки оформления заказа по результату',
+    ['result'],
+)
+CART_MUTATIONS = Counter(
+    'quickcart_cart_mutations_total',
+    'Изменения корзины по действию',
+    ['action'],
+)
+EMAIL_SEND_DURATION = Histogram(
+    'quickcart_email_send_duration_seconds',
+    'Время отправки одного письма из очереди',
+    ['result'],
+)
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class MetricsMiddleware:
+    """Время обработки и число SQL-запросов каждого запроса по имени URL."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = _QueryCounter()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        # Неизвестные адреса — одной меткой, чтобы не плодить ряды по каждому URL
+        view = match.view_name if match else 'unmatched'
+        REQUEST_DURATION.observe(time.perf_counter() - started, view=view, method=request.method)
+        REQUEST_QUERIES.observe(counter.count, view=view)
+        flush()
+        return response
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:22
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Триггер поддерживает search_vector при любой вставке или изменении
+# названия/описания, в том числе при массовых операциях мимо ORM.
+CREATE_SEARCH_SQL = """
+CREATE OR REPLACE FUNCTION shop_product_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('russian', coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce(NEW.description, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER shop_product_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, description ON shop_product
+    FOR EACH ROW EXECUTE FUNCTION shop_product_search_vector_update();
+
+UPDATE shop_product SET search_vector =
+    setweight(to_tsvector('russian', coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('russian', coalesce(description, '')), 'B');
+
+CREATE INDEX shop_product_search_vector_gin ON shop_product USING gin (search_vector);
+"""
+
+DROP_SEARCH_SQL = """
+DROP INDEX IF EXISTS shop_product_search_vector_gin;
+DROP TRIGGER IF EXISTS shop_product_search_vector_trigger ON shop_product;
+DROP FUNCTION IF EXISTS shop_product_search_vector_update();
+"""
+
+
+def create_search_objects(apps, schema_editor):
+    # tsvector, триггеры и GIN есть только в PostgreSQL;
+    # на других СУБД работает резервный поиск из shop/search.py
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_SEARCH_SQL)
+
+
+def drop_search_objects(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SEARCH_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0005_order_checkout_token'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_search_objects, drop_search_objects),
+    ]
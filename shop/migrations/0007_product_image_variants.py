@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0006_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=list, editable=False, verbose_name='Варианты фотографии'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:35
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+BATCH_SIZE = 1000
+
+
+def fill_order_summaries(apps, schema_editor):
+    # Заполняем сводку уже оформленных заказов пачками по id
+    Order = apps.get_model('shop', 'Order')
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    last_id = 0
+    while True:
+        ids = list(
+            Order.objects.filter(id__gt=last_id).order_by('id')
+            .values_list('id', flat=True)[:BATCH_SIZE]
+        )
+        if not ids:
+            break
+        items = OrderItem.objects.filter(order_id__in=ids)
+        counts = dict(
+            items.values('order_id').annotate(count=Sum('quantity')).values_list('order_id', 'count')
+        )
+        previews = {}
+        # Идём от последних позиций к первым: в словаре остаётся первая
+        for order_id, image, variants in items.order_by('-id').values_list(
+                'order_id', 'product__image', 'product__image_variants'):
+            previews[order_id] = (image, variants)
+        Order.objects.bulk_update([
+            Order(
+                id=pk,
+                item_count=counts.get(pk, 0),
+                preview_image=previews.get(pk, ('', []))[0],
+                preview_image_variants=previews.get(pk, ('', []))[1],
+            )
+            for pk in ids
+        ], ['item_count', 'preview_image', 'preview_image_variants'])
+        last_id = ids[-1]
+
+
+class Migration(migrations.Migration):
+    # Пачки фиксируются по отдельности, а не одной длинной транзакцией
+    atomic = False
+
+    dependencies = [
+        ('shop', '0009_outboxemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество товаров'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='preview_image',
+            field=models.ImageField(blank=True, editable=False, upload_to='products/', verbose_name='Фото первого товара'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='preview_image_variants',
+            field=models.JSONField(default=list, editable=False, verbose_name='Ширины вариантов фото первого товара'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+        ),
+        migrations.RunPython(fill_order_summaries, migrations.RunPython.noop, elidable=True),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+
+def fill_product_snapshots(apps, schema_editor):
+    # Копируем данные товаров в позиции оформленных заказов пачками по id
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    last_id = 0
+    while True:
+        rows = list(
+            OrderItem.objects.filter(id__gt=last_id, product__isnull=False).order_by('id')
+            .values_list('id', 'product__name', 'product__slug', 'product__image',
+                         'product__image_variants')[:BATCH_SIZE]
+        )
+        if not rows:
+            break
+        OrderItem.objects.bulk_update([
+            OrderItem(id=pk, product_name=name, product_slug=slug,
+                      product_image=image, product_image_variants=variants)
+            for pk, name, slug, image, variants in rows
+        ], ['product_name', 'product_slug', 'product_image', 'product_image_variants'])
+        last_id = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+    # Пачки фиксируются по отдельности, а не одной длинной транзакцией
+    atomic = False
+
+    dependencies = [
+        ('shop', '0010_order_history_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_image',
+            field=models.ImageField(blank=True, editable=False, upload_to='products/', verbose_name='Фотография товара'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_image_variants',
+            field=models.JSONField(default=list, editable=False, verbose_name='Ширины вариантов фотографии'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_name',
+            field=models.CharField(blank=True, editable=False, max_length=200, verbose_name='Название товара'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_slug',
+            field=models.SlugField(blank=True, db_index=False, editable=False, max_length=200, verbose_name='URL товара'),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='product',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='shop.product', verbose_name='Товар'),
+        ),
+        migrations.RunPython(fill_product_snapshots, migrations.RunPython.noop, elidable=True),
+    ]
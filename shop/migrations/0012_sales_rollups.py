@@ -0,0 +1,58 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0011_orderitem_product_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True, verbose_name='Дата')),
+                ('order_count', models.PositiveIntegerField(default=0, verbose_name='Заказов')),
+                ('item_count', models.PositiveIntegerField(default=0, verbose_name='Товаров')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Выручка')),
+            ],
+            options={
+                'verbose_name': 'Продажи за день',
+                'verbose_name_plural': 'Аналитика продаж',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='OrderStatusCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('created', 'Создан'), ('in_assembly', 'В сборке'), ('ready', 'Готов к выдаче'), ('delivered', 'Выдан')], max_length=20, unique=True, verbose_name='Статус')),
+                ('order_count', models.IntegerField(default=0, verbose_name='Заказов')),
+            ],
+            options={
+                'verbose_name': 'Заказы в статусе',
+                'verbose_name_plural': 'Заказы по статусам',
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductDailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('product_name', models.CharField(max_length=200, verbose_name='Название товара')),
+                ('quantity', models.PositiveIntegerField(default=0, verbose_name='Продано штук')),
+                ('order_count', models.PositiveIntegerField(default=0, verbose_name='Заказов')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Выручка')),
+                ('product', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='shop.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Продажи товара за день',
+                'verbose_name_plural': 'Продажи товаров по дням',
+                'constraints': [models.UniqueConstraint(fields=('date', 'product'), name='product_daily_sales_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:02
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0014_catalog_facets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=32, verbose_name='Отпечаток запроса')),
+                ('sql', models.TextField(verbose_name='SQL')),
+                ('view', models.CharField(blank=True, max_length=200, verbose_name='Представление')),
+                ('stack', models.TextField(blank=True, verbose_name='Стек вызовов')),
+                ('stack_fingerprint', models.CharField(blank=True, max_length=12, verbose_name='Отпечаток стека')),
+                ('duration_ms', models.FloatField(verbose_name='Время, мс')),
+                ('plan', models.TextField(blank=True, verbose_name='План (EXPLAIN)')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата')),
+            ],
+            options={
+                'verbose_name': 'Медленный запрос',
+                'verbose_name_plural': 'Медленные запросы',
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['created_at'], name='slow_query_created_idx')],
+            },
+        ),
+    ]
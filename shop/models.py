@@ -1,6 +1,9 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import F, Sum
 from django.contrib.auth.models import AbstractUser, BaseUserManager
-from django.utils.text import slugify
+from django.utils import timezone
+from django.utils.text import Truncator, slugify
 from decimal import Decimal
 
 
@@ -28,6 +31,34 @@ class UserManager(BaseUserManager):
         return self.create_user(email, password, **extra_fields)
 
 
+class LineItemQuerySet(models.QuerySet):
+    """Общие запросы для позиций корзины и заказа."""
+
+    def with_products(self):
+        """Загружает товары позиций тем же запросом (без N+1 в шаблонах)."""
+        return self.select_related('product')
+
+    def total(self):
+        """Считает сумму price * quantity на стороне базы данных."""
+        result = self.aggregate(total=Sum(
+            F('price') * F('quantity'),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        ))['total']
+        return result if result is not None else Decimal('0.00')
+
+
+class ProductQuerySet(models.QuerySet):
+    """Запросы каталога."""
+
+    # Колонки, нужные карточке товара в каталоге и результатах поиска
+    CARD_FIELDS = ('id', 'name', 'slug', 'price', 'image', 'image_variants',
+                   'excerpt', 'is_active', 'created_at')
+
+    def for_cards(self):
+        """Загружает только поля карточки, без полного описания."""
+        return self.only(*self.CARD_FIELDS)
+
+
 class User(AbstractUser):
     """
     Кастомная модель пользователя с логином по email.
@@ -45,6 +76,20 @@ class User(AbstractUser):
         verbose_name_plural = 'Пользователи'
 
 
+class Category(models.Model):
+    """Категория каталога; по ней фильтруется список товаров."""
+    name = models.CharField(max_length=100, verbose_name='Название')
+    slug = models.SlugField(max_length=100, unique=True, verbose_name='URL-адрес')
+
+    class Meta:
+        verbose_name = 'Категория'
+        verbose_name_plural = 'Категории'
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
 class Product(models.Model):
     """
     Модель товара в каталоге магазина.
@@ -77,6 +122,14 @@ class Product(models.Model):
         verbose_name='URL-адрес',
         help_text='Уникальный идентификатор для URL'
     )
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='products',
+        verbose_name='Категория'
+    )
     is_active = models.BooleanField(
         default=True,
         verbose_name='Активен',
@@ -86,19 +139,85 @@ class Product(models.Model):
         auto_now_add=True,
         verbose_name='Дата создания'
     )
+    # Начало описания для карточки в каталоге; пересчитывается в save()
+    excerpt = models.CharField(
+        max_length=300,
+        blank=True,
+        editable=False,
+        verbose_name='Краткое описание'
+    )
+    # Ширины уменьшенных копий фотографии, которые уже созданы (см. shop/images.py)
+    image_variants = models.JSONField(
+        default=list,
+        blank=True,
+        editable=False,
+        verbose_name='Варианты фотографии'
+    )
+    # Поисковый вектор по названию и описанию (конфигурация russian).
+    # В PostgreSQL его заполняет триггер, см. миграцию 0006 и shop/search.py
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор'
+    )
+
+    objects = ProductQuerySet.as_manager()
+
+    # Число слов в кратком описании
+    EXCERPT_WORDS = 15
 
     class Meta:
         verbose_name = 'Товар'
         verbose_name_plural = 'Товары'
         ordering = ['-created_at']
+        indexes = [
+            # Индекс под курсорную пагинацию каталога по (created_at, id)
+            # Индексы каталога частичные (WHERE is_active): фильтр is_active=True
+            # Django выводит как «WHERE is_active», а SQLite не использует для
+            # такого условия составной индекс с ведущей колонкой is_active
+            models.Index(
+                fields=['-created_at', '-id'],
+                condition=models.Q(is_active=True),
+                name='product_active_created_idx',
+            ),
+            # Фильтр и сортировка каталога по цене (shop/catalog.py)
+            models.Index(
+                fields=['price', 'id'],
+                condition=models.Q(is_active=True),
+                name='product_active_price_idx',
+            ),
+            # То же внутри категории
+            models.Index(
+                fields=['category', '-created_at', '-id'],
+                condition=models.Q(is_active=True),
+                name='product_category_created_idx',
+            ),
+            models.Index(
+                fields=['category', 'price', 'id'],
+                condition=models.Q(is_active=True),
+                name='product_category_price_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def make_excerpt(cls, description):
+        """Обрезает описание так же, как фильтр truncatewords."""
+        excerpt = Truncator(description).words(cls.EXCERPT_WORDS, truncate=' …')
+        return excerpt[:cls._meta.get_field('excerpt').max_length]
+
     def save(self, *args, **kwargs):
         # Автоматически создаём slug из названия, если он не указан
         if not self.slug:
             self.slug = slugify(self.name)
+        # Краткое описание считаем один раз при сохранении, а не при каждом рендере
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'description' in update_fields:
+            self.excerpt = self.make_excerpt(self.description)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'excerpt'}
         super().save(*args, **kwargs)
 
 
@@ -131,7 +250,7 @@ class Cart(models.Model):
 
     def get_total(self):
         """Рассчитывает общую стоимость всех товаров в корзине."""
-        return sum(item.get_subtotal() for item in self.items.all())
+        return self.items.total()
 
 
 class CartItem(models.Model):
@@ -162,6 +281,8 @@ class CartItem(models.Model):
         verbose_name='Цена на момент добавления'
     )
 
+    objects = LineItemQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Позиция в корзине'
         verbose_name_plural = 'Позиции в корзине'
@@ -191,6 +312,12 @@ class Order(models.Model):
         (STATUS_READY, 'Готов к выдаче'),
         (STATUS_DELIVERED, 'Выдан'),
     ]
+    # Допустимые переходы: новый статус -> статусы, из которых в него переходят
+    STATUS_TRANSITIONS = {
+        STATUS_IN_ASSEMBLY: [STATUS_CREATED],
+        STATUS_READY: [STATUS_IN_ASSEMBLY],
+        STATUS_DELIVERED: [STATUS_READY],
+    }
 
     user = models.ForeignKey(
         User,
@@ -213,11 +340,42 @@ class Order(models.Model):
         auto_now_add=True,
         verbose_name='Дата создания'
     )
+    # Токен формы оформления: повторная отправка той же формы
+    # (двойной клик, повтор запроса) возвращает уже созданный заказ
+    checkout_token = models.UUIDField(
+        null=True,
+        blank=True,
+        unique=True,
+        editable=False,
+        verbose_name='Токен оформления'
+    )
+    # Сводка для истории заказов заполняется при оформлении,
+    # чтобы список заказов не обращался к позициям и товарам
+    item_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество товаров'
+    )
+    preview_image = models.ImageField(
+        upload_to='products/',
+        blank=True,
+        editable=False,
+        verbose_name='Фото первого товара'
+    )
+    preview_image_variants = models.JSONField(
+        default=list,
+        editable=False,
+        verbose_name='Ширины вариантов фото первого товара'
+    )
 
     class Meta:
         verbose_name = 'Заказ'
         verbose_name_plural = 'Заказы'
         ordering = ['-created_at']
+        indexes = [
+            # История заказов: WHERE user_id = ... ORDER BY created_at DESC, id DESC
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+        ]
 
     def __str__(self):
         return f'Заказ #{self.id} от {self.user.email}'
@@ -235,11 +393,39 @@ class OrderItem(models.Model):
         related_name='items',
         verbose_name='Заказ'
     )
+    # Удаление товара из каталога не удаляет позиции оформленных заказов
     product = models.ForeignKey(
         Product,
-        on_delete=models.CASCADE,
+        on_delete=models.SET_NULL,
+        null=True,
         verbose_name='Товар'
     )
+    # Снимок товара на момент оформления: история заказов
+    # отображается без обращения к каталогу
+    product_name = models.CharField(
+        max_length=200,
+        blank=True,
+        editable=False,
+        verbose_name='Название товара'
+    )
+    product_slug = models.SlugField(
+        max_length=200,
+        blank=True,
+        db_index=False,
+        editable=False,
+        verbose_name='URL товара'
+    )
+    product_image = models.ImageField(
+        upload_to='products/',
+        blank=True,
+        editable=False,
+        verbose_name='Фотография товара'
+    )
+    product_image_variants = models.JSONField(
+        default=list,
+        editable=False,
+        verbose_name='Ширины вариантов фотографии'
+    )
     quantity = models.PositiveIntegerField(
         verbose_name='Количество'
     )
@@ -251,13 +437,238 @@ class OrderItem(models.Model):
         verbose_name='Цена на момент оформления'
     )
 
+    objects = LineItemQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Позиция в заказе'
         verbose_name_plural = 'Позиции в заказе'
 
     def __str__(self):
-        return f'{self.product.name} x{self.quantity}'
+        return f'{self.product_name} x{self.quantity}'
 
     def get_subtotal(self):
         """Рассчитывает промежуточную сумму по позиции."""
         return self.price * self.quantity
+
+
+class OutboxEmail(models.Model):
+    """
+    Письмо в очереди на отправку (transactional outbox).
+    Записывается в той же транзакции, что и заказ, и отправляется
+    отдельным процессом: manage.py send_outbox.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_DEAD = 'dead'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Ожидает отправки'),
+        (STATUS_SENT, 'Отправлено'),
+        (STATUS_DEAD, 'Не доставлено'),
+    ]
+
+    recipient = models.EmailField(verbose_name='Получатель')
+    subject = models.CharField(max_length=255, verbose_name='Тема')
+    body = models.TextField(verbose_name='Текст')
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        verbose_name='Статус'
+    )
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Попыток')
+    # Раньше этого времени письмо не отправляется (отсрочка после ошибки)
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='Следующая попытка')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата отправки')
+
+    class Meta:
+        verbose_name = 'Письмо в очереди'
+        verbose_name_plural = 'Очередь писем'
+        ordering = ['next_attempt_at', 'id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} → {self.recipient}'
+
+
+class DailySales(models.Model):
+    """
+    Сводка продаж за день (см. shop/analytics.py).
+    Обновляется при оформлении каждого заказа.
+    """
+    date = models.DateField(unique=True, verbose_name='Дата')
+    order_count = models.PositiveIntegerField(default=0, verbose_name='Заказов')
+    item_count = models.PositiveIntegerField(default=0, verbose_name='Товаров')
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Выручка')
+
+    class Meta:
+        verbose_name = 'Продажи за день'
+        verbose_name_plural = 'Аналитика продаж'
+        ordering = ['-date']
+
+    def __str__(self):
+        return f'{self.date}: {self.revenue} ₽'
+
+
+class ProductDailySales(models.Model):
+    """
+    Продажи товара за день. Ссылка на товар без внешнего ключа в базе:
+    статистика удалённых товаров сохраняется вместе с их названием.
+    """
+    date = models.DateField(verbose_name='Дата')
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+',
+        verbose_name='Товар'
+    )
+    product_name = models.CharField(max_length=200, verbose_name='Название товара')
+    quantity = models.PositiveIntegerField(default=0, verbose_name='Продано штук')
+    order_count = models.PositiveIntegerField(default=0, verbose_name='Заказов')
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Выручка')
+
+    class Meta:
+        verbose_name = 'Продажи товара за день'
+        verbose_name_plural = 'Продажи товаров по дням'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product'], name='product_daily_sales_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.date}: {self.product_name} x{self.quantity}'
+
+
+class OrderStatusCount(models.Model):
+    """Число заказов в каждом статусе."""
+    status = models.CharField(
+        max_length=20,
+        choices=Order.STATUS_CHOICES,
+        unique=True,
+        verbose_name='Статус'
+    )
+    # Без CHECK >= 0: до первой пересборки (rebuild_sales_rollups) на базе
+    # со старыми заказами уменьшение счётчика может увести его в минус
+    order_count = models.IntegerField(default=0, verbose_name='Заказов')
+
+    class Meta:
+        verbose_name = 'Заказы в статусе'
+        verbose_name_plural = 'Заказы по статусам'
+
+    def __str__(self):
+        return f'{self.get_status_display()}: {self.order_count}'
+
+
+class ProductPair(models.Model):
+    """
+    Сколько раз два товара встретились в одном заказе (см. shop/recommendations.py).
+    Каждая пара хранится в обе стороны, чтобы соседей товара можно было
+    выбрать по одному полю. Ссылки без внешних ключей в базе, как у сводок продаж.
+    """
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,  # покрыт уникальным индексом (product, other)
+        related_name='+',
+        verbose_name='Товар'
+    )
+    other = models.ForeignKey(
+        Product,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        related_name='+',
+        verbose_name='Купленный вместе'
+    )
+    order_count = models.PositiveIntegerField(default=0, verbose_name='Заказов')
+
+    class Meta:
+        verbose_name = 'Пара товаров'
+        verbose_name_plural = 'Пары товаров'
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'other'], name='product_pair_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} + {self.other_id}: {self.order_count}'
+
+
+class ProductRecommendation(models.Model):
+    """
+    Готовая рекомендация «часто покупают вместе»: первые N соседей товара
+    по числу совместных заказов. Страница товара читает их одним запросом
+    по уникальному индексу (product, rank).
+    """
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        db_index=False,  # покрыт уникальным индексом (product, rank)
+        related_name='+',
+        verbose_name='Товар'
+    )
+    recommended = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='recommended_for',
+        verbose_name='Рекомендуемый товар'
+    )
+    rank = models.PositiveSmallIntegerField(verbose_name='Место')
+    order_count = models.PositiveIntegerField(verbose_name='Совместных заказов')
+
+    class Meta:
+        verbose_name = 'Рекомендация'
+        verbose_name_plural = 'Рекомендации'
+        ordering = ['product', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='product_recommendation_rank_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} → {self.recommended_id} (#{self.rank})'
+
+
+class RecommendationState(models.Model):
+    """
+    Состояние пересчёта рекомендаций (одна строка): до какого заказа
+    совместные покупки уже учтены в ProductPair.
+    """
+    last_order_id = models.BigIntegerField(default=0, verbose_name='Последний учтённый заказ')
+    updated_at = models.DateTimeField(null=True, blank=True, verbose_name='Обновлено')
+
+    class Meta:
+        verbose_name = 'Состояние рекомендаций'
+        verbose_name_plural = 'Состояние рекомендаций'
+
+    def __str__(self):
+        return f'Учтены заказы до #{self.last_order_id}'
+
+
+class SlowQuery(models.Model):
+    """
+    Медленный SQL-запрос из журнала медленных запросов (см. shop/slowlog.py).
+    Записывается фоновым потоком, а не в транзакции запроса.
+    """
+    fingerprint = models.CharField(max_length=32, verbose_name='Отпечаток запроса')
+    sql = models.TextField(verbose_name='SQL')
+    view = models.CharField(max_length=200, blank=True, verbose_name='Представление')
+    # Вызовы кода проекта, которые привели к запросу, и их хэш
+    stack = models.TextField(blank=True, verbose_name='Стек вызовов')
+    stack_fingerprint = models.CharField(max_length=12, blank=True, verbose_name='Отпечаток стека')
+    duration_ms = models.FloatField(verbose_name='Время, мс')
+    plan = models.TextField(blank=True, verbose_name='План (EXPLAIN)')
+    created_at = models.DateTimeField(default=timezone.now, verbose_name='Дата')
+
+    class Meta:
+        verbose_name = 'Медленный запрос'
+        verbose_name_plural = 'Медленные запросы'
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['created_at'], name='slow_query_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.duration_ms:.0f} мс: {self.sql[:80]}'
@@ -0,0 +1,185 @@
+"""
+Курсорная (keyset) пагинация для каталога и истории заказов.
+
+В отличие от стандартного Paginator не выполняет COUNT(*) и не использует
+OFFSET: каждая страница выбирается по условию (created_at, id) < курсор
+(или по другому ключу сортировки, например цене), поэтому глубокие страницы
+открываются так же быстро, как первая.
+
+Для списков административной панели — EstimatedCountPaginator с оценкой
+числа строк вместо точного COUNT(*).
+"""
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(Exception):
+    """Курсор повреждён или подделан."""
+
+
+def encode_cursor(value, pk, direction='next', key='created_at'):
+    """Упаковывает позицию в непрозрачный токен для URL."""
+    data = {'c': value.isoformat() if hasattr(value, 'isoformat') else str(value), 'i': pk, 'd': direction}
+    # Ключ записывается, только если это не created_at: старые ссылки остаются рабочими
+    if key != 'created_at':
+        data['k'] = key
+    payload = json.dumps(data, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, key='created_at', parse=parse_datetime):
+    """
+    Распаковывает токен, возвращает (значение ключа, id, direction).
+    Курсор, выданный для другого ключа сортировки, считается недействительным.
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value = parse(data['c'])
+        pk = int(data['i'])
+        direction = data.get('d', 'next')
+        token_key = data.get('k', 'created_at')
+    except (binascii.Error, ValueError, TypeError, KeyError, UnicodeDecodeError, ValidationError):
+        raise InvalidCursor(token)
+    if value is None or direction not in ('next', 'prev') or token_key != key:
+        raise InvalidCursor(token)
+    return value, pk, direction
+
+
+class KeysetPage:
+    """
+    Страница курсорной пагинации.
+    Повторяет часть интерфейса django.core.paginator.Page, нужную шаблонам.
+    """
+    is_keyset = True
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Пагинатор по ключу (key, id). По умолчанию — (created_at, id) в порядке
+    убывания, что совпадает с Meta.ordering товаров и заказов.
+    """
+
+    def __init__(self, queryset, per_page, key='created_at', descending=True):
+        self.key = key
+        self.descending = descending
+        self.field = queryset.model._meta.get_field(key)
+        sign = '-' if descending else ''
+        self.queryset = queryset.order_by(f'{sign}{key}', f'{sign}id')
+        self.per_page = per_page
+
+    def get_page(self, token=None):
+        """Возвращает страницу по токену; без токена — первую страницу."""
+        if not token:
+            return self._page_after(None)
+        value, pk, direction = decode_cursor(token, self.key, self.field.to_python)
+        if direction == 'prev':
+            return self._page_before(value, pk)
+        return self._page_after((value, pk))
+
+    def _cursor(self, obj, direction):
+        return encode_cursor(getattr(obj, self.key), obj.id, direction, self.key)
+
+    def _beyond(self, value, pk, forward):
+        """Условие «дальше позиции» в порядке страниц (forward) или в обратном."""
+        lookup = 'lt' if self.descending == forward else 'gt'
+        return Q(**{f'{self.key}__{lookup}': value}) | Q(**{self.key: value, f'id__{lookup}': pk})
+
+    def _page_after(self, position):
+        queryset = self.queryset
+        if position is not None:
+            queryset = queryset.filter(self._beyond(*position, forward=True))
+        # Берём на одну запись больше, чтобы узнать, есть ли следующая страница
+        rows = list(queryset[:self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        next_cursor = None
+        previous_cursor = None
+        if rows and has_next:
+            next_cursor = self._cursor(rows[-1], 'next')
+        if rows and position is not None:
+            previous_cursor = self._cursor(rows[0], 'prev')
+        return KeysetPage(rows, next_cursor, previous_cursor)
+
+    def _page_before(self, value, pk):
+        queryset = self.queryset.filter(self._beyond(value, pk, forward=False)).reverse()
+        rows = list(queryset[:self.per_page + 1])
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        rows.reverse()
+        next_cursor = None
+        previous_cursor = None
+        if rows:
+            next_cursor = self._cursor(rows[-1], 'next')
+            if has_previous:
+                previous_cursor = self._cursor(rows[0], 'prev')
+        return KeysetPage(rows, next_cursor, previous_cursor)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator для больших таблиц PostgreSQL.
+
+    COUNT(*) по таблице с миллионами строк читает её целиком, поэтому
+    для нефильтрованной выборки число строк берётся из статистики
+    планировщика (pg_class.reltuples), если таблица достаточно велика.
+    Оценка неточна на доли процента — для номеров страниц этого хватает.
+    Отфильтрованные выборки и другие СУБД считаются точно.
+    """
+    # Меньшие таблицы дёшево посчитать точно
+    ESTIMATE_THRESHOLD = 100_000
+
+    @cached_property
+    def count(self):
+        estimate = self.estimate()
+        if estimate is not None and estimate >= self.ESTIMATE_THRESHOLD:
+            return estimate
+        return super().count
+
+    def estimate(self):
+        """Оценка числа строк таблицы или None, если её нельзя использовать."""
+        queryset = self.object_list
+        query = getattr(queryset, 'query', None)
+        if query is None or query.where or query.distinct:
+            return None
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        # -1 — таблицу ещё не анализировали (PostgreSQL 14+)
+        if row is None or row[0] < 0:
+            return None
+        return row[0]
@@ -0,0 +1,284 @@
+"""
+Профилирование запросов: время обработки, запросы к базе и рендер шаблонов
+по каждому представлению.
+
+ProfilingMiddleware (включается настройкой REQUEST_PROFILING, по умолчанию
+равной DEBUG) для каждого запроса записывает:
+
+* полное время обработки;
+* число и суммарное время SQL-запросов (через connection.execute_wrapper);
+* повторяющиеся запросы — одинаковые с точностью до параметров
+  («отпечаток»). REQUEST_PROFILING_REPEAT_THRESHOLD и более повторов
+  в одном запросе — признак N+1, например item.product в цикле шаблона;
+* время рендера шаблонов (через бэкенд ProfilingTemplates).
+
+В режиме DEBUG итоги отдаются в заголовках Server-Timing, X-Query-Count
+и X-Repeated-Queries, а сводка по представлениям видна сотрудникам
+на странице shop:profiling_report. Сводка хранится в памяти процесса.
+
+Время ответа считается до возврата ответа из представления: содержимое
+потоковых ответов (StreamingHttpResponse) в него не входит. SQL-запросы,
+выполненные при рендере шаблона, входят и во время базы, и во время шаблонов.
+
+Для тестов — QueryBudgetMixin.assertQueryBudget: проверяет бюджет запросов
+представления и отсутствие повторяющихся запросов.
+"""
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+
+# Сколько разных повторяющихся запросов помнить для каждого представления
+MAX_REPEATED_PER_VIEW = 20
+
+_current = ContextVar('request_profile', default=None)
+
+_FINGERPRINT_RULES = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(...)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def fingerprint(sql):
+    """SQL без конкретных значений: строки, числа и списки IN (...) заменены."""
+    for pattern, replacement in _FINGERPRINT_RULES:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def profiling_enabled():
+    return getattr(settings, 'REQUEST_PROFILING', settings.DEBUG)
+
+
+def repeat_threshold():
+    return getattr(settings, 'REQUEST_PROFILING_REPEAT_THRESHOLD', 3)
+
+
+class RequestProfile:
+    """Замеры одного запроса."""
+
+    def __init__(self):
+        self.view = None
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.queries = []  # (sql, время в секундах)
+        self.template_time = 0.0
+        self._template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+    @contextmanager
+    def rendering(self):
+        """Учитывает время рендера; вложенные рендеры не считаются дважды."""
+        self._template_depth += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._template_depth -= 1
+            if not self._template_depth:
+                self.template_time += time.perf_counter() - started
+
+    def finish(self, request):
+        self.duration = time.perf_counter() - self.started
+        match = getattr(request, 'resolver_match', None)
+        self.view = match.view_name if match else None
+
+    @property
+    def query_count(self):
+        return len(self.queries)
+
+    @property
+    def db_time(self):
+        return sum(duration for _, duration in self.queries)
+
+    def repeated(self, threshold=None):
+        """{отпечаток: число повторов} для запросов, повторённых threshold и более раз."""
+        if threshold is None:
+            threshold = repeat_threshold()
+        counts = Counter(fingerprint(sql) for sql, _ in self.queries)
+        return {sql: count for sql, count in counts.items() if count >= threshold}
+
+    def server_timing(self):
+        return (
+            f'total;dur={self.duration * 1000:.1f}, '
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.query_count} queries", '
+            f'tpl;dur={self.template_time * 1000:.1f}'
+        )
+
+
+class ViewStats:
+    """Сводка замеров одного представления."""
+
+    def __init__(self, view):
+        self.view = view
+        self.requests = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.total_queries = 0
+        self.max_queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.repeated = {}  # отпечаток -> наибольшее число повторов за запрос
+
+    def add(self, profile, repeated):
+        self.requests += 1
+        self.total_time += profile.duration
+        self.max_time = max(self.max_time, profile.duration)
+        self.total_queries += profile.query_count
+        self.max_queries = max(self.max_queries, profile.query_count)
+        self.db_time += profile.db_time
+        self.template_time += profile.template_time
+        for sql, count in repeated.items():
+            if sql in self.repeated or len(self.repeated) < MAX_REPEATED_PER_VIEW:
+                self.repeated[sql] = max(self.repeated.get(sql, 0), count)
+
+    # Средние и максимумы для отчёта; время — в миллисекундах
+
+    @property
+    def avg_ms(self):
+        return self.total_time * 1000 / self.requests
+
+    @property
+    def max_ms(self):
+        return self.max_time * 1000
+
+    @property
+    def avg_queries(self):
+        return self.total_queries / self.requests
+
+    @property
+    def avg_db_ms(self):
+        return self.db_time * 1000 / self.requests
+
+    @property
+    def avg_template_ms(self):
+        return self.template_time * 1000 / self.requests
+
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def record(profile, repeated):
+    with _stats_lock:
+        stats = _stats.get(profile.view)
+        if stats is None:
+            stats = _stats[profile.view] = ViewStats(profile.view)
+        stats.add(profile, repeated)
+
+
+def report():
+    """Сводка по представлениям, самые затратные по суммарному времени — первыми."""
+    with _stats_lock:
+        return sorted(_stats.values(), key=lambda stats: stats.total_time, reverse=True)
+
+
+def reset():
+    with _stats_lock:
+        _stats.clear()
+
+
+class ProfilingMiddleware:
+    """Замеряет каждый запрос, если включена настройка REQUEST_PROFILING."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not profiling_enabled():
+            return self.get_response(request)
+        profile = RequestProfile()
+        token = _current.set(profile)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        profile.finish(request)
+        repeated = profile.repeated()
+        if profile.view is not None:
+            record(profile, repeated)
+        if settings.DEBUG:
+            response['Server-Timing'] = profile.server_timing()
+            response['X-Query-Count'] = str(profile.query_count)
+            if repeated:
+                response['X-Repeated-Queries'] = str(len(repeated))
+        # Для QueryBudgetMixin: тестовый клиент возвращает этот же объект
+        response.profile = profile
+        return response
+
+
+class _ProfiledTemplate:
+    """Шаблон бэкенда, который учитывает время рендера в текущем RequestProfile."""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        profile = _current.get()
+        if profile is None:
+            return self.template.render(context, request)
+        with profile.rendering():
+            return self.template.render(context, request)
+
+
+class ProfilingTemplates(DjangoTemplates):
+    """
+    Бэкенд шаблонов Django с замером времени рендера для ProfilingMiddleware.
+    Вне профилируемого запроса ведёт себя как обычный DjangoTemplates.
+    """
+
+    def from_string(self, template_code):
+        return _ProfiledTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _ProfiledTemplate(super().get_template(template_name))
+
+
+class QueryBudgetMixin:
+    """
+    Примесь к TestCase: assertQueryBudget выполняет запрос тестовым клиентом
+    с включённым профилированием и проверяет, что представление уложилось
+    в бюджет запросов к базе и не повторяет одинаковые запросы (N+1).
+    """
+
+    def assertQueryBudget(self, url, max_queries, *, method='get', data=None,
+                          max_repeated=0, **extra):
+        with self.settings(REQUEST_PROFILING=True):
+            response = getattr(self.client, method)(url, data, **extra)
+        profile = response.profile
+        repeated = profile.repeated()
+        problems = []
+        if profile.query_count > max_queries:
+            problems.append(
+                f'{profile.view or url}: {profile.query_count} запросов к базе, бюджет {max_queries}'
+            )
+        if len(repeated) > max_repeated:
+            problems.append(f'{profile.view or url}: повторяющиеся запросы (N+1):')
+            problems.extend(f'  {count} раз: {sql}' for sql, count in repeated.items())
+        if problems:
+            problems.append('Запросы:')
+            problems.extend(f'  {sql}' for sql, _ in profile.queries)
+            self.fail('\n'.join(problems))
+        return response
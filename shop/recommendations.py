@@ -0,0 +1,220 @@
+"""
+Рекомендации «часто покупают вместе» по совместным покупкам.
+
+Матрица совместной встречаемости товаров строится по позициям заказов
+(OrderItem, сгруппированным по order_id) и хранится в ProductPair. Позиции
+читаются потоком, пачками по CHUNK_ORDERS заказов: пары каждой пачки
+считаются отдельно и прибавляются к счётчикам в базе. Поэтому память
+ограничена размером пачки, а не числом позиций.
+
+Если установлены NumPy и SciPy, пары пачки считаются векторно: по пачке
+строится разреженная матрица «заказ × товар» X, и X.T @ X даёт число
+совместных заказов для каждой пары. Без них используется чистый Python
+(itertools.combinations по корзине) — медленнее, но с тем же результатом.
+
+refresh() учитывает только новые заказы (после RecommendationState.last_order_id)
+и пересчитывает первые N соседей (ProductRecommendation) лишь для товаров,
+у которых изменились счётчики. rebuild() строит всё заново.
+"""
+import logging
+from collections import Counter
+from datetime import timedelta
+from itertools import combinations, groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from . import cache
+from .db import increment
+from .models import Order, OrderItem, Product, ProductPair, ProductRecommendation, RecommendationState
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # без NumPy/SciPy пары считаются на чистом Python
+    np = sparse = None
+
+logger = logging.getLogger(__name__)
+
+CHUNK_ORDERS = 20_000
+TOP_PRODUCTS_BATCH = 500
+
+# Заказы моложе этого не учитываются: транзакция оформления, начатая
+# раньше, может зафиксироваться позже заказа с большим id, и такой
+# заказ оказался бы ниже отметки last_order_id навсегда
+REFRESH_LAG = timedelta(minutes=1)
+
+
+def recommendations_count():
+    return getattr(settings, 'RECOMMENDATIONS_PER_PRODUCT', 8)
+
+
+def _python_pairs(lines):
+    """Пары (a, b), a < b, и число их совместных заказов — на чистом Python."""
+    counts = Counter()
+    for _, basket in groupby(lines, key=itemgetter(0)):
+        products = sorted({product_id for _, product_id in basket})
+        counts.update(combinations(products, 2))
+    return counts
+
+
+def _sparse_pairs(lines):
+    """То же, что _python_pairs, но через разреженную матрицу «заказ × товар»."""
+    if not lines:
+        return {}
+    order_ids, product_ids = np.array(lines, dtype=np.int64).T
+    _, rows = np.unique(order_ids, return_inverse=True)
+    products, columns = np.unique(product_ids, return_inverse=True)
+    baskets = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int32), (rows, columns)),
+        shape=(rows.max() + 1, len(products)),
+    )
+    # Один товар несколькими позициями в заказе считается один раз
+    baskets.sum_duplicates()
+    baskets.data[:] = 1
+    together = sparse.triu(baskets.T @ baskets, k=1).tocoo()
+    return dict(zip(
+        zip(products[together.row].tolist(), products[together.col].tolist()),
+        together.data.tolist(),
+    ))
+
+
+def count_pairs(lines):
+    """
+    Совместные покупки по позициям lines — списку (order_id, product_id),
+    упорядоченному по order_id. Возвращает {(a, b): число заказов}, a < b.
+    """
+    if sparse is not None:
+        return _sparse_pairs(lines)
+    return _python_pairs(lines)
+
+
+def _order_lines(orders_after, orders_until=None):
+    lines = OrderItem.objects.filter(order_id__gt=orders_after, product__isnull=False)
+    if orders_until is not None:
+        lines = lines.filter(order_id__lte=orders_until)
+    return lines.order_by('order_id').values_list('order_id', 'product_id')
+
+
+def _chunks(lines):
+    """Делит поток позиций на пачки примерно по CHUNK_ORDERS заказов, не разрывая заказы."""
+    chunk = []
+    orders = 0
+    last_order = None
+    for line in lines.iterator(chunk_size=10_000):
+        if line[0] != last_order:
+            if orders >= CHUNK_ORDERS:
+                yield chunk
+                chunk = []
+                orders = 0
+            last_order = line[0]
+            orders += 1
+        chunk.append(line)
+    if chunk:
+        yield chunk
+
+
+def _accumulate(lines):
+    """Прибавляет совместные покупки позиций lines к ProductPair. Возвращает id затронутых товаров."""
+    touched = set()
+    for chunk in _chunks(lines):
+        rows = {}
+        for (first, second), count in count_pairs(chunk).items():
+            rows[(first, second)] = {'order_count': count}
+            rows[(second, first)] = {'order_count': count}
+            touched.update((first, second))
+        increment(ProductPair, ['product', 'other'], rows)
+    return touched
+
+
+def _update_top(product_ids):
+    """Пересчитывает первые N соседей товаров product_ids одним оконным запросом на пачку."""
+    limit = recommendations_count()
+    product_ids = sorted(product_ids)
+    for start in range(0, len(product_ids), TOP_PRODUCTS_BATCH):
+        batch = product_ids[start:start + TOP_PRODUCTS_BATCH]
+        top = (
+            # Соседи — только существующие активные товары
+            ProductPair.objects.filter(product_id__in=batch, other__is_active=True)
+            .annotate(rank=Window(
+                RowNumber(),
+                partition_by=F('product_id'),
+                order_by=[F('order_count').desc(), F('other_id')],
+            ))
+            .filter(rank__lte=limit)
+            .values_list('product_id', 'other_id', 'rank', 'order_count')
+        )
+        recommendations = [
+            ProductRecommendation(product_id=product_id, recommended_id=other_id,
+                                  rank=rank, order_count=order_count)
+            for product_id, other_id, rank, order_count in top
+        ]
+        ProductRecommendation.objects.filter(product_id__in=batch).delete()
+        ProductRecommendation.objects.bulk_create(recommendations)
+
+
+def _finish(state, last_order_id, touched):
+    # Пары удалённых товаров остаются в ProductPair (там нет внешних ключей),
+    # но рекомендации строятся только для существующих товаров
+    existing = dict(Product.objects.filter(id__in=touched).values_list('id', 'slug'))
+    _update_top(existing)
+    state.last_order_id = last_order_id
+    state.updated_at = timezone.now()
+    state.save()
+    slugs = list(existing.values())
+    transaction.on_commit(lambda: cache.invalidate_products(slugs))
+
+
+def _last_settled_order():
+    return (
+        Order.objects.filter(created_at__lte=timezone.now() - REFRESH_LAG)
+        .order_by('-id').values_list('id', flat=True).first()
+    )
+
+
+def _locked_state():
+    RecommendationState.objects.get_or_create(pk=1)
+    # Блокировка не даёт двум пересчётам учесть одни и те же заказы дважды
+    return RecommendationState.objects.select_for_update().get(pk=1)
+
+
+def refresh():
+    """
+    Учитывает заказы, оформленные после прошлого пересчёта.
+    Возвращает число товаров, у которых обновились рекомендации.
+    """
+    until = _last_settled_order()
+    with transaction.atomic():
+        state = _locked_state()
+        if until is None or until <= state.last_order_id:
+            return 0
+        touched = _accumulate(_order_lines(state.last_order_id, until))
+        _finish(state, until, touched)
+    logger.info('Рекомендации обновлены по заказам до #%s: товаров %s', until, len(touched))
+    return len(touched)
+
+
+def rebuild():
+    """Строит матрицу совместных покупок и рекомендации заново по всем заказам."""
+    until = _last_settled_order() or 0
+    with transaction.atomic():
+        state = _locked_state()
+        ProductPair.objects.all().delete()
+        ProductRecommendation.objects.all().delete()
+        touched = _accumulate(_order_lines(0, until))
+        _finish(state, until, touched)
+    logger.info('Рекомендации пересчитаны по заказам до #%s: товаров %s', until, len(touched))
+    return len(touched)
+
+
+def for_product(product):
+    """Рекомендуемые активные товары для страницы товара — один запрос по индексу (product, rank)."""
+    return (
+        Product.objects.filter(recommended_for__product=product, is_active=True)
+        .for_cards()
+        .order_by('recommended_for__rank')
+    )
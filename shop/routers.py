@@ -0,0 +1,195 @@
+"""
+Маршрутизация запросов к базе: чтение каталога и истории заказов —
+с реплик, всё остальное — с основной базы.
+
+Реплики перечисляются в DATABASE_REPLICAS (псевдонимы из DATABASES). С реплик
+читаются только модели REPLICA_READ_MODELS; записи, SELECT ... FOR UPDATE
+и любые чтения внутри транзакции основной базы идут в основную базу.
+
+Чтение своих записей. Реплика отстаёт от основной базы, поэтому:
+
+* после первой записи в запросе все его чтения идут в основную базу;
+* запрос, который что-то записал (добавление в корзину, оформление
+  заказа и т. п.), ставит cookie, и следующие REPLICA_STICKY_SECONDS секунд
+  все запросы этого посетителя читают из основной базы — он сразу видит
+  свою корзину и новый заказ.
+
+Весь запрос читает с одной и той же реплики.
+
+Отказоустойчивость. Реплика проверяется не чаще раза
+в REPLICA_HEALTH_CHECK_INTERVAL секунд (SELECT 1, а на PostgreSQL — ещё
+и отставание репликации, не больше REPLICA_MAX_LAG_SECONDS). Недоступная
+или отстающая реплика исключается до следующей проверки; если здоровых
+реплик нет, чтение идёт в основную базу.
+
+Миграции применяются только к основной базе: схему на реплики переносит
+репликация. Локальная проверка на двух файлах SQLite:
+
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'replica.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS = ['replica']
+
+после migrate скопируйте db.sqlite3 в replica.sqlite3 — это «репликация»;
+изменения в основной базе не видны в реплике до следующего копирования.
+Так же настраиваются две локальные базы PostgreSQL. TEST.MIRROR
+в тестах направляет реплику в тестовую основную базу.
+"""
+import logging
+import random
+import time
+from contextvars import ContextVar
+
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db import DatabaseError, DEFAULT_DB_ALIAS, connections
+from django.utils.connection import ConnectionDoesNotExist
+
+logger = logging.getLogger(__name__)
+
+STICKY_COOKIE = 'primary_until'
+DEFAULT_READ_MODELS = ['shop.Product', 'shop.Category', 'shop.Order', 'shop.OrderItem']
+
+# Реплика -> (здорова ли, time.monotonic() проверки)
+_health = {}
+_request = ContextVar('replica_routing', default=None)
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def sticky_seconds():
+    return getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+
+
+def _read_models():
+    return getattr(settings, 'REPLICA_READ_MODELS', DEFAULT_READ_MODELS)
+
+
+def _check(alias):
+    """Доступна ли реплика и не слишком ли она отстаёт."""
+    try:
+        connection = connections[alias]
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # На основной базе (не реплике) функция возвращает NULL
+                cursor.execute('SELECT EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())')
+                lag = cursor.fetchone()[0]
+                max_lag = getattr(settings, 'REPLICA_MAX_LAG_SECONDS', 10)
+                if lag is not None and lag > max_lag:
+                    logger.warning('Реплика %s отстаёт на %.1f с', alias, lag)
+                    return False
+            else:
+                cursor.execute('SELECT 1')
+        return True
+    except Exception as exc:
+        # Любая ошибка проверки — повод читать из основной базы
+        logger.warning('Реплика %s недоступна: %s', alias, exc)
+        if not isinstance(exc, ConnectionDoesNotExist):
+            try:
+                connections[alias].close()
+            except DatabaseError:
+                pass
+        return False
+
+
+def healthy_replicas():
+    interval = getattr(settings, 'REPLICA_HEALTH_CHECK_INTERVAL', 5)
+    now = time.monotonic()
+    healthy = []
+    for alias in replicas():
+        status = _health.get(alias)
+        if status is None or now - status[1] >= interval:
+            status = _health[alias] = (_check(alias), now)
+        if status[0]:
+            healthy.append(alias)
+    return healthy
+
+
+def reset_health():
+    _health.clear()
+
+
+def in_primary_transaction():
+    # Транзакция основной базы должна видеть свои же изменения
+    return connections[DEFAULT_DB_ALIAS].in_atomic_block
+
+
+class RequestRouting:
+    """Маршрутизация одного HTTP-запроса."""
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned  # читать из основной базы
+        self.wrote = False
+        self.replica = None
+
+
+class ReplicaRouter:
+    """Чтение REPLICA_READ_MODELS — с реплик, запись и остальное чтение — с основной базы."""
+
+    def db_for_read(self, model, **hints):
+        if not replicas() or model._meta.label not in _read_models():
+            return None
+        # Исторические модели миграций: данные переносятся в той же базе
+        if model._meta.apps is not global_apps:
+            return None
+        state = _request.get()
+        if state is not None and state.pinned:
+            return DEFAULT_DB_ALIAS
+        if in_primary_transaction():
+            return DEFAULT_DB_ALIAS
+        if state is not None and state.replica is not None:
+            return state.replica
+        healthy = healthy_replicas()
+        if not healthy:
+            return DEFAULT_DB_ALIAS
+        replica = random.choice(healthy)
+        if state is not None:
+            state.replica = replica
+        return replica
+
+    def db_for_write(self, model, **hints):
+        state = _request.get()
+        if state is not None:
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replicas():
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Закрепляет запрос за основной базой после записи и на REPLICA_STICKY_SECONDS после неё."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replicas():
+            return self.get_response(request)
+        try:
+            pinned = float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        state = RequestRouting(pinned)
+        token = _request.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request.reset(token)
+        if state.wrote:
+            seconds = sticky_seconds()
+            response.set_cookie(STICKY_COOKIE, f'{time.time() + seconds:.3f}', max_age=seconds,
+                                httponly=True, samesite='Lax')
+        return response
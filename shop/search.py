@@ -0,0 +1,164 @@
+"""
+Полнотекстовый поиск по каталогу.
+
+В PostgreSQL поиск идёт по колонке Product.search_vector (tsvector с
+конфигурацией russian), которую поддерживает триггер, и GIN-индексу
+(см. миграцию 0006). На остальных СУБД (SQLite в тестах и локальной
+разработке) используется простой инвертированный индекс в памяти процесса.
+
+Оба варианта поддерживают префиксный поиск: «смартф» найдёт «смартфон».
+"""
+import bisect
+import re
+import threading
+from collections import defaultdict
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import Case, F, IntegerField, When
+
+from .models import Product
+
+SEARCH_CONFIG = 'russian'
+
+# Сколько результатов возвращает резервный поиск (ранжируется в Python)
+FALLBACK_RESULTS_LIMIT = 1000
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    """Разбивает текст на слова в нижнем регистре."""
+    return WORD_RE.findall(text.lower())
+
+
+class PostgresSearchBackend:
+    """Поиск через to_tsquery по search_vector с ранжированием ts_rank."""
+
+    def build_query(self, text):
+        terms = tokenize(text)
+        if not terms:
+            return None
+        # Все слова обязательны, каждое — как префикс
+        raw = ' & '.join(f'{term}:*' for term in terms)
+        return SearchQuery(raw, search_type='raw', config=SEARCH_CONFIG)
+
+    def filter(self, queryset, text):
+        query = self.build_query(text)
+        if query is None:
+            return queryset.none()
+        return queryset.filter(search_vector=query)
+
+    def search(self, queryset, text):
+        query = self.build_query(text)
+        if query is None:
+            return queryset.none()
+        return (
+            queryset.filter(search_vector=query)
+            .annotate(rank=SearchRank(F('search_vector'), query))
+            .order_by('-rank', '-created_at', '-id')
+        )
+
+
+class InvertedIndex:
+    """
+    Инвертированный индекс: слово -> {id товара: вес}.
+    Слова из названия весят больше, чем слова из описания.
+    """
+    NAME_WEIGHT = 3
+    DESCRIPTION_WEIGHT = 1
+
+    def __init__(self, rows):
+        postings = defaultdict(dict)
+        for pk, name, description in rows:
+            for weight, text in ((self.NAME_WEIGHT, name), (self.DESCRIPTION_WEIGHT, description)):
+                for term in tokenize(text):
+                    postings[term][pk] = postings[term].get(pk, 0) + weight
+        self.postings = dict(postings)
+        self.terms = sorted(self.postings)
+
+    def _prefix_matches(self, prefix):
+        scores = defaultdict(int)
+        start = bisect.bisect_left(self.terms, prefix)
+        for term in self.terms[start:]:
+            if not term.startswith(prefix):
+                break
+            for pk, weight in self.postings[term].items():
+                scores[pk] += weight
+        return scores
+
+    def search(self, text):
+        """Возвращает список (id, score), отсортированный по убыванию score."""
+        terms = tokenize(text)
+        if not terms:
+            return []
+        total = None
+        for term in terms:
+            matches = self._prefix_matches(term)
+            if total is None:
+                total = matches
+            else:
+                total = {pk: total[pk] + score for pk, score in matches.items() if pk in total}
+            if not total:
+                return []
+        return sorted(total.items(), key=lambda item: (-item[1], -item[0]))
+
+
+class InvertedIndexBackend:
+    """Резервный поиск для СУБД без полнотекстового поиска."""
+
+    def __init__(self):
+        self._index = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._index = None
+
+    def get_index(self):
+        index = self._index
+        if index is None:
+            with self._lock:
+                if self._index is None:
+                    rows = Product.objects.values_list('id', 'name', 'description').iterator()
+                    self._index = InvertedIndex(rows)
+                index = self._index
+        return index
+
+    def _ranked_ids(self, text):
+        return [pk for pk, _ in self.get_index().search(text)[:FALLBACK_RESULTS_LIMIT]]
+
+    def filter(self, queryset, text):
+        return queryset.filter(id__in=self._ranked_ids(text))
+
+    def search(self, queryset, text):
+        ids = self._ranked_ids(text)
+        if not ids:
+            return queryset.none()
+        order = Case(
+            *[When(id=pk, then=position) for position, pk in enumerate(ids)],
+            output_field=IntegerField(),
+        )
+        return queryset.filter(id__in=ids).order_by(order)
+
+
+_fallback_backend = InvertedIndexBackend()
+_postgres_backend = PostgresSearchBackend()
+
+
+def get_backend():
+    """Выбирает реализацию поиска по текущей СУБД."""
+    if connection.vendor == 'postgresql':
+        return _postgres_backend
+    return _fallback_backend
+
+
+def search_products(text, queryset=None):
+    """Возвращает товары, подходящие под запрос, в порядке релевантности."""
+    if queryset is None:
+        queryset = Product.objects.filter(is_active=True)
+    return get_backend().search(queryset, text)
+
+
+def invalidate_index():
+    """Сбрасывает резервный индекс после изменения товаров."""
+    _fallback_backend.invalidate()
@@ -0,0 +1,206 @@
+"""
+Операции над корзиной и заказами, общие для представлений и команд.
+"""
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import analytics, events, mail, metrics
+from .models import Cart, CartItem, Order, OrderItem
+
+
+class EmptyCartError(Exception):
+    """В корзине нет товаров для оформления заказа."""
+
+
+class InvalidTransition(ValueError):
+    """В этот статус заказы не переводятся."""
+
+
+def _upsert_cart(cursor, user):
+    """Создаёт корзину пользователя или обновляет её updated_at; возвращает id."""
+    meta = Cart._meta
+    qn = connection.ops.quote_name
+    now = meta.get_field('updated_at').get_db_prep_value(timezone.now(), connection)
+    cursor.execute(
+        f'INSERT INTO {qn(meta.db_table)} ({qn("user_id")}, {qn("created_at")}, {qn("updated_at")}) '
+        f'VALUES (%s, %s, %s) '
+        f'ON CONFLICT ({qn("user_id")}) DO UPDATE SET {qn("updated_at")} = EXCLUDED.{qn("updated_at")} '
+        f'RETURNING {qn("id")}',
+        [user.pk, now, now],
+    )
+    return cursor.fetchone()[0]
+
+
+def _upsert_lines(cursor, cart_id, lines):
+    """
+    Добавляет позиции в корзину одним INSERT ... ON CONFLICT DO UPDATE.
+    lines — список (product_id, quantity, price). Возвращает новые количества.
+    """
+    meta = CartItem._meta
+    qn = connection.ops.quote_name
+    table = qn(meta.db_table)
+    price_field = meta.get_field('price')
+    values = ', '.join(['(%s, %s, %s, %s)'] * len(lines))
+    params = []
+    for product_id, quantity, price in lines:
+        params += [cart_id, product_id, quantity, price_field.get_db_prep_save(price, connection)]
+    cursor.execute(
+        f'INSERT INTO {table} ({qn("cart_id")}, {qn("product_id")}, {qn("quantity")}, {qn("price")}) '
+        f'VALUES {values} '
+        f'ON CONFLICT ({qn("cart_id")}, {qn("product_id")}) DO UPDATE '
+        f'SET {qn("quantity")} = {table}.{qn("quantity")} + EXCLUDED.{qn("quantity")} '
+        f'RETURNING {qn("quantity")}',
+        params,
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def add_to_cart(user, product, quantity=1):
+    """
+    Добавляет товар в корзину или увеличивает его количество.
+
+    Позиция вставляется одним INSERT ... ON CONFLICT DO UPDATE
+    с инкрементом quantity на стороне базы, поэтому одновременные добавления
+    не теряются и не упираются в уникальность (cart, product).
+    bulk_create(update_conflicts=True) умеет только присваивать EXCLUDED,
+    а не прибавлять, поэтому запрос записан явно; он работает
+    и в PostgreSQL, и в SQLite (3.35+).
+
+    Возвращает пару (quantity, created).
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cart_id = _upsert_cart(cursor, user)
+        [new_quantity] = _upsert_lines(cursor, cart_id, [(product.pk, quantity, product.price)])
+    return new_quantity, new_quantity == quantity
+
+
+def add_lines_to_cart(user, lines):
+    """
+    Переносит набор позиций (product_id, quantity, price) в корзину
+    пользователя: два запроса независимо от числа позиций.
+    """
+    if not lines:
+        return
+    with transaction.atomic(), connection.cursor() as cursor:
+        cart_id = _upsert_cart(cursor, user)
+        _upsert_lines(cursor, cart_id, lines)
+
+
+def place_order(user, checkout_token=None):
+    """
+    Оформляет заказ из корзины пользователя за постоянное число запросов.
+
+    Корзина блокируется на время транзакции, сумма пересчитывается внутри неё,
+    позиции заказа вставляются одним INSERT, корзина очищается одним DELETE.
+    Повторный вызов с тем же checkout_token возвращает уже созданный заказ.
+    Подтверждение по почте ставится в очередь в той же транзакции
+    (см. shop/mail.py) и отправляется командой send_outbox.
+
+    Возвращает пару (order, created).
+    """
+    try:
+        order, created = _place_order(user, checkout_token)
+    except EmptyCartError:
+        metrics.CHECKOUTS.inc(result='empty_cart')
+        raise
+    except Exception:
+        metrics.CHECKOUTS.inc(result='error')
+        raise
+    metrics.CHECKOUTS.inc(result='created' if created else 'duplicate')
+    return order, created
+
+
+def _place_order(user, checkout_token):
+    with transaction.atomic():
+        # Блокируем корзину UPDATE-ом: в PostgreSQL это блокировка строки
+        # (как SELECT ... FOR UPDATE), в SQLite — захват блокировки записи
+        # до чтения позиций. Параллельные оформления ждут здесь.
+        Cart.objects.filter(user=user).update(updated_at=timezone.now())
+
+        if checkout_token is not None:
+            existing = Order.objects.filter(user=user, checkout_token=checkout_token).first()
+            if existing is not None:
+                return existing, False
+
+        lines = list(
+            CartItem.objects.filter(cart__user=user).order_by('id')
+            .values_list('id', 'product_id', 'quantity', 'price', 'product__name',
+                         'product__slug', 'product__image', 'product__image_variants', named=True)
+        )
+        if not lines:
+            raise EmptyCartError
+
+        total = sum(line.price * line.quantity for line in lines)
+        order = Order.objects.create(
+            user=user,
+            total_amount=total,
+            checkout_token=checkout_token,
+            # Сводка для истории заказов: число товаров и фото первого из них
+            item_count=sum(line.quantity for line in lines),
+            preview_image=lines[0].product__image,
+            preview_image_variants=lines[0].product__image_variants,
+        )
+        # Фиксируем данные заказа вместе со снимком товара,
+        # чтобы история не зависела от изменений каталога
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product_id=line.product_id,
+                quantity=line.quantity,
+                price=line.price,
+                product_name=line.product__name,
+                product_slug=line.product__slug,
+                product_image=line.product__image,
+                product_image_variants=line.product__image_variants,
+            )
+            for line in lines
+        ])
+        # Удаляем именно оформленные позиции: добавленные после блокировки
+        # в заказ не попали и должны остаться в корзине
+        CartItem.objects.filter(id__in=[line.id for line in lines]).delete()
+        analytics.record_order(order, [
+            (line.product_id, line.product__name, line.quantity, line.price) for line in lines
+        ])
+        # Письмо попадает в очередь только вместе с заказом
+        mail.queue_order_confirmation(order)
+
+    return order, True
+
+
+def transition_orders(orders, status):
+    """
+    Переводит заказы из выборки orders в статус status одним UPDATE
+    на каждый допустимый исходный статус (сейчас он у каждого статуса один).
+
+    Исходный статус (Order.STATUS_TRANSITIONS) проверяется в WHERE,
+    поэтому заказы в других статусах, в том числе изменённые параллельно,
+    не затрагиваются. Уведомления покупателям ставятся в очередь писем
+    в той же транзакции, сводки продаж обновляются там же, события SSE
+    публикуются после фиксации. Возвращает число переведённых заказов.
+    """
+    sources = Order.STATUS_TRANSITIONS.get(status)
+    if not sources:
+        raise InvalidTransition(f'Заказы нельзя перевести в статус «{status}»')
+    meta = Order._meta
+    qn = connection.ops.quote_name
+    selected_sql, selected_params = orders.order_by().values('id').query.sql_with_params()
+    moved = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for source in sources:
+            cursor.execute(
+                f'UPDATE {qn(meta.db_table)} SET {qn("status")} = %s '
+                f'WHERE {qn("id")} IN ({selected_sql}) AND {qn("status")} = %s '
+                f'RETURNING {qn("id")}, {qn("user_id")}',
+                [status, *selected_params, source],
+            )
+            rows = cursor.fetchall()
+            analytics.record_status_change(source, status, len(rows))
+            moved += rows
+        mail.queue_status_emails(moved, status)
+
+        def publish():
+            for order_id, user_id in moved:
+                events.publish_status(order_id, user_id, status)
+        if moved:
+            transaction.on_commit(publish)
+    return len(moved)
@@ -0,0 +1,114 @@
+"""
+Обработчики сигналов моделей магазина.
+"""
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import analytics, cache, events, images, mail, search
+from .models import Category, Order, OrderItem, Product
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(pre_save, sender=Product)
+def remember_old_values(sender, instance, **kwargs):
+    """При замене фотографии запоминает прежнюю и сбрасывает список её вариантов."""
+    instance._stale_image = None
+    if instance.pk:
+        old = (
+            Product.objects.filter(pk=instance.pk)
+            .values_list('image', 'image_variants').first()
+        )
+        if old is not None:
+            old_image, old_variants = old
+            if old_image != instance.image.name:
+                instance._stale_image = (old_image, old_variants)
+                instance.image_variants = []
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_pages(sender, instance, **kwargs):
+    """
+    Сбрасывает кэш страниц и резервный поисковый индекс после изменения товара.
+    Смена поколения каталога сбрасывает и страницы товаров, в том числе
+    по прежнему slug.
+    """
+    cache.invalidate_catalog()
+    search.invalidate_index()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_pages(sender, instance, **kwargs):
+    """Сбрасывает страницы каталога и счётчики фасетов после изменения категории."""
+    cache.invalidate_catalog()
+
+
+def image_in_use(name):
+    """Ссылаются ли на фотографию товары или снимки товаров в заказах."""
+    return (
+        Product.objects.filter(image=name).exists()
+        or OrderItem.objects.filter(product_image=name).exists()
+        or Order.objects.filter(preview_image=name).exists()
+    )
+
+
+@receiver(post_save, sender=Product)
+def generate_image_variants(sender, instance, **kwargs):
+    """
+    Создаёт уменьшенные копии новой фотографии после фиксации транзакции.
+    Варианты прежней фотографии удаляются, только если на неё больше
+    ничего не ссылается: снимки товара в прошлых заказах показывают их.
+    """
+    stale = getattr(instance, '_stale_image', None)
+    if stale and stale[0] and not image_in_use(stale[0]):
+        images.delete_variants(instance.image.storage, *stale)
+    if not instance.image or instance.image_variants:
+        return
+
+    def generate():
+        try:
+            images.generate_for_product(instance)
+        except Exception:
+            # В том числе повреждённый файл и Image.DecompressionBombError
+            logger.exception('Не удалось создать варианты фотографии товара #%s', instance.pk)
+            return
+        cache.invalidate_catalog()
+
+    transaction.on_commit(generate)
+
+
+@receiver(pre_save, sender=Order)
+def remember_old_status(sender, instance, **kwargs):
+    """Запоминает прежний статус заказа, чтобы заметить его изменение."""
+    instance._old_status = None
+    if instance.pk:
+        instance._old_status = (
+            Order.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Order)
+def publish_status_change(sender, instance, created, **kwargs):
+    """
+    Оповещает покупателя о новом статусе заказа: письмо ставится в очередь
+    в той же транзакции, событие для потока SSE публикуется после фиксации.
+    Массовые переходы (services.transition_orders) делают то же самое сами.
+    """
+    if created or getattr(instance, '_old_status', None) in (None, instance.status):
+        return
+    mail.queue_status_emails([(instance.id, instance.user_id)], instance.status)
+    transaction.on_commit(lambda: events.publish_order_status(instance))
+
+
+@receiver(post_save, sender=Order)
+def update_status_counts(sender, instance, created, **kwargs):
+    """Обновляет счётчики заказов по статусам в сводках продаж."""
+    if created:
+        analytics.record_status_change(None, instance.status)
+    else:
+        analytics.record_status_change(getattr(instance, '_old_status', None) or instance.status, instance.status)
@@ -0,0 +1,229 @@
+"""
+Журнал медленных SQL-запросов.
+
+SlowQueryMiddleware подключает к соединениям обработчик
+connection.execute_wrapper, который замеряет каждый запрос. Для быстрого
+запроса вся работа — два вызова time.perf_counter() и сравнение, поэтому
+журнал можно держать включённым в продакшене (накладные расходы
+измеряет manage.py bench_slowlog).
+
+Запрос дольше SLOW_QUERY_THRESHOLD_MS с вероятностью SLOW_QUERY_SAMPLE_RATE
+попадает в журнал вместе с именем представления и отпечатком стека —
+вызовами кода проекта, которые к нему привели. В таблицу SlowQuery записи
+пишет фоновый поток со своим соединением: запрос пользователя не ждёт
+записи, а откат его транзакции не теряет её. Если очередь переполнена,
+новые записи отбрасываются. С SLOW_QUERY_ASYNC = False поток не
+запускается, и очередь разбирает только drain() (для тестов).
+
+На PostgreSQL для каждого отпечатка запроса не чаще раза в EXPLAIN_INTERVAL
+сохраняется план EXPLAIN (ANALYZE off): запрос при этом не выполняется.
+В таблице хранятся последние SLOW_QUERY_LOG_MAX_ROWS записей.
+
+Сводка по самым затратным запросам — manage.py slow_queries.
+"""
+import hashlib
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import traceback
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connections
+
+from .models import SlowQuery
+from .profiling import fingerprint
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 1000
+STACK_DEPTH = 8
+EXPLAIN_INTERVAL = 10 * 60  # секунд на отпечаток запроса
+MAX_SQL_LENGTH = 10_000
+TRIM_EVERY = 100  # записей
+
+# Стек сокращается до вызовов кода проекта (без Django и самого журнала)
+_PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+_THIS_FILE = os.path.abspath(__file__)
+_EXPLAINABLE = ('select', 'with', 'insert', 'update', 'delete')
+
+_queue = queue.Queue(maxsize=QUEUE_SIZE)
+_worker = None
+_worker_lock = threading.Lock()
+_explained = {}  # отпечаток -> time.monotonic() последнего EXPLAIN
+_written = 0
+dropped = 0
+
+
+def enabled():
+    return getattr(settings, 'SLOW_QUERY_LOG', True)
+
+
+def threshold():
+    """Порог медленного запроса в секундах."""
+    return getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 200) / 1000
+
+
+def _stack():
+    frames = [
+        frame for frame in traceback.extract_stack()
+        if frame.filename.startswith(_PROJECT_DIR)
+        and frame.filename != _THIS_FILE
+        and 'site-packages' not in frame.filename
+    ][-STACK_DEPTH:]
+    return '\n'.join(
+        f'{os.path.relpath(frame.filename, _PROJECT_DIR)}:{frame.lineno} {frame.name}'
+        for frame in reversed(frames)
+    )
+
+
+class SlowQueryLogger:
+    """Обработчик connection.execute_wrapper, ставящий медленные запросы в очередь журнала."""
+
+    def __init__(self, alias, request=None, label=''):
+        self.alias = alias
+        self.request = request
+        self.label = label
+        self.threshold = threshold()
+        self.sample_rate = getattr(settings, 'SLOW_QUERY_SAMPLE_RATE', 1.0)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            if duration >= self.threshold:
+                self._slow(sql, params, many, duration)
+
+    def _view(self):
+        match = getattr(self.request, 'resolver_match', None)
+        return match.view_name if match else self.label
+
+    def _slow(self, sql, params, many, duration):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        stack = _stack()
+        submit({
+            'alias': self.alias,
+            'sql': sql,
+            # Параметры нужны только для EXPLAIN одиночного запроса
+            'params': None if many else params,
+            'view': self._view(),
+            'stack': stack,
+            'duration': duration,
+        })
+
+
+def submit(entry):
+    global dropped
+    if getattr(settings, 'SLOW_QUERY_ASYNC', True):
+        _ensure_worker()
+    try:
+        _queue.put_nowait(entry)
+    except queue.Full:
+        dropped += 1
+
+
+def _ensure_worker():
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    with _worker_lock:
+        # После fork воркера gunicorn поток родителя в нём не существует
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name='slow-query-log', daemon=True)
+            _worker.start()
+
+
+def _run():
+    while True:
+        entry = _queue.get()
+        close_old_connections()
+        try:
+            _write(entry)
+        except Exception:
+            logger.exception('Не удалось записать медленный запрос')
+
+
+def drain():
+    """Записывает все записи из очереди в текущем потоке. Возвращает их число."""
+    count = 0
+    while True:
+        try:
+            entry = _queue.get_nowait()
+        except queue.Empty:
+            return count
+        _write(entry)
+        count += 1
+
+
+def _explain(entry, digest):
+    connection = connections[entry['alias']]
+    if connection.vendor != 'postgresql' or entry['params'] is None:
+        return ''
+    if not entry['sql'].lstrip().lower().startswith(_EXPLAINABLE):
+        return ''
+    now = time.monotonic()
+    if now - _explained.get(digest, float('-inf')) < EXPLAIN_INTERVAL:
+        return ''
+    _explained[digest] = now
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (ANALYZE off) {entry["sql"]}', entry['params'])
+            return '\n'.join(row[0] for row in cursor.fetchall())
+    except DatabaseError as exc:
+        logger.warning('EXPLAIN медленного запроса не удался: %s', exc)
+        return ''
+
+
+def _write(entry):
+    global _written
+    digest = hashlib.md5(fingerprint(entry['sql']).encode()).hexdigest()
+    SlowQuery.objects.create(
+        fingerprint=digest,
+        sql=entry['sql'][:MAX_SQL_LENGTH],
+        view=entry['view'][:200],
+        stack=entry['stack'],
+        stack_fingerprint=hashlib.md5(entry['stack'].encode()).hexdigest()[:12] if entry['stack'] else '',
+        duration_ms=entry['duration'] * 1000,
+        plan=_explain(entry, digest),
+    )
+    _written += 1
+    if _written % TRIM_EVERY == 0:
+        trim()
+
+
+def trim():
+    """Удаляет записи сверх SLOW_QUERY_LOG_MAX_ROWS последних."""
+    keep = getattr(settings, 'SLOW_QUERY_LOG_MAX_ROWS', 10_000)
+    boundary = list(SlowQuery.objects.order_by('-id').values_list('id', flat=True)[keep:keep + 1])
+    if boundary:
+        SlowQuery.objects.filter(id__lte=boundary[0]).delete()
+
+
+@contextmanager
+def log_slow_queries(request=None, label=''):
+    """Журналирует медленные запросы всех соединений внутри блока."""
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(
+                SlowQueryLogger(connection.alias, request, label)
+            ))
+        yield
+
+
+class SlowQueryMiddleware:
+    """Журналирует медленные SQL-запросы каждого запроса, если включена настройка SLOW_QUERY_LOG."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not enabled():
+            return self.get_response(request)
+        with log_slow_queries(request):
+            return self.get_response(request)
@@ -0,0 +1,42 @@
+"""
+Шаблонные теги для адаптивных фотографий товаров.
+"""
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from ..images import FORMATS, variant_name
+
+register = template.Library()
+
+
+def _srcset(image, widths, fmt):
+    return ', '.join(
+        f'{image.storage.url(variant_name(image.name, width, fmt))} {width}w'
+        for width in widths
+    )
+
+
+@register.simple_tag
+def responsive_image(image, sizes='100vw', css_class='', alt='', style='', loading='lazy', widths=None):
+    """
+    Выводит <picture> с WebP/JPEG-вариантами фотографии и атрибутами srcset/sizes.
+    Ширины берутся из Product.image_variants; если вариантов ещё нет,
+    выводится обычный <img> с оригиналом.
+
+    Пример: {% responsive_image product.image sizes="80px" alt=product.name %}
+    """
+    if widths is None:
+        widths = getattr(image.instance, 'image_variants', None) or []
+    if not widths:
+        return format_html(
+            '<img src="{}" class="{}" alt="{}" style="{}" loading="{}">',
+            image.url, css_class, alt, style, loading,
+        )
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        [(f'image/{fmt}', _srcset(image, widths, fmt), sizes) for fmt in FORMATS if fmt != 'jpeg'],
+    )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" class="{}" alt="{}" style="{}" loading="{}"></picture>',
+        sources, image.url, _srcset(image, widths, 'jpeg'), sizes, css_class, alt, style, loading,
+    )
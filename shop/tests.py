@@ -1,3 +1,1980 @@
-from django.test import TestCase
+import asyncio
+import copy
+import csv
+import http.client
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from smtplib import SMTPException
+from unittest import mock, skipIf
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+
+from django.core import mail as django_mail
+from django.core.cache import cache
+from django.core.mail.backends import locmem
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import AsyncRequestFactory, Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import cache as page_cache
+from . import analytics, catalog, events, exports, fakedata, loadtest, metrics, profiling, recommendations, routers, slowlog, views
+from .mail import OutboxSender
+from .models import (
+    Category, Product, User, Cart, CartItem, Order, OrderItem, OutboxEmail,
+    DailySales, OrderStatusCount, ProductDailySales, ProductPair, ProductRecommendation, SlowQuery,
+)
+from .pagination import EstimatedCountPaginator, KeysetPaginator, InvalidCursor, decode_cursor
+from .services import add_to_cart, place_order, transition_orders, EmptyCartError, InvalidTransition
+from .images import variant_name
+from .search import InvertedIndex, PostgresSearchBackend, search_products
+
+
+def make_products(count, **extra):
+    """Создаёт count товаров с различающимися датами создания."""
+    products = []
+    now = timezone.now()
+    for i in range(count):
+        product = Product.objects.create(
+            name=f'Товар {i}',
+            slug=f'product-{i}',
+            description=f'Описание товара {i}',
+            price=Decimal('100.00') + i,
+            image='products/test.jpg',
+            **extra,
+        )
+        products.append(product)
+    # auto_now_add не даёт задать дату при создании, выставляем её отдельно
+    for i, product in enumerate(products):
+        Product.objects.filter(pk=product.pk).update(created_at=now - timedelta(minutes=i))
+    return products
+
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        make_products(30)
+        self.queryset = Product.objects.filter(is_active=True)
+
+    def test_walks_forward_and_back_without_gaps(self):
+        paginator = KeysetPaginator(self.queryset, 12)
+        expected = list(self.queryset.order_by('-created_at', '-id').values_list('id', flat=True))
+
+        first = paginator.get_page(None)
+        second = paginator.get_page(first.next_cursor)
+        third = paginator.get_page(second.next_cursor)
+        seen = [p.id for page in (first, second, third) for p in page]
+        self.assertEqual(seen, expected)
+        self.assertFalse(first.has_previous())
+        self.assertFalse(third.has_next())
+
+        back = paginator.get_page(third.previous_cursor)
+        self.assertEqual([p.id for p in back], [p.id for p in second])
+        back = paginator.get_page(back.previous_cursor)
+        self.assertEqual([p.id for p in back], [p.id for p in first])
+        self.assertFalse(back.has_previous())
+
+    def test_ties_on_created_at_are_broken_by_id(self):
+        Product.objects.update(created_at=timezone.now())
+        paginator = KeysetPaginator(self.queryset, 7)
+        ids = []
+        page = paginator.get_page(None)
+        while True:
+            ids.extend(p.id for p in page)
+            if not page.has_next():
+                break
+            page = paginator.get_page(page.next_cursor)
+        self.assertEqual(len(ids), 30)
+        self.assertEqual(len(set(ids)), 30)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(InvalidCursor):
+            decode_cursor('not-a-cursor')
+
+    def test_no_count_query(self):
+        paginator = KeysetPaginator(self.queryset, 12)
+        with self.assertNumQueries(1):
+            page = paginator.get_page(None)
+            list(page)
+
+    def test_view_supports_cursor_and_legacy_page(self):
+        url = reverse('shop:product_list')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        next_cursor = response.context['page_obj'].next_cursor
+        self.assertContains(response, f'?cursor={next_cursor}')
+
+        response = self.client.get(url, {'cursor': next_cursor})
+        self.assertEqual(len(response.context['page_obj']), 12)
+
+        response = self.client.get(url, {'page': 3})
+        self.assertEqual(response.context['page_obj'].number, 3)
+        self.assertEqual(len(response.context['page_obj']), 6)
+
+        response = self.client.get(url, {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 200)
+
+
+class PageCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.product = make_products(3)[0]
+        self.list_url = reverse('shop:product_list')
+        self.detail_url = reverse('shop:product_detail', args=[self.product.slug])
+
+    def test_anonymous_pages_are_served_from_cache(self):
+        for url in (self.list_url, self.detail_url):
+            self.assertEqual(self.client.get(url)['X-Page-Cache'], 'MISS')
+            with self.assertNumQueries(0):
+                response = self.client.get(url)
+            self.assertEqual(response['X-Page-Cache'], 'HIT')
+
+    def test_product_save_and_delete_invalidate_pages(self):
+        self.client.get(self.list_url)
+        self.client.get(self.detail_url)
+
+        self.product.name = 'Переименованный товар'
+        self.product.save()
+        response = self.client.get(self.list_url)
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        self.assertContains(response, 'Переименованный товар')
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        self.assertContains(response, 'Переименованный товар')
+
+        self.product.delete()
+        self.assertEqual(self.client.get(self.detail_url).status_code, 404)
+        self.assertNotContains(self.client.get(self.list_url), 'Переименованный товар')
+
+    def test_slug_change_invalidates_old_address(self):
+        self.client.get(self.detail_url)
+        self.product.slug = 'new-slug'
+        self.product.save()
+        self.assertEqual(self.client.get(self.detail_url).status_code, 404)
+
+    def test_messages_are_never_cached(self):
+        self.client.get(self.list_url)
+        user = User.objects.create_user(email='buyer@test.local', password='secret')
+        self.client.force_login(user)
+        response = self.client.get(reverse('shop:logout'), follow=True)
+        self.assertContains(response, 'Вы успешно вышли из системы.')
+        self.assertEqual(response['X-Page-Cache'], 'HIT')
+
+        response = self.client.get(self.list_url)
+        self.assertEqual(response['X-Page-Cache'], 'HIT')
+        self.assertNotContains(response, 'Вы успешно вышли из системы.')
+        self.assertNotContains(response, page_cache.MESSAGES_PLACEHOLDER)
+
+    def test_authenticated_users_bypass_cache(self):
+        user = User.objects.create_user(email='buyer@test.local', password='secret')
+        self.client.force_login(user)
+        self.client.get(self.list_url)
+        self.assertFalse(self.client.get(self.list_url).has_header('X-Page-Cache'))
+
+    def test_stale_copy_is_served_while_another_request_recomputes(self):
+        self.client.get(self.list_url)
+        request = self.client.get(self.list_url).wsgi_request
+        key = page_cache.product_list_key(request)
+        entry = cache.get(key)
+        entry['expires'] = 0
+        cache.set(key, entry)
+        cache.add(f'{key}:lock', 1)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.list_url)
+        self.assertEqual(response['X-Page-Cache'], 'STALE')
+
+        cache.delete(f'{key}:lock')
+        self.assertEqual(self.client.get(self.list_url)['X-Page-Cache'], 'MISS')
+
+
+    def test_junk_and_reordered_parameters_share_cache_entry(self):
+        Category.objects.create(name='Смартфоны', slug='phones')
+        self.client.get(self.list_url, {'sort': 'price_asc', 'category': 'phones'})
+        for params in (
+            {'category': 'phones', 'sort': 'price_asc'},
+            {'sort': 'price_asc', 'category': 'phones', 'utm_source': 'x', 'price_min': 'дёшево'},
+        ):
+            response = self.client.get(self.list_url, params)
+            self.assertEqual(response['X-Page-Cache'], 'HIT')
+            self.assertNotContains(response, 'utm_source')
+        # Неизвестная категория и курсор-мусор не создают новых записей
+        self.client.get(self.list_url)
+        for params in ({'category': 'no-such'}, {'cursor': 'garbage'}, {'sort': 'new'}):
+            self.assertEqual(self.client.get(self.list_url, params)['X-Page-Cache'], 'HIT')
+
+    def test_lock_is_released_when_view_fails(self):
+        request = self.client.get(self.list_url).wsgi_request
+        key = page_cache.product_list_key(request)
+        cache.delete(key)
+        with mock.patch.object(catalog, 'facet_counts', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client.get(self.list_url)
+        self.assertIsNone(cache.get(f'{key}:lock'))
+        self.assertEqual(self.client.get(self.list_url)['X-Page-Cache'], 'MISS')
+
+
+class QueryCountTests(TestCase):
+    """Количество запросов страницы не должно расти вместе с корзиной."""
+
+    def setUp(self):
+        self.products = make_products(10)
+        self.user = User.objects.create_user(email='buyer@test.local', password='secret')
+        self.client.force_login(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+
+    def fill_cart(self, size):
+        CartItem.objects.filter(cart=self.cart).delete()
+        for product in self.products[:size]:
+            CartItem.objects.create(cart=self.cart, product=product, quantity=2, price=product.price)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_cart_and_checkout(self):
+        for name in ('shop:cart', 'shop:checkout'):
+            url = reverse(name)
+            self.fill_cart(1)
+            small = self.count_queries(url)
+            self.fill_cart(10)
+            self.assertEqual(self.count_queries(url), small, name)
+
+    def test_order_detail(self):
+        order = Order.objects.create(user=self.user, total_amount=Decimal('0'))
+        url = reverse('shop:order_detail', args=[order.id])
+        OrderItem.objects.create(order=order, product=self.products[0], quantity=1, price=Decimal('1'))
+        small = self.count_queries(url)
+        for product in self.products[1:]:
+            OrderItem.objects.create(order=order, product=product, quantity=1, price=Decimal('1'))
+        self.assertEqual(self.count_queries(url), small)
+
+    def test_cart_total_is_computed_in_database(self):
+        self.fill_cart(3)
+        expected = sum(p.price * 2 for p in self.products[:3])
+        with self.assertNumQueries(1):
+            self.assertEqual(self.cart.get_total(), expected)
+        CartItem.objects.all().delete()
+        self.assertEqual(self.cart.get_total(), Decimal('0.00'))
+
+
+def run_in_threads(func, count):
+    """Запускает func в count потоках одновременно, возвращает результаты и ошибки."""
+    barrier = threading.Barrier(count)
+    results, errors = [], []
+
+    def worker():
+        try:
+            barrier.wait()
+            results.append(func())
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+class CheckoutTests(TestCase):
+
+    def setUp(self):
+        self.products = make_products(10)
+        self.user = User.objects.create_user(email='buyer@test.local', password='secret')
+        self.cart = Cart.objects.create(user=self.user)
+
+    def fill_cart(self, size):
+        for product in self.products[:size]:
+            CartItem.objects.create(cart=self.cart, product=product, quantity=3, price=product.price)
+
+    def test_place_order_copies_lines_and_clears_cart(self):
+        self.fill_cart(4)
+        order, created = place_order(self.user)
+        self.assertTrue(created)
+        self.assertEqual(order.items.count(), 4)
+        self.assertEqual(order.total_amount, sum(p.price * 3 for p in self.products[:4]))
+        self.assertFalse(CartItem.objects.exists())
+        with self.assertRaises(EmptyCartError):
+            place_order(self.user)
+
+    def test_round_trips_do_not_depend_on_cart_size(self):
+        counts = []
+        for size in (1, 10):
+            self.fill_cart(size)
+            with CaptureQueriesContext(connection) as queries:
+                place_order(self.user, uuid.uuid4())
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_duplicate_submission_returns_same_order(self):
+        self.fill_cart(2)
+        token = uuid.uuid4()
+        order, created = place_order(self.user, token)
+        again, created_again = place_order(self.user, token)
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(order.pk, again.pk)
+
+    def test_view_posts_are_idempotent(self):
+        self.fill_cart(2)
+        self.client.force_login(self.user)
+        token = self.client.get(reverse('shop:checkout')).context['checkout_token']
+        first = self.client.post(reverse('shop:checkout'), {'checkout_token': token})
+        second = self.client.post(reverse('shop:checkout'), {'checkout_token': token})
+        self.assertEqual(first.url, second.url)
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+
+    def setUp(self):
+        self.products = make_products(5)
+        self.user = User.objects.create_user(email='buyer@test.local', password='secret')
+        cart = Cart.objects.create(user=self.user)
+        for product in self.products:
+            CartItem.objects.create(cart=cart, product=product, quantity=1, price=product.price)
+
+    def test_parallel_checkouts_with_same_token_create_one_order(self):
+        token = uuid.uuid4()
+        results, errors = run_in_threads(lambda: place_order(self.user, token), 4)
+        self.assertEqual(errors, [])
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(len({order.pk for order, _ in results}), 1)
+        self.assertEqual(sum(created for _, created in results), 1)
+        self.assertEqual(OrderItem.objects.count(), 5)
+
+    def test_parallel_checkouts_without_token_do_not_duplicate_items(self):
+        results, errors = run_in_threads(lambda: place_order(self.user), 4)
+        self.assertEqual(len(results), 1)
+        self.assertTrue(all(isinstance(e, EmptyCartError) for e in errors), errors)
+        self.assertEqual(OrderItem.objects.count(), 5)
+
+
+class AddToCartTests(TestCase):
+
+    def setUp(self):
+        self.product = make_products(1)[0]
+        self.user = User.objects.create_user(email='buyer@test.local', password='secret')
+
+    def test_creates_cart_and_increments(self):
+        self.assertEqual(add_to_cart(self.user, self.product), (1, True))
+        self.assertEqual(add_to_cart(self.user, self.product), (2, False))
+        self.assertEqual(add_to_cart(self.user, self.product, quantity=3), (5, False))
+        item = CartItem.objects.get()
+        self.assertEqual(item.cart.user, self.user)
+        self.assertEqual(item.price, self.product.price)
+
+    def test_price_is_fixed_on_first_add(self):
+        add_to_cart(self.user, self.product)
+        self.product.price = Decimal('1.00')
+        self.product.save()
+        add_to_cart(self.user, self.product)
+        self.assertNotEqual(CartItem.objects.get().price, Decimal('1.00'))
+
+    def test_view_uses_two_writes(self):
+        self.client.force_login(self.user)
+        url = reverse('shop:add_to_cart', args=[self.product.id])
+        self.client.post(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url)
+        self.assertRedirects(response, reverse('shop:product_detail', args=[self.product.slug]),
+                             fetch_redirect_response=False)
+        writes = [q for q in queries if q['sql'].startswith('INSERT INTO "shop_cart')]
+        self.assertEqual(len(writes), 2)
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+
+
+class ConcurrentAddToCartTests(TransactionTestCase):
+
+    def test_no_lost_updates(self):
+        product = make_products(1)[0]
+        user = User.objects.create_user(email='buyer@test.local', password='secret')
+        threads, adds = 8, 10
+
+        def add_many():
+            for _ in range(adds):
+                add_to_cart(user, product)
+
+        _, errors = run_in_threads(add_many, threads)
+        self.assertEqual(errors, [])
+        self.assertEqual(Cart.objects.count(), 1)
+        self.assertEqual(CartItem.objects.get().quantity, threads * adds)
+
+
+class GuestCartTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.products = make_products(3)
+
+    def add(self, product):
+        return self.client.post(reverse('shop:add_to_cart', args=[product.id]))
+
+    def test_guest_cart_does_not_touch_cart_tables(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.add(self.products[0])
+            self.add(self.products[0])
+            self.add(self.products[1])
+        self.assertFalse([q for q in queries if 'shop_cart' in q['sql']])
+        self.assertFalse(Cart.objects.exists())
+
+        response = self.client.get(reverse('shop:cart'))
+        lines = {line.product.id: line.quantity for line in response.context['cart_items']}
+        self.assertEqual(lines, {self.products[0].id: 2, self.products[1].id: 1})
+        self.assertEqual(response.context['total'], self.products[0].price * 2 + self.products[1].price)
+
+    def test_guest_update_and_remove(self):
+        self.add(self.products[0])
+        self.add(self.products[1])
+        self.client.post(reverse('shop:update_cart_item', args=[self.products[0].id]), {'quantity': 5})
+        self.client.get(reverse('shop:remove_from_cart', args=[self.products[1].id]))
+        items = self.client.get(reverse('shop:cart')).context['cart_items']
+        self.assertEqual([(line.product.id, line.quantity) for line in items], [(self.products[0].id, 5)])
+        response = self.client.get(reverse('shop:remove_from_cart', args=[self.products[2].id]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_checkout_requires_login(self):
+        self.add(self.products[0])
+        response = self.client.get(reverse('shop:checkout'))
+        self.assertRedirects(response, reverse('shop:login') + '?next=' + reverse('shop:checkout'))
+
+    def test_login_merges_guest_cart(self):
+        user = User.objects.create_user(email='buyer@test.local', password='secret')
+        add_to_cart(user, self.products[0])
+        self.add(self.products[0])
+        self.add(self.products[2])
+        self.client.post(reverse('shop:login'), {'email': 'buyer@test.local', 'password': 'secret'})
+        lines = dict(CartItem.objects.filter(cart__user=user).values_list('product_id', 'quantity'))
+        self.assertEqual(lines, {self.products[0].id: 2, self.products[2].id: 1})
+        self.assertNotIn('cart', self.client.session)
+
+    def test_register_merges_guest_cart(self):
+        self.add(self.products[1])
+        self.client.post(reverse('shop:register'), {
+            'email': 'new@test.local', 'password': 'secret', 'password_confirm': 'secret',
+        })
+        self.assertEqual(CartItem.objects.get(cart__user__email='new@test.local').product, self.products[1])
+
+    def test_cached_product_page_has_per_visitor_csrf_token(self):
+        url = reverse('shop:product_detail', args=[self.products[0].slug])
+        Client().get(url)
+        client = Client(enforce_csrf_checks=True)
+        response = client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'HIT')
+        token = response.content.decode().split('name="csrfmiddlewaretoken" value="')[1].split('"')[0]
+        response = client.post(reverse('shop:add_to_cart', args=[self.products[0].id]),
+                               {'csrfmiddlewaretoken': token})
+        self.assertEqual(response.status_code, 302)
+
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.phone = Product.objects.create(
+            name='Смартфон Xiaomi Redmi Note 12 Pro', slug='xiaomi',
+            description='Экран AMOLED, камера 108 Мп', price=Decimal('25000'), image='products/x.jpg',
+        )
+        self.laptop = Product.objects.create(
+            name='Ноутбук ASUS VivoBook 15', slug='asus',
+            description='Подойдёт тем, кому смартфона мало', price=Decimal('55000'), image='products/a.jpg',
+        )
+
+    def test_prefix_match_and_ranking(self):
+        self.assertEqual(list(search_products('смартф')), [self.phone, self.laptop])
+        self.assertEqual(list(search_products('xiao redmi')), [self.phone])
+        self.assertEqual(list(search_products('ноутбук смартф')), [self.laptop])
+        self.assertEqual(list(search_products('!!!')), [])
+
+    def test_index_follows_product_changes(self):
+        self.assertEqual(list(search_products('планшет')), [])
+        self.laptop.name = 'Планшет ASUS'
+        self.laptop.save()
+        self.assertEqual(list(search_products('планшет')), [self.laptop])
+        self.laptop.is_active = False
+        self.laptop.save()
+        self.assertEqual(list(search_products('планшет')), [])
+
+    def test_search_page_and_suggestions(self):
+        response = self.client.get(reverse('shop:search'), {'q': 'ноут'})
+        self.assertEqual(list(response.context['page_obj']), [self.laptop])
+        response = self.client.get(reverse('shop:search_suggest'), {'q': 'смарт'})
+        self.assertEqual(
+            [item['url'] for item in response.json()['results']],
+            [reverse('shop:product_detail', args=['xiaomi']), reverse('shop:product_detail', args=['asus'])],
+        )
+
+    def test_admin_search(self):
+        admin = User.objects.create_superuser(email='admin@test.local', password='secret')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admin:shop_product_changelist'), {'q': 'xiaomi'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.phone])
+
+    def test_inverted_index_requires_all_terms(self):
+        index = InvertedIndex([
+            (1, 'красный чехол', ''),
+            (2, 'синий чехол', 'красный кант'),
+            (3, 'синий чехол', ''),
+        ])
+        # Совпадение в названии весит больше, чем в описании
+        self.assertEqual(index.search('крас чех'), [(1, 6), (2, 4)])
+
+    def test_postgres_query_is_sanitized(self):
+        query = PostgresSearchBackend().build_query("смартфон' | !xiaomi:*")
+        self.assertEqual(query.source_expressions[-1].value, 'смартфон:* & xiaomi:*')
+
+
+def make_jpeg(width=1200, height=800):
+    """Возвращает JPEG-файл заданного размера для загрузки в ImageField."""
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), (111, 66, 193)).save(buffer, 'JPEG')
+    return SimpleUploadedFile('phone.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(PRODUCT_IMAGE_WIDTHS=[80, 320, 1600])
+class ImageVariantTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def create_product(self, image=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Product.objects.create(
+                name='Смартфон', slug='phone', description='Описание',
+                price=Decimal('100'), image=image or make_jpeg(),
+            )
+
+    def test_variants_are_generated_on_save(self):
+        product = self.create_product()
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants, [80, 320, 1200])
+        for width in (80, 320, 1200):
+            for fmt in ('webp', 'jpeg'):
+                path = variant_name(product.image.path, width, fmt)
+                with Image.open(path) as variant:
+                    self.assertEqual(variant.width, width)
+        self.assertFalse(os.path.exists(variant_name(product.image.path, 1600, 'jpeg')))
+
+    def test_narrow_image_is_not_upscaled(self):
+        product = self.create_product(make_jpeg(200, 300))
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants, [80, 200])
+        self.assertFalse(os.path.exists(variant_name(product.image.path, 320, 'jpeg')))
+        html = Template('{% load shop_images %}{% responsive_image product.image %}').render(
+            Context({'product': product})
+        )
+        self.assertIn('_200w.jpg 200w', html)
+        self.assertNotIn('320w', html)
+
+    def test_replacing_image_regenerates_variants(self):
+        product = self.create_product()
+        old_path = product.image.path
+        product.image = make_jpeg(400, 400)
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertFalse(os.path.exists(variant_name(old_path, 80, 'webp')))
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants, [80, 320, 400])
+
+    def test_replacing_image_keeps_variants_of_ordered_photo(self):
+        product = self.create_product()
+        old_path = product.image.path
+        user = User.objects.create_user(email='buyer@test.local', password='secret')
+        CartItem.objects.create(cart=Cart.objects.create(user=user), product=product,
+                                quantity=1, price=product.price)
+        order, _ = place_order(user)
+        product.image = make_jpeg(400, 400)
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        # Прошлый заказ по-прежнему показывает снимок прежней фотографии
+        self.assertEqual(order.items.get().product_image_variants, [80, 320, 1200])
+        self.assertTrue(os.path.exists(variant_name(old_path, 80, 'webp')))
+
+    def test_responsive_image_tag(self):
+        product = self.create_product()
+        product.refresh_from_db()
+        html = Template('{% load shop_images %}{% responsive_image product.image sizes="80px" %}').render(
+            Context({'product': product})
+        )
+        self.assertIn('type="image/webp"', html)
+        self.assertIn('_320w.webp 320w', html)
+        self.assertIn('_80w.jpg 80w', html)
+        self.assertIn('sizes="80px"', html)
+
+        product.image_variants = []
+        html = Template('{% load shop_images %}{% responsive_image product.image %}').render(
+            Context({'product': product})
+        )
+        self.assertNotIn('srcset', html)
+
+    def test_backfill_command(self):
+        product = self.create_product()
+        Product.objects.update(image_variants=[])
+        call_command('generate_image_variants', workers=2, stdout=StringIO(), stderr=StringIO())
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants, [80, 320, 1200])
+
+    def test_backfill_reports_undecodable_images_and_continues(self):
+        product = self.create_product()
+        Product.objects.update(image_variants=[])
+        err = StringIO()
+        # Процессы пула наследуют лимит при fork
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 100):
+            call_command('generate_image_variants', workers=1, stdout=StringIO(), stderr=err)
+        self.assertIn(f'Ошибка обработки фотографии товара #{product.id}', err.getvalue())
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants, [])
+
+
+class ImportCatalogTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.workdir = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=os.path.join(self.workdir, 'media'))
+        self.override.enable()
+        Image.new('RGB', (10, 10)).save(os.path.join(self.workdir, 'phone.jpg'))
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def write(self, name, content):
+        path = os.path.join(self.workdir, name)
+        with open(path, 'w', encoding='utf-8') as feed:
+            feed.write(content)
+        return path
+
+    def run_import(self, path, **options):
+        out = StringIO()
+        call_command('import_catalog', path, images_dir=self.workdir, stdout=out, **options)
+        return out.getvalue()
+
+    def test_jsonl_import_is_idempotent(self):
+        path = self.write('feed.jsonl', '\n'.join([
+            '{"name": "Phone One", "price": "100", "description": "a", "image": "phone.jpg"}',
+            '{"name": "Phone Two", "slug": "two", "price": 200.5, "description": "b"}',
+            '',
+            '{"name": "", "price": "1"}',
+            '{"name": "Broken", "price": "дорого"}',
+            '{"name": "Oops", "price": ',
+            '[1, 2]',
+            '{"name": "Phone Three", "slug": "three", "price": "300"}',
+        ]))
+        output = self.run_import(path, batch_size=1)
+        self.assertIn('ошибок: 4', output)
+        self.assertIn('строка 6: некорректный JSON', output)
+        self.assertIn('строка 7: ожидался объект JSON', output)
+        self.assertEqual(
+            list(Product.objects.order_by('slug').values_list('slug', 'price')),
+            [('phone-one', Decimal('100.00')), ('three', Decimal('300.00')), ('two', Decimal('200.50'))],
+        )
+        self.assertRegex(Product.objects.get(slug='phone-one').image.name, r'^products/phone_[0-9a-f]{12}\.jpg$')
+        self.assertEqual(Product.objects.get(slug='two').image.name, '')
+        created_at = Product.objects.get(slug='two').created_at
+
+        output = self.run_import(path)
+        self.assertIn('скопировано фото: 0', output)
+        self.assertEqual(Product.objects.count(), 3)
+        self.assertEqual(Product.objects.get(slug='two').created_at, created_at)
+
+    def test_invalid_prices_are_record_errors(self):
+        path = self.write('feed.jsonl', '\n'.join([
+            '{"name": "NaN", "price": "NaN"}',
+            '{"name": "Infinity", "price": "Infinity"}',
+            '{"name": "Huge", "price": "100000000"}',
+            '{"name": "Max", "price": "99999999.99"}',
+        ]))
+        output = self.run_import(path)
+        self.assertIn('ошибок: 3', output)
+        self.assertIn('слишком большая цена', output)
+        self.assertEqual(list(Product.objects.values_list('slug', flat=True)), ['max'])
+
+    def test_images_are_stored_by_content_hash(self):
+        os.makedirs(os.path.join(self.workdir, 'a'))
+        os.makedirs(os.path.join(self.workdir, 'b'))
+        Image.new('RGB', (10, 10), (255, 0, 0)).save(os.path.join(self.workdir, 'a', 'photo.png'))
+        Image.new('RGB', (10, 10), (0, 0, 255)).save(os.path.join(self.workdir, 'b', 'photo.png'))
+        path = self.write('feed.jsonl', '\n'.join([
+            '{"name": "Red", "price": "1", "image": "a/photo.png"}',
+            '{"name": "Blue", "price": "1", "image": "b/photo.png"}',
+        ]))
+        self.assertIn('скопировано фото: 2', self.run_import(path))
+        red, blue = (Product.objects.get(slug=slug).image for slug in ('red', 'blue'))
+        self.assertNotEqual(red.name, blue.name)
+        with Image.open(red.path) as image:
+            self.assertEqual(image.getpixel((0, 0)), (255, 0, 0))
+
+        # Новое содержимое того же размера копируется, варианты сбрасываются
+        Product.objects.filter(slug='red').update(image_variants=[80])
+        Image.new('RGB', (10, 10), (0, 255, 0)).save(os.path.join(self.workdir, 'a', 'photo.png'))
+        self.assertIn('скопировано фото: 1', self.run_import(path))
+        red = Product.objects.get(slug='red')
+        with Image.open(red.image.path) as image:
+            self.assertEqual(image.getpixel((0, 0)), (0, 255, 0))
+        self.assertEqual(red.image_variants, [])
+
+    def test_csv_update_offset_and_dry_run(self):
+        Product.objects.create(name='Old', slug='one', description='', price=Decimal('1'), image='')
+        path = self.write('feed.csv', (
+            'name,slug,price,description,is_active\n'
+            'Первый,one,10,desc,true\n'
+            'Второй,two,20,desc,false\n'
+            'Третий,three,30,desc,да\n'
+        ))
+        self.run_import(path, dry_run=True)
+        self.assertEqual(Product.objects.count(), 1)
+
+        self.run_import(path, offset=1)
+        self.assertEqual(Product.objects.get(slug='one').name, 'Old')
+        self.assertFalse(Product.objects.get(slug='two').is_active)
+        self.assertTrue(Product.objects.get(slug='three').is_active)
+
+        self.run_import(path)
+        self.assertEqual(Product.objects.get(slug='one').name, 'Первый')
+        self.assertEqual(Product.objects.count(), 3)
+
+
+class ExcerptTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.description = ' '.join(f'слово{i}' for i in range(100))
+
+    def test_excerpt_is_computed_on_save(self):
+        product = Product.objects.create(
+            name='Товар', slug='item', description=self.description, price=Decimal('1'), image='',
+        )
+        expected = Template('{{ text|truncatewords:15 }}').render(Context({'text': self.description}))
+        self.assertEqual(product.excerpt, expected)
+
+        product.description = 'короткое описание'
+        product.save(update_fields=['description'])
+        product.refresh_from_db()
+        self.assertEqual(product.excerpt, 'короткое описание')
+
+    def test_catalog_does_not_load_description(self):
+        make_products(3)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('shop:product_list'))
+        self.assertContains(response, 'Описание товара 0')
+        selects = [q['sql'] for q in queries if 'shop_product' in q['sql']]
+        self.assertTrue(selects)
+        self.assertFalse([sql for sql in selects if '"description"' in sql])
+
+    def test_backfill_command(self):
+        make_products(2)
+        Product.objects.update(excerpt='')
+        out = StringIO()
+        call_command('backfill_excerpts', stdout=out)
+        self.assertIn('Обновлено кратких описаний: 2', out.getvalue())
+        self.assertEqual(Product.objects.get(slug='product-1').excerpt, 'Описание товара 1')
+
+
+class CountingEmailBackend(locmem.EmailBackend):
+    """locmem-бэкенд, считающий открытия соединения."""
+    opened = 0
+
+    def open(self):
+        type(self).opened += 1
+        return True
+
+
+class FailingEmailBackend(locmem.EmailBackend):
+    """Бэкенд, у которого любая отправка завершается ошибкой SMTP."""
+
+    def send_messages(self, messages):
+        raise SMTPException('550 mailbox unavailable')
+
+
+@override_settings(
+    ENABLE_EMAIL_SENDING=True,
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+)
+class OutboxTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.product = make_products(1)[0]
+
+    def queue(self, count):
+        for i in range(count):
+            OutboxEmail.objects.create(recipient=f'user{i}@example.com', subject='Тема', body='Текст')
+
+    def test_checkout_queues_email_instead_of_sending(self):
+        user = User.objects.create_user(email='buyer@example.com', password='secret')
+        self.client.force_login(user)
+        self.client.post(reverse('shop:add_to_cart', args=[self.product.id]))
+        response = self.client.post(reverse('shop:checkout'), follow=True)
+        self.assertContains(response, 'Подтверждение будет отправлено на вашу почту')
+        self.assertEqual(len(django_mail.outbox), 0)
+        email = OutboxEmail.objects.get()
+        self.assertEqual(email.recipient, 'buyer@example.com')
+
+        call_command('send_outbox', once=True, stdout=StringIO())
+        self.assertEqual(len(django_mail.outbox), 1)
+        self.assertIn(f'Заказ #{Order.objects.get().id}', django_mail.outbox[0].subject)
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboxEmail.STATUS_SENT)
+
+    def test_test_domain_is_not_queued(self):
+        user = User.objects.create_user(email='buyer@test.local', password='secret')
+        CartItem.objects.create(cart=Cart.objects.create(user=user), product=self.product,
+                                quantity=1, price=self.product.price)
+        place_order(user)
+        self.assertFalse(OutboxEmail.objects.exists())
+
+    @override_settings(EMAIL_BACKEND='shop.tests.CountingEmailBackend')
+    def test_batches_reuse_one_connection(self):
+        CountingEmailBackend.opened = 0
+        self.queue(5)
+        out = StringIO()
+        call_command('send_outbox', once=True, batch_size=2, stdout=out)
+        self.assertIn('Отправлено: 5', out.getvalue())
+        self.assertEqual(len(django_mail.outbox), 5)
+        self.assertEqual(CountingEmailBackend.opened, 1)
+
+    @override_settings(
+        EMAIL_BACKEND='shop.tests.FailingEmailBackend',
+        EMAIL_OUTBOX_MAX_ATTEMPTS=2,
+        EMAIL_OUTBOX_RETRY_DELAY=60,
+    )
+    def test_failed_email_is_retried_then_dead_lettered(self):
+        self.queue(1)
+        sender = OutboxSender()
+        with self.assertLogs('shop.mail', 'WARNING'):
+            self.assertEqual(sender.send_batch(), {'sent': 0, 'failed': 1, 'dead': 0})
+        email = OutboxEmail.objects.get()
+        self.assertEqual(email.attempts, 1)
+        self.assertIn('550 mailbox unavailable', email.last_error)
+        self.assertGreater(email.next_attempt_at, timezone.now() + timedelta(seconds=50))
+
+        # До истечения отсрочки письмо не берётся в работу
+        self.assertEqual(sender.send_batch(), {'sent': 0, 'failed': 0, 'dead': 0})
+
+        OutboxEmail.objects.update(next_attempt_at=timezone.now())
+        with self.assertLogs('shop.mail', 'ERROR'):
+            self.assertEqual(sender.send_batch(), {'sent': 0, 'failed': 0, 'dead': 1})
+        self.assertEqual(OutboxEmail.objects.get().status, OutboxEmail.STATUS_DEAD)
+
+    def test_claimed_emails_are_leased_while_sending(self):
+        self.queue(2)
+        sender = OutboxSender()
+        send = sender._send
+        seen = []
+
+        def send_and_compete(email):
+            # Пока письмо отправляется, другой обработчик его не получает
+            seen.append(OutboxSender().claim_batch())
+            send(email)
+
+        with mock.patch.object(sender, '_send', side_effect=send_and_compete):
+            self.assertEqual(sender.send_batch(), {'sent': 2, 'failed': 0, 'dead': 0})
+        self.assertEqual(seen, [[], []])
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.STATUS_SENT).count(), 2)
+
+    def test_connection_error_releases_lease(self):
+        self.queue(2)
+        sender = OutboxSender()
+        with mock.patch.object(sender.connection, 'open', side_effect=ConnectionRefusedError):
+            with self.assertRaises(ConnectionRefusedError):
+                sender.send_batch()
+        self.assertEqual(
+            OutboxEmail.objects.filter(attempts=0, next_attempt_at__lte=timezone.now()).count(), 2,
+        )
+
+
+class OrderEventsTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='buyer@test.local', password='secret')
+        self.order = Order.objects.create(user=self.user, total_amount=Decimal('100.00'))
+        self.channel = events.user_channel(self.user.pk)
+
+    def set_status(self, status):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.order.status = status
+            self.order.save()
+        return callbacks
+
+    def events_request(self):
+        request = AsyncRequestFactory().get(reverse('shop:order_events'))
+
+        async def auser():
+            return self.user
+        request.auser = auser
+        return request
+
+    async def test_status_change_is_streamed_to_owner(self):
+        response = await views.order_events(self.events_request())
+        self.assertEqual(response['Content-Type'], 'text/event-stream; charset=utf-8')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 5000\n\n')
+
+        await sync_to_async(self.set_status)(Order.STATUS_READY)
+        chunk = (await asyncio.wait_for(anext(stream), 1)).decode()
+        self.assertTrue(chunk.startswith('event: status\n'))
+        self.assertIn(f'"id": {self.order.id}', chunk)
+        self.assertIn('"status_display": "Готов к выдаче"', chunk)
+
+    async def test_stream_sends_heartbeat_and_unsubscribes(self):
+        broker = events.get_broker()
+        stream = views._order_event_stream(self.user.pk)
+        await anext(stream)
+        self.assertEqual(broker.subscriber_count(self.channel), 1)
+        with mock.patch.object(views, 'EVENTS_HEARTBEAT_INTERVAL', 0.01):
+            self.assertEqual(await anext(stream), ': ping\n\n')
+        await stream.aclose()
+        self.assertEqual(broker.subscriber_count(self.channel), 0)
+
+    def test_save_without_status_change_publishes_nothing(self):
+        self.assertEqual(len(self.set_status(self.order.status)), 0)
+        self.assertEqual(len(self.set_status(Order.STATUS_IN_ASSEMBLY)), 1)
+
+    def test_requires_login_and_asgi(self):
+        url = reverse('shop:order_events')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.user)
+        # Тестовый клиент работает как WSGI: поток не открывается
+        self.assertEqual(self.client.get(url).status_code, 204)
+
+
+class OrderHistoryTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='buyer@test.local', password='secret')
+        self.client.force_login(self.user)
+
+    def make_orders(self, count, user=None):
+        return [
+            Order.objects.create(user=user or self.user, total_amount=Decimal('10.00'), item_count=1)
+            for _ in range(count)
+        ]
+
+    def test_summary_is_stored_at_checkout(self):
+        products = make_products(2)
+        cart = Cart.objects.create(user=self.user)
+        for product in products:
+            CartItem.objects.create(cart=cart, product=product, quantity=3, price=product.price)
+        order, _ = place_order(self.user)
+        self.assertEqual(order.item_count, 6)
+        self.assertEqual(order.preview_image.name, products[0].image.name)
+
+        response = self.client.get(reverse('shop:order_list'))
+        self.assertContains(response, '<td>6</td>', html=True)
+        self.assertContains(response, products[0].image.url)
+
+    def test_history_is_cursor_paginated(self):
+        orders = self.make_orders(25)
+        self.make_orders(3, user=User.objects.create_user(email='other@test.local', password='secret'))
+        first = self.client.get(reverse('shop:order_list'))
+        self.assertEqual([o.id for o in first.context['orders']], [o.id for o in reversed(orders)][:20])
+        second = self.client.get(reverse('shop:order_list'), {'cursor': first.context['page_obj'].next_cursor})
+        self.assertEqual([o.id for o in second.context['orders']], [o.id for o in reversed(orders)][20:])
+        self.assertFalse(second.context['page_obj'].has_next())
+
+    def test_queries_do_not_depend_on_page_size(self):
+        counts = []
+        for count in (2, 18):
+            self.make_orders(count)
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse('shop:order_list'))
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class OrderSnapshotTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.products = make_products(2)
+        self.user = User.objects.create_user(email='buyer@test.local', password='secret')
+        cart = Cart.objects.create(user=self.user)
+        for product in self.products:
+            CartItem.objects.create(cart=cart, product=product, quantity=1, price=product.price)
+        self.order, _ = place_order(self.user)
+        self.client.force_login(self.user)
+
+    def test_checkout_snapshots_products(self):
+        item = self.order.items.get(product=self.products[0])
+        self.assertEqual(item.product_name, 'Товар 0')
+        self.assertEqual(item.product_slug, 'product-0')
+        self.assertEqual(item.product_image.name, 'products/test.jpg')
+
+    def test_history_survives_catalog_changes(self):
+        self.products[0].name = 'Новое название'
+        self.products[0].save()
+        self.products[1].delete()
+        response = self.client.get(reverse('shop:order_detail', args=[self.order.id]))
+        self.assertContains(response, 'Товар 0')
+        self.assertContains(response, 'Товар 1')
+        self.assertNotContains(response, 'Новое название')
+        self.assertEqual(self.order.items.count(), 2)
+
+    def test_order_detail_does_not_read_catalog(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('shop:order_detail', args=[self.order.id]))
+        self.assertFalse([q['sql'] for q in queries if 'shop_product' in q['sql']])
+
+
+class AdminChangelistTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(email='admin@test.local', password='secret')
+        self.client.force_login(self.admin)
+        self.products = make_products(3)
+        self.created = 0
+
+    def add_rows(self, count):
+        """Создаёт count пользователей, у каждого корзина и заказ с позицией."""
+        for _ in range(count):
+            self.created += 1
+            user = User.objects.create(email=f'buyer{self.created}@test.local')
+            cart = Cart.objects.create(user=user)
+            CartItem.objects.create(cart=cart, product=self.products[0], quantity=1, price=Decimal('1'))
+            order = Order.objects.create(user=user, total_amount=Decimal('1'))
+            OrderItem.objects.create(order=order, product=self.products[0], quantity=1, price=Decimal('1'))
+
+    def test_changelist_queries_do_not_depend_on_rows(self):
+        for name in ('cart', 'cartitem', 'order', 'orderitem'):
+            url = reverse(f'admin:shop_{name}_changelist')
+            counts = []
+            for count in (2, 20):
+                self.add_rows(count)
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                counts.append(len(queries))
+            self.assertEqual(counts[0], counts[1], name)
+
+    def test_id_filter(self):
+        self.add_rows(5)
+        carts = list(Cart.objects.order_by('id').values_list('id', flat=True))
+        url = reverse('admin:shop_cartitem_changelist')
+        response = self.client.get(url, {'cart_id': carts[1]})
+        self.assertEqual(response.context['cl'].result_count, 1)
+        response = self.client.get(url, {'cart_id': f'{carts[1]}-{carts[3]}'})
+        self.assertEqual(response.context['cl'].result_count, 3)
+        self.assertContains(response, f'value="{carts[1]}-{carts[3]}"')
+        response = self.client.get(url, {'cart_id': 'abc'})
+        self.assertRedirects(response, f'{url}?e=1', fetch_redirect_response=False)
+
+    def test_estimated_count_only_for_unfiltered_large_tables(self):
+        self.add_rows(3)
+        with mock.patch.object(EstimatedCountPaginator, 'estimate', return_value=5_000_000):
+            self.assertEqual(EstimatedCountPaginator(Order.objects.all(), 100).count, 5_000_000)
+        with mock.patch.object(EstimatedCountPaginator, 'estimate', return_value=50):
+            self.assertEqual(EstimatedCountPaginator(Order.objects.all(), 100).count, 3)
+        # На SQLite оценки нет, фильтрованные выборки считаются точно
+        self.assertIsNone(EstimatedCountPaginator(Order.objects.all(), 100).estimate())
+        self.assertIsNone(EstimatedCountPaginator(Order.objects.filter(status='ready'), 100).estimate())
+
+
+@override_settings(ENABLE_EMAIL_SENDING=True)
+class StatusTransitionTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(email='buyer@example.com')
+        self.created = [Order.objects.create(user=self.user, total_amount=Decimal('1')) for _ in range(3)]
+        self.assembling = [
+            Order.objects.create(user=self.user, total_amount=Decimal('1'), status=Order.STATUS_IN_ASSEMBLY)
+            for _ in range(2)
+        ]
+
+    def statuses(self):
+        return dict(Order.objects.values_list('id', 'status'))
+
+    def test_single_update_moves_only_valid_orders(self):
+        with self.captureOnCommitCallbacks() as callbacks, CaptureQueriesContext(connection) as queries:
+            moved = transition_orders(Order.objects.all(), Order.STATUS_READY)
+        self.assertEqual(moved, 2)
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('UPDATE')]), 1)
+        statuses = self.statuses()
+        self.assertEqual({statuses[o.id] for o in self.assembling}, {Order.STATUS_READY})
+        self.assertEqual({statuses[o.id] for o in self.created}, {Order.STATUS_CREATED})
+        # Уведомления в очереди, события SSE — после фиксации
+        self.assertEqual(OutboxEmail.objects.count(), 2)
+        self.assertEqual(len(callbacks), 1)
+
+    def test_invalid_target_status(self):
+        with self.assertRaises(InvalidTransition):
+            transition_orders(Order.objects.all(), Order.STATUS_CREATED)
+
+    def test_admin_action(self):
+        admin = User.objects.create_superuser(email='admin@test.local', password='secret')
+        self.client.force_login(admin)
+        response = self.client.post(reverse('admin:shop_order_changelist'), {
+            'action': 'move_to_assembly',
+            '_selected_action': [self.created[0].id, self.assembling[0].id],
+        }, follow=True)
+        self.assertContains(response, 'Переведено в статус «В сборке»: 1 из 2.')
+        self.assertContains(response, 'Пропущено заказов: 1')
+        self.assertEqual(self.statuses()[self.created[0].id], Order.STATUS_IN_ASSEMBLY)
+
+    def test_command(self):
+        with self.assertRaises(CommandError):
+            call_command('transition_orders', 'in_assembly', stdout=StringIO())
+        out = StringIO()
+        call_command('transition_orders', 'in_assembly', '--ids', str(self.created[0].id), '--dry-run', stdout=out)
+        self.assertIn('Будет переведено заказов: 1', out.getvalue())
+        call_command('transition_orders', 'in_assembly', '--all', stdout=out)
+        self.assertIn('«В сборке»: 3', out.getvalue())
+
+    def test_single_save_also_queues_notification(self):
+        order = self.created[0]
+        order.status = Order.STATUS_IN_ASSEMBLY
+        order.save()
+        self.assertEqual(OutboxEmail.objects.get().subject, f'Заказ #{order.id}: В сборке')
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        self.products = make_products(2)
+        self.user = User.objects.create(email='buyer@example.com')
+        self.orders = []
+        for status in (Order.STATUS_CREATED, Order.STATUS_DELIVERED):
+            order = Order.objects.create(user=self.user, total_amount=Decimal('300.00'), status=status)
+            for product in self.products:
+                OrderItem.objects.create(order=order, product=product, product_name=product.name,
+                                         quantity=2, price=product.price)
+            self.orders.append(order)
+        self.admin = User.objects.create_superuser(email='admin@test.local', password='secret')
+        self.client.force_login(self.admin)
+
+    def read_csv(self, response):
+        content = b''.join(response.streaming_content).decode()
+        return list(csv.DictReader(content.splitlines()))
+
+    def test_admin_export_streams_filtered_csv(self):
+        response = self.client.get(reverse('admin:shop_order_export'), {'status': 'delivered'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = self.read_csv(response)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['order_id'], str(self.orders[1].id))
+        self.assertEqual(rows[0]['user_email'], 'buyer@example.com')
+        self.assertEqual(rows[0]['product_name'], 'Товар 0')
+        self.assertEqual(rows[0]['price'], '100.00')
+
+    def test_admin_export_validates_parameters(self):
+        url = reverse('admin:shop_order_export')
+        self.assertEqual(self.client.get(url, {'date_from': '01.10.2026'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'status': 'lost'}).status_code, 400)
+        today = timezone.localdate().isoformat()
+        rows = self.read_csv(self.client.get(url, {'date_from': today, 'date_to': today}))
+        self.assertEqual(len(rows), 4)
+
+    def test_admin_action_exports_selected_orders_as_jsonl(self):
+        response = self.client.post(reverse('admin:shop_order_changelist'), {
+            'action': 'export_jsonl',
+            '_selected_action': [self.orders[0].id],
+        })
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([r['order_id'] for r in records], [self.orders[0].id] * 2)
+        self.assertEqual(records[0]['quantity'], 2)
+        self.assertEqual(records[0]['total_amount'], '300.00')
+
+    def test_command(self):
+        out = StringIO()
+        call_command('export_orders', '--format', 'jsonl', '--status', 'created', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[0])['status'], 'created')
+
+    def test_rows_come_from_one_streamed_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            rows = list(exports.export_rows(chunk_size=1))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(len(queries), 1)
+
+
+class SalesRollupTests(TestCase):
+
+    def setUp(self):
+        self.products = make_products(3)
+        self.user = User.objects.create(email='buyer@example.com')
+        self.cart = Cart.objects.create(user=self.user)
+
+    def checkout(self, quantities):
+        for product, quantity in zip(self.products, quantities):
+            CartItem.objects.create(cart=self.cart, product=product, quantity=quantity, price=product.price)
+        order, _ = place_order(self.user, uuid.uuid4())
+        return order
+
+    def snapshot(self):
+        return (
+            list(DailySales.objects.values_list('date', 'order_count', 'item_count', 'revenue')),
+            sorted(ProductDailySales.objects.values_list('product_id', 'quantity', 'order_count', 'revenue')),
+            dict(OrderStatusCount.objects.filter(order_count__gt=0).values_list('status', 'order_count')),
+        )
+
+    def test_checkout_increments_rollups(self):
+        self.checkout([2, 1])
+        self.checkout([1])
+        day = DailySales.objects.get()
+        self.assertEqual((day.date, day.order_count, day.item_count), (timezone.localdate(), 2, 4))
+        self.assertEqual(day.revenue, Decimal('100') * 3 + Decimal('101'))
+        first = ProductDailySales.objects.get(product=self.products[0])
+        self.assertEqual((first.quantity, first.order_count, first.revenue), (3, 2, Decimal('300')))
+        self.assertEqual(first.product_name, 'Товар 0')
+        self.assertEqual(OrderStatusCount.objects.get(status=Order.STATUS_CREATED).order_count, 2)
+
+    def test_transitions_move_status_counts(self):
+        orders = [self.checkout([1]) for _ in range(3)]
+        transition_orders(Order.objects.filter(id__in=[o.id for o in orders[:2]]), Order.STATUS_IN_ASSEMBLY)
+        orders[2].status = Order.STATUS_IN_ASSEMBLY
+        orders[2].save()
+        transition_orders(Order.objects.filter(id=orders[0].id), Order.STATUS_READY)
+        counts = dict(OrderStatusCount.objects.values_list('status', 'order_count'))
+        self.assertEqual(counts, {
+            Order.STATUS_CREATED: 0, Order.STATUS_IN_ASSEMBLY: 2, Order.STATUS_READY: 1,
+        })
+
+    def test_rebuild_matches_incremental_rollups(self):
+        self.checkout([2, 1, 3])
+        self.checkout([1])
+        transition_orders(Order.objects.all(), Order.STATUS_IN_ASSEMBLY)
+        incremental = self.snapshot()
+        out = StringIO()
+        call_command('rebuild_sales_rollups', stdout=out)
+        self.assertIn('дней 1', out.getvalue())
+        self.assertEqual(self.snapshot(), incremental)
+        call_command('rebuild_sales_rollups', '--since', timezone.localdate().isoformat(), stdout=out)
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_rebuild_keeps_rollups_of_deleted_products(self):
+        self.checkout([2, 1])
+        deleted_id = self.products[0].id
+        self.products[0].delete()
+        incremental = self.snapshot()
+        self.assertIn(deleted_id, [row[0] for row in incremental[1]])
+        analytics.rebuild()
+        self.assertEqual(self.snapshot(), incremental)
+        analytics.rebuild(since=timezone.localdate())
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_dashboard_queries_do_not_depend_on_order_count(self):
+        counts = []
+        for _ in range(2):
+            self.checkout([1, 2])
+            with CaptureQueriesContext(connection) as queries:
+                data = analytics.dashboard()
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(data['total_orders'], 2)
+        self.assertEqual(data['top_products'][0]['name'], 'Товар 1')
+
+    def test_admin_dashboard(self):
+        self.checkout([1])
+        admin = User.objects.create_superuser(email='admin@test.local', password='secret')
+        self.client.force_login(admin)
+        url = reverse('admin:shop_dailysales_changelist')
+        response = self.client.get(url, {'days': 7})
+        self.assertContains(response, 'Лучшие товары')
+        self.assertContains(response, 'Товар 0')
+        self.assertEqual(response.context['days'], 7)
+        self.assertEqual(self.client.get(url, {'days': 'x'}).context['days'], 30)
+        self.assertEqual(self.client.get(reverse('admin:shop_dailysales_add')).status_code, 403)
+
+
+class RecommendationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.products = make_products(5)
+        self.user = User.objects.create(email='buyer@example.com')
+
+    def order(self, *indexes):
+        order = Order.objects.create(user=self.user, total_amount=Decimal('1'))
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=self.products[i], product_name='', quantity=1, price=Decimal('1'))
+            for i in indexes
+        ])
+        # Пересчёт не учитывает заказы моложе REFRESH_LAG
+        Order.objects.filter(id=order.id).update(created_at=timezone.now() - timedelta(hours=1))
+        return order
+
+    def recommended(self, index):
+        return [p.slug for p in recommendations.for_product(self.products[index])]
+
+    def pairs(self):
+        return sorted(ProductPair.objects.values_list('product_id', 'other_id', 'order_count'))
+
+    def test_python_pair_counts(self):
+        lines = [(1, 10), (1, 20), (1, 20), (2, 20), (2, 30), (2, 10), (3, 30)]
+        self.assertEqual(dict(recommendations._python_pairs(lines)), {(10, 20): 2, (20, 30): 1, (10, 30): 1})
+
+    @skipIf(recommendations.sparse is None, 'NumPy/SciPy не установлены')
+    def test_sparse_pair_counts_match_python(self):
+        lines = [(1, 10), (1, 20), (1, 20), (2, 20), (2, 30), (2, 10), (3, 30)]
+        self.assertEqual(recommendations._sparse_pairs(lines), dict(recommendations._python_pairs(lines)))
+
+    def test_refresh_counts_only_new_orders(self):
+        self.order(0, 1, 2)
+        self.order(0, 1)
+        self.assertEqual(recommendations.refresh(), 3)
+        self.assertEqual(self.recommended(0), ['product-1', 'product-2'])
+        self.assertEqual(recommendations.refresh(), 0)
+
+        self.order(0, 2)
+        self.order(0, 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(recommendations.refresh(), 2)
+        self.assertEqual(self.recommended(0), ['product-2', 'product-1'])
+        self.assertEqual(self.recommended(3), [])
+
+        incremental = self.pairs()
+        out = StringIO()
+        call_command('refresh_recommendations', '--rebuild', stdout=out)
+        self.assertIn('товаров: 3', out.getvalue())
+        self.assertEqual(self.pairs(), incremental)
+
+    def test_fresh_orders_wait_for_lag(self):
+        order = self.order(0, 1)
+        Order.objects.filter(id=order.id).update(created_at=timezone.now())
+        self.assertEqual(recommendations.refresh(), 0)
+        self.assertFalse(ProductRecommendation.objects.exists())
+
+    def test_top_n_and_inactive_products(self):
+        self.order(0, 1, 2, 3, 4)
+        self.order(0, 4)
+        with override_settings(RECOMMENDATIONS_PER_PRODUCT=2):
+            recommendations.refresh()
+        self.assertEqual(self.recommended(0), ['product-4', 'product-1'])
+        Product.objects.filter(id=self.products[4].id).update(is_active=False)
+        self.assertEqual(self.recommended(0), ['product-1'])
+
+    def test_product_page_reads_recommendations_with_one_query(self):
+        self.order(0, 1, 2)
+        recommendations.refresh()
+        with self.assertNumQueries(1):
+            self.assertEqual(len(list(recommendations.for_product(self.products[0]))), 2)
+        response = self.client.get(reverse('shop:product_detail', args=['product-0']))
+        self.assertContains(response, 'Часто покупают вместе')
+        self.assertContains(response, reverse('shop:product_detail', args=['product-2']))
+        response = self.client.get(reverse('shop:product_detail', args=['product-3']))
+        self.assertNotContains(response, 'Часто покупают вместе')
+
+    def test_cached_product_page_drops_deactivated_recommendation(self):
+        self.order(0, 1, 2)
+        recommendations.refresh()
+        url = reverse('shop:product_detail', args=['product-0'])
+        self.assertContains(self.client.get(url), reverse('shop:product_detail', args=['product-2']))
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'HIT')
+        other = self.products[2]
+        other.is_active = False
+        other.save()
+        response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        self.assertNotContains(response, reverse('shop:product_detail', args=['product-2']))
+
+
+class CatalogFilterTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.phones = Category.objects.create(name='Смартфоны', slug='phones')
+        self.laptops = Category.objects.create(name='Ноутбуки', slug='laptops')
+        self.products = make_products(6)
+        prices = [Decimal('25000'), Decimal('45000'), Decimal('9000'), Decimal('80000'), Decimal('500'), Decimal('9000')]
+        for product, price, category in zip(self.products, prices, [self.phones] * 3 + [self.laptops] * 2 + [None]):
+            Product.objects.filter(id=product.id).update(price=price, category=category)
+        self.url = reverse('shop:product_list')
+
+    def slugs(self, response):
+        return [p.slug for p in response.context['page_obj']]
+
+    def test_price_range_category_and_sort(self):
+        response = self.client.get(self.url, {'category': 'phones', 'price_max': '30000', 'sort': 'price_asc'})
+        self.assertEqual(self.slugs(response), ['product-2', 'product-0'])
+        response = self.client.get(self.url, {'price_min': '9000', 'sort': 'price_desc'})
+        self.assertEqual(self.slugs(response), ['product-3', 'product-1', 'product-0', 'product-5', 'product-2'])
+        # Неверные значения отбрасываются
+        response = self.client.get(self.url, {'price_min': 'дёшево', 'sort': 'random'})
+        self.assertEqual(len(self.slugs(response)), 6)
+        self.assertEqual(response.context['filters']['sort'], 'new')
+
+    def test_cursor_pages_follow_price_sort_and_keep_filters(self):
+        with mock.patch.object(views, 'PRODUCTS_PER_PAGE', 2):
+            response = self.client.get(self.url, {'sort': 'price_asc', 'price_min': '1000'})
+            page = response.context['page_obj']
+            self.assertContains(response, f'?sort=price_asc&amp;price_min=1000&amp;cursor={page.next_cursor}')
+            slugs = self.slugs(response)
+            while page.has_next():
+                response = self.client.get(self.url, {'sort': 'price_asc', 'price_min': '1000', 'cursor': page.next_cursor})
+                page = response.context['page_obj']
+                slugs += self.slugs(response)
+            # Цена 9000 у двух товаров: порядок внутри цены — по id
+            self.assertEqual(slugs, ['product-2', 'product-5', 'product-0', 'product-1', 'product-3'])
+            # Курсор другой сортировки не подходит: открывается первая страница
+            response = self.client.get(self.url, {'cursor': page.previous_cursor})
+            self.assertEqual(response.context['page_obj'].previous_cursor, None)
+
+    def test_facet_counts_are_cached_until_catalog_changes(self):
+        filters = catalog.parse_filters({'price_max': '30000'})
+        facets = catalog.facet_counts(filters)
+        self.assertEqual({c['slug']: c['count'] for c in facets['categories']}, {'laptops': 1, 'phones': 2})
+        # Ценовой фасет считается без собственного фильтра цены
+        self.assertEqual([r['count'] for r in facets['prices']], [1, 0, 2, 1, 2, 0])
+        with self.assertNumQueries(0):
+            self.assertEqual(catalog.facet_counts(filters), facets)
+
+        laptop = Product.objects.get(slug='product-3')
+        laptop.price = Decimal('1000')
+        laptop.save()
+        facets = catalog.facet_counts(filters)
+        self.assertEqual({c['slug']: c['count'] for c in facets['categories']}, {'laptops': 2, 'phones': 2})
+        self.phones.delete()
+        self.assertEqual([c['slug'] for c in catalog.facet_counts(filters)['categories']], ['laptops'])
+
+    def test_boundary_price_falls_into_one_range(self):
+        Product.objects.filter(slug='product-3').update(price=Decimal('10000'))
+        facets = catalog.facet_counts(catalog.parse_filters({}))
+        self.assertEqual([r['count'] for r in facets['prices']], [1, 0, 2, 2, 1, 0])
+        # Ссылки фасета: верхняя граница не включается
+        self.assertNotIn('product-3', self.slugs(self.client.get(self.url, {'price_range': '2'})))
+        self.assertIn('product-3', self.slugs(self.client.get(self.url, {'price_range': '3'})))
+        # Цена, введённая покупателем, включает границу
+        self.assertIn('product-3', self.slugs(self.client.get(self.url, {'price_max': '10000'})))
+        response = self.client.get(self.url, {'price_range': '3'})
+        self.assertContains(response, 'price_range=3" class="list-group-item list-group-item-action d-flex justify-content-between active"')
+
+    def test_every_filter_and_sort_uses_an_index(self):
+        table = Product._meta.db_table
+        for category in (None, 'phones'):
+            for price_min, price_max in ((None, None), ('1000', None), (None, '30000'), ('1000', '30000')):
+                for sort, (key, descending) in catalog.SORTS.items():
+                    filters = catalog.parse_filters({
+                        'category': category, 'price_min': price_min, 'price_max': price_max, 'sort': sort,
+                    })
+                    paginator = KeysetPaginator(catalog.filter_products(filters), 12, key, descending)
+                    queryset = paginator.queryset[:13]
+                    if connection.vendor == 'postgresql':
+                        # На маленькой таблице планировщик выбрал бы полный просмотр
+                        with connection.cursor() as cursor:
+                            cursor.execute('SET LOCAL enable_seqscan = off')
+                        plan = queryset.explain()
+                        self.assertNotIn(f'Seq Scan on {table}', plan, filters)
+                    else:
+                        plan = queryset.explain()
+                        self.assertNotRegex(plan, rf'SCAN {table}(?! USING)', filters)
+                        self.assertIn('INDEX product_', plan, filters)
+
+
+class ProfilingTests(profiling.QueryBudgetMixin, TestCase):
+
+    # Бюджет запросов страниц: сессия, пользователь и данные страницы
+    BUDGETS = {
+        'shop:product_list': 4,
+        'shop:product_detail': 2,
+        'shop:cart': 4,
+        'shop:checkout': 4,
+        'shop:order_list': 3,
+    }
+
+    def setUp(self):
+        cache.clear()
+        profiling.reset()
+        self.products = make_products(5)
+        self.user = User.objects.create_user(email='buyer@test.local', password='secret')
+
+    def fill_cart(self):
+        cart = Cart.objects.create(user=self.user)
+        for product in self.products:
+            CartItem.objects.create(cart=cart, product=product, quantity=1, price=product.price)
+
+    def test_pages_stay_within_query_budgets(self):
+        self.assertQueryBudget(reverse('shop:product_list'), self.BUDGETS['shop:product_list'])
+        self.assertQueryBudget(reverse('shop:product_detail', args=['product-1']), self.BUDGETS['shop:product_detail'])
+        self.fill_cart()
+        self.client.force_login(self.user)
+        for name in ('shop:cart', 'shop:checkout', 'shop:order_list'):
+            self.assertQueryBudget(reverse(name), self.BUDGETS[name])
+
+    def test_budget_failures_list_queries(self):
+        with self.assertRaisesRegex(AssertionError, r'shop:product_list: \d+ запросов к базе, бюджет 0'):
+            self.assertQueryBudget(reverse('shop:product_list'), 0)
+
+    def test_repeated_queries_are_reported_as_n_plus_one(self):
+        profile = profiling.RequestProfile()
+        with connection.execute_wrapper(profile):
+            for product in self.products:
+                Product.objects.get(id=product.id)
+            Product.objects.count()
+        repeated = profile.repeated()
+        self.assertEqual(list(repeated.values()), [5])
+        self.assertIn('WHERE "shop_product"."id" = ?', next(iter(repeated)))
+        self.assertEqual(profile.repeated(threshold=6), {})
+
+    def test_fingerprint_ignores_values(self):
+        self.assertEqual(
+            profiling.fingerprint("SELECT * FROM t2 WHERE a = 'x''y' AND b IN (1, 2, 3) AND c = %s"),
+            'SELECT * FROM t2 WHERE a = ? AND b IN (...) AND c = ?',
+        )
+
+    @override_settings(DEBUG=True, REQUEST_PROFILING=True)
+    def test_debug_headers_and_staff_report(self):
+        response = self.client.get(reverse('shop:product_list'))
+        self.assertRegex(response['Server-Timing'], r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+$')
+        self.assertEqual(response['X-Query-Count'], str(response.profile.query_count))
+        self.assertGreater(response.profile.template_time, 0)
+
+        report_url = reverse('shop:profiling_report')
+        self.assertEqual(self.client.get(report_url).status_code, 302)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(report_url).status_code, 302)
+        staff = User.objects.create_user(email='staff@test.local', password='secret', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(report_url)
+        self.assertContains(response, '<code>shop:product_list</code>', html=True)
+        self.client.post(report_url)
+        self.assertEqual([stats.view for stats in profiling.report()], ['shop:profiling_report'])
+
+    @override_settings(REQUEST_PROFILING=False)
+    def test_disabled_profiling_records_nothing(self):
+        response = self.client.get(reverse('shop:product_list'))
+        self.assertFalse(hasattr(response, 'profile'))
+        self.assertEqual(profiling.report(), [])
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.product = make_products(1)[0]
+        self.user = User.objects.create(email='buyer@test.local')
+
+    def value(self, metric, **labels):
+        return metrics.snapshot().get(metric._key(labels), 0)
+
+    def test_checkout_and_cart_counters(self):
+        created = self.value(metrics.CHECKOUTS, result='created')
+        duplicate = self.value(metrics.CHECKOUTS, result='duplicate')
+        empty = self.value(metrics.CHECKOUTS, result='empty_cart')
+        added = self.value(metrics.CART_MUTATIONS, action='add')
+        self.client.force_login(self.user)
+        self.client.post(reverse('shop:add_to_cart', args=[self.product.id]))
+        token = uuid.uuid4()
+        place_order(self.user, checkout_token=token)
+        place_order(self.user, checkout_token=token)
+        with self.assertRaises(EmptyCartError):
+            place_order(self.user)
+        self.assertEqual(self.value(metrics.CART_MUTATIONS, action='add'), added + 1)
+        self.assertEqual(self.value(metrics.CHECKOUTS, result='created'), created + 1)
+        self.assertEqual(self.value(metrics.CHECKOUTS, result='duplicate'), duplicate + 1)
+        self.assertEqual(self.value(metrics.CHECKOUTS, result='empty_cart'), empty + 1)
+
+    def test_finished_threads_are_folded_into_process_total(self):
+        before = self.value(metrics.CART_MUTATIONS, action='test')
+        for _ in range(20):
+            thread = threading.Thread(target=metrics.CART_MUTATIONS.inc, kwargs={'action': 'test'})
+            thread.start()
+            thread.join()
+        self.assertEqual(self.value(metrics.CART_MUTATIONS, action='test'), before + 20)
+        # Словари завершившихся потоков не накапливаются
+        self.assertTrue(all(thread.is_alive() for thread, _ in metrics._shards))
+        self.assertEqual(self.value(metrics.CART_MUTATIONS, action='test'), before + 20)
+
+    def test_endpoint_renders_text_format(self):
+        self.client.get(reverse('shop:product_list'))
+        response = self.client.get(reverse('shop:metrics'))
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        text = response.content.decode()
+        self.assertIn('# TYPE quickcart_request_duration_seconds histogram', text)
+        self.assertIn('quickcart_request_duration_seconds_bucket{view="shop:product_list",method="GET",le="+Inf"}', text)
+        self.assertIn('quickcart_cache_requests_total{cache="facets",result="miss"}', text)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram('quickcart_test_seconds', 'Тест', ['kind'], buckets=(0.1, 1))
+        self.addCleanup(metrics.REGISTRY.pop, histogram.name)
+        for value in (0.05, 0.5, 0.5, 3):
+            histogram.observe(value, kind='a"b')
+        text = metrics.render()
+        self.assertIn('quickcart_test_seconds_bucket{kind="a\\"b",le="0.1"} 1\n', text)
+        self.assertIn('quickcart_test_seconds_bucket{kind="a\\"b",le="1"} 3\n', text)
+        self.assertIn('quickcart_test_seconds_bucket{kind="a\\"b",le="+Inf"} 4\n', text)
+        self.assertIn('quickcart_test_seconds_sum{kind="a\\"b"} 4.05\n', text)
+        self.assertIn('quickcart_test_seconds_count{kind="a\\"b"} 4\n', text)
+
+    def test_multiprocess_files_are_summed(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        # Файл «другого воркера»
+        with open(os.path.join(directory, '1.json'), 'w') as output:
+            json.dump([['quickcart_checkouts_total', ['created'], 5]], output)
+        own = self.value(metrics.CHECKOUTS, result='created')
+        with self.settings(METRICS_MULTIPROCESS_DIR=directory):
+            text = metrics.render()
+        self.assertTrue(os.path.exists(os.path.join(directory, f'{os.getpid()}.json')))
+        self.assertIn(f'quickcart_checkouts_total{{result="created"}} {own + 5}\n', text)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token_is_required_when_configured(self):
+        url = reverse('shop:metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+
+@override_settings(SLOW_QUERY_ASYNC=False, SLOW_QUERY_THRESHOLD_MS=0)
+class SlowQueryLogTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        slowlog.drain()
+        SlowQuery.objects.all().delete()
+        make_products(3)
+
+    def test_slow_queries_are_logged_with_view_and_stack(self):
+        self.client.get(reverse('shop:product_list'))
+        self.assertGreater(slowlog.drain(), 0)
+        entry = SlowQuery.objects.filter(sql__contains='shop_product').first()
+        self.assertEqual(entry.view, 'shop:product_list')
+        self.assertIn('shop/views.py', entry.stack)
+        self.assertNotIn('shop/slowlog.py', entry.stack)
+        self.assertEqual(len(entry.fingerprint), 32)
+        # План сохраняется только на PostgreSQL
+        self.assertEqual(entry.plan, '')
+
+    def test_fast_queries_and_unsampled_ones_are_not_logged(self):
+        with self.settings(SLOW_QUERY_THRESHOLD_MS=60_000):
+            self.client.get(reverse('shop:product_list'))
+        with self.settings(SLOW_QUERY_SAMPLE_RATE=0):
+            self.client.get(reverse('shop:product_list'))
+        with self.settings(SLOW_QUERY_LOG=False):
+            self.client.get(reverse('shop:product_list'))
+        self.assertEqual(slowlog.drain(), 0)
+
+    def test_same_query_with_other_parameters_shares_fingerprint(self):
+        with slowlog.log_slow_queries(label='test'):
+            Product.objects.filter(slug='product-0').first()
+            Product.objects.filter(slug='product-1').first()
+        slowlog.drain()
+        first, second = SlowQuery.objects.order_by('id')
+        self.assertEqual(first.fingerprint, second.fingerprint)
+        self.assertEqual(first.view, 'test')
+
+    @override_settings(SLOW_QUERY_LOG_MAX_ROWS=2)
+    def test_trim_keeps_latest_rows(self):
+        with slowlog.log_slow_queries():
+            for _ in range(4):
+                Product.objects.count()
+        slowlog.drain()
+        newest = list(SlowQuery.objects.values_list('id', flat=True)[:2])
+        slowlog.trim()
+        self.assertEqual(list(SlowQuery.objects.values_list('id', flat=True)), newest)
+
+    def test_summary_command_lists_top_offenders(self):
+        for view in ('shop:product_list', 'shop:product_list', 'shop:product_detail'):
+            SlowQuery.objects.create(fingerprint='a' * 32, sql='SELECT * FROM shop_order WHERE id = %s',
+                                     view=view, stack='shop/views.py:10 checkout',
+                                     duration_ms=300, plan='Seq Scan on shop_order')
+        SlowQuery.objects.create(fingerprint='b' * 32, sql='SELECT 1', duration_ms=250)
+        out = StringIO()
+        call_command('slow_queries', '--plans', stdout=out)
+        text = out.getvalue()
+        self.assertLess(text.index('shop_order'), text.index('SELECT ?'))
+        self.assertIn('3 раз, всего 900 мс', text)
+        self.assertIn('shop:product_list (2), shop:product_detail (1)', text)
+        self.assertIn('Seq Scan on shop_order', text)
+        out = StringIO()
+        call_command('slow_queries', '--view', 'shop:cart', stdout=out)
+        self.assertIn('Медленных запросов нет', out.getvalue())
+
+
+class StorefrontBenchmarkTests(TransactionTestCase):
+
+    def test_percentile_uses_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(loadtest.percentile(values, 0.5), 50)
+        self.assertEqual(loadtest.percentile(values, 0.99), 99)
+        self.assertEqual(loadtest.percentile([7], 0.95), 7)
+        self.assertIsNone(loadtest.percentile([], 0.5))
+
+    def test_http_session_does_not_resend_post(self):
+        session = loadtest.HttpSession.__new__(loadtest.HttpSession)
+        session.cookies = {}
+        session.connection = mock.Mock()
+        response = mock.Mock(status=200)
+        response.headers.get_all.return_value = None
+        response.headers.get.return_value = None
+        with mock.patch.object(session, '_send', side_effect=http.client.RemoteDisconnected) as send:
+            with self.assertRaises(http.client.RemoteDisconnected):
+                session.request('POST', '/cart/add/1/')
+        self.assertEqual(send.call_count, 1)
+        with mock.patch.object(session, '_send', side_effect=[http.client.RemoteDisconnected, response]) as send:
+            self.assertEqual(session.request('GET', '/cart/'), (200, None))
+        self.assertEqual(send.call_count, 2)
+
+    def test_flow_runs_and_writes_json(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'results.json')
+        call_command('bench_storefront', '--products', '10', '--customers', '2', '--orders', '5',
+                     '--users', '2', '--iterations', '2', '--json', path, stdout=StringIO())
+        with open(path) as source:
+            results = json.load(source)
+        self.assertEqual(list(results['steps']), loadtest.FLOW)
+        for step in results['steps'].values():
+            self.assertEqual((step['requests'], step['errors']), (4, 0))
+            self.assertGreater(step['queries_avg'], 0)
+        self.assertEqual(results['database'], connection.vendor)
+        # Синтетические данные удалены, сводки продаж пересчитаны
+        self.assertFalse(User.objects.filter(email__startswith=loadtest.BENCH_PREFIX).exists())
+        self.assertFalse(Product.objects.filter(slug__startswith=loadtest.BENCH_PREFIX).exists())
+        self.assertFalse(DailySales.objects.exists())
+
+
+class FakeDataTests(TestCase):
+
+    def generate(self, **options):
+        return fakedata.generate(**{'users': 30, 'products': 20, 'orders': 200, 'carts': 5,
+                                    'categories': 3, 'seed': 1, **options})
+
+    def snapshot(self):
+        # Данные без привязки к начальным id таблиц
+        order_base = Order.objects.order_by('id').values_list('id', flat=True).first()
+        product_base = Product.objects.order_by('id').values_list('id', flat=True).first()
+        return [
+            (order_id - order_base, status, total, product_id - product_base, quantity)
+            for order_id, status, total, product_id, quantity in OrderItem.objects.order_by('id').values_list(
+                'order_id', 'order__status', 'order__total_amount', 'product_id', 'quantity'
+            )
+        ]
+
+    def test_generates_consistent_rows(self):
+        totals = self.generate()
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Product.objects.count(), 20)
+        self.assertEqual(Category.objects.count(), 3)
+        self.assertEqual(Order.objects.count(), 200)
+        self.assertEqual(OrderItem.objects.count(), totals['order_lines'])
+        self.assertEqual(Cart.objects.count(), 5)
+        self.assertEqual(CartItem.objects.count(), totals['cart_lines'])
+        for order in Order.objects.prefetch_related('items'):
+            lines = list(order.items.all())
+            self.assertTrue(lines)
+            self.assertEqual(order.total_amount, sum(line.price * line.quantity for line in lines))
+            self.assertEqual(order.item_count, sum(line.quantity for line in lines))
+            self.assertEqual(len({line.product_id for line in lines}), len(lines))
+        product = Product.objects.first()
+        self.assertTrue(product.image.storage.exists(product.image.name))
+        user = User.objects.first()
+        self.assertTrue(user.check_password(fakedata.FAKE_PASSWORD))
+        # Новые строки после сгенерированных получают следующие id
+        last_id = Order.objects.order_by('-id').values_list('id', flat=True).first()
+        self.assertGreater(Order.objects.create(user=user, total_amount=1).id, last_id)
+
+    def test_same_seed_gives_same_data(self):
+        self.generate()
+        first = self.snapshot()
+        self.generate()
+        second = self.snapshot()
+        self.assertEqual(second[:len(first)], first)
+        OrderItem.objects.all().delete()
+        Order.objects.all().delete()
+        self.generate(seed=2)
+        self.assertNotEqual(self.snapshot(), first)
+
+    def test_command_rebuilds_rollups(self):
+        out = StringIO()
+        call_command('generate_fake_data', '--users', '10', '--products', '10', '--orders', '50',
+                     '--carts', '0', stdout=out)
+        self.assertIn('заказов 50', out.getvalue())
+        self.assertEqual(sum(DailySales.objects.values_list('order_count', flat=True)), 50)
+        with self.assertRaises(CommandError):
+            call_command('generate_fake_data', '--users', '1', '--carts', '2', stdout=StringIO())
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_STICKY_SECONDS=5)
+class ReplicaRouterTests(TestCase):
+
+    def setUp(self):
+        routers.reset_health()
+        self.addCleanup(routers.reset_health)
+        # Тест выполняется в транзакции основной базы, а она закрепляет чтение за ней
+        patcher = mock.patch.object(routers, 'in_primary_transaction', return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def healthy(self, value=True):
+        return mock.patch.object(routers, '_check', return_value=value)
+
+    def serve(self, view, **cookies):
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies)
+        return routers.ReplicaRoutingMiddleware(view)(request)
+
+    def test_catalog_and_order_reads_go_to_replica(self):
+        with self.healthy():
+            self.assertEqual(Product.objects.all().db, 'replica')
+            self.assertEqual(Order.objects.all().db, 'replica')
+            self.assertEqual(User.objects.all().db, 'default')
+            self.assertEqual(Product.objects.select_for_update().db, 'default')
+            self.assertEqual(routers.ReplicaRouter().db_for_write(Product), 'default')
+
+    def test_unhealthy_replica_fails_over_to_primary(self):
+        with self.healthy(False):
+            self.assertEqual(Product.objects.all().db, 'default')
+        with self.healthy():
+            # Результат проверки запоминается до следующей
+            self.assertEqual(Product.objects.all().db, 'default')
+            routers.reset_health()
+            self.assertEqual(Product.objects.all().db, 'replica')
+
+    def test_request_sticks_to_primary_after_write(self):
+        seen = []
+
+        def view(request):
+            seen.append(Product.objects.all().db)
+            Cart.objects.filter(pk=0).update(updated_at=timezone.now())
+            seen.append(Product.objects.all().db)
+            return HttpResponse()
+
+        with self.healthy():
+            response = self.serve(view)
+        self.assertEqual(seen, ['replica', 'default'])
+        cookie = response.cookies[routers.STICKY_COOKIE]
+        self.assertEqual(cookie['max-age'], 5)
+
+        def read_only(request):
+            seen.append(Product.objects.all().db)
+            return HttpResponse()
+
+        with self.healthy():
+            response = self.serve(read_only, **{routers.STICKY_COOKIE: cookie.value})
+            self.assertNotIn(routers.STICKY_COOKIE, response.cookies)
+            self.serve(read_only, **{routers.STICKY_COOKIE: str(time.time() - 1)})
+        self.assertEqual(seen[2:], ['default', 'replica'])
+
+    def test_add_to_cart_pins_visitor_to_primary(self):
+        product = make_products(1)[0]
+        with self.healthy(False):
+            response = self.client.post(reverse('shop:add_to_cart', args=[product.id]))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(routers.STICKY_COOKIE, response.cookies)
+
+    def test_missing_replica_is_unhealthy(self):
+        with self.settings(DATABASE_REPLICAS=['no-such-replica']):
+            with self.assertLogs('shop.routers', 'WARNING'):
+                self.assertEqual(routers.healthy_replicas(), [])
+            self.assertEqual(Product.objects.all().db, 'default')
+
+    def test_migrations_skip_replicas(self):
+        router = routers.ReplicaRouter()
+        self.assertIs(router.allow_migrate('replica', 'shop'), False)
+        self.assertIsNone(router.allow_migrate('default', 'shop'))
+
+
+REPLICA_ALIAS = 'sqlite_replica'
+
+
+@skipIf(connection.vendor != 'sqlite', 'Реплика моделируется отдельным файлом SQLite')
+@override_settings(DATABASE_REPLICAS=[REPLICA_ALIAS], REPLICA_STICKY_SECONDS=5)
+class ReplicaSQLiteTests(TransactionTestCase):
+    """Маршрутизация на настоящей второй базе: реплика — снимок основной базы."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Псевдоним добавляется после проверок тестового запуска: тестовую базу
+        # для него Django не создаёт, файл реплики тест ведёт сам
+        cls.databases = cls.databases | {REPLICA_ALIAS}
+        cls.replica_dir = tempfile.mkdtemp()
+        cls.replica_path = os.path.join(cls.replica_dir, 'replica.sqlite3')
+        replica = copy.deepcopy(connections.settings[DEFAULT_DB_ALIAS])
+        replica['NAME'] = cls.replica_path
+        connections.settings[REPLICA_ALIAS] = replica
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[REPLICA_ALIAS].close()
+        del connections[REPLICA_ALIAS]
+        del connections.settings[REPLICA_ALIAS]
+        shutil.rmtree(cls.replica_dir, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        routers.reset_health()
+        self.addCleanup(routers.reset_health)
+        self.replicate()
+        # Очистка после теста обращается и к реплике, поэтому файл должен быть целым
+        self.addCleanup(self.replicate)
+
+    def replicate(self):
+        """Переносит на реплику текущее состояние основной базы."""
+        connections[REPLICA_ALIAS].close()
+        if os.path.isdir(self.replica_path):
+            os.rmdir(self.replica_path)
+        primary = connections[DEFAULT_DB_ALIAS]
+        primary.ensure_connection()
+        target = sqlite3.connect(self.replica_path)
+        try:
+            primary.connection.backup(target)
+        finally:
+            target.close()
+
+    def detail_status(self, product):
+        cache.clear()
+        return self.client.get(reverse('shop:product_detail', args=[product.slug])).status_code
+
+    def test_reads_replica_until_write_then_falls_back_to_primary(self):
+        replicated = make_products(1)[0]
+        self.replicate()
+        fresh = Product.objects.create(name='Новинка', slug='fresh', description='Новинка',
+                                       price=Decimal('10.00'), image='products/test.jpg')
+
+        # Реплика ещё не получила новый товар
+        self.assertEqual(Product.objects.filter(pk=fresh.pk).db, REPLICA_ALIAS)
+        self.assertFalse(Product.objects.filter(pk=fresh.pk).exists())
+        self.assertEqual(self.detail_status(replicated), 200)
+        self.assertEqual(self.detail_status(fresh), 404)
+
+        # После записи посетитель читает свои изменения из основной базы
+        response = self.client.post(reverse('shop:add_to_cart', args=[replicated.id]))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(routers.STICKY_COOKIE, response.cookies)
+        self.assertEqual(self.detail_status(fresh), 200)
+        del self.client.cookies[routers.STICKY_COOKIE]
+        self.assertEqual(self.detail_status(fresh), 404)
+
+        # Недоступная реплика: файл базы подменён каталогом
+        connections[REPLICA_ALIAS].close()
+        os.remove(self.replica_path)
+        os.mkdir(self.replica_path)
+        routers.reset_health()
+        with self.assertLogs('shop.routers', 'WARNING'):
+            self.assertEqual(self.detail_status(fresh), 200)
+        self.assertEqual(Product.objects.all().db, DEFAULT_DB_ALIAS)
@@ -1,12 +1,37 @@
+import asyncio
+import uuid
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, authenticate, logout
 from django.contrib import messages
-from django.conf import settings
 from django.core.paginator import Paginator
-from django.db import transaction
-from django.core.mail import send_mail
-from .models import User, Product, Cart, CartItem, Order, OrderItem
+from .models import User, Product, Order
+from .pagination import KeysetPaginator, InvalidCursor
+from .cache import cache_anonymous_page, product_list_key, product_detail_key
+from . import catalog, events, mail, metrics, profiling, recommendations, services
+from .cart import get_cart, merge_session_cart
+from .search import search_products
+
+
+# Количество товаров на одной странице каталога
+PRODUCTS_PER_PAGE = 12
+
+# Количество заказов на одной странице истории заказов
+ORDERS_PER_PAGE = 20
+
+# Количество подсказок при автодополнении поиска
+SUGGESTIONS_LIMIT = 10
+
+# Интервал (с) комментариев-пингов в потоке событий: не даёт прокси
+# закрыть простаивающее соединение
+EVENTS_HEARTBEAT_INTERVAL = 15
 
 
 def register(request):
@@ -28,6 +53,7 @@ def register(request):
         
         user = User.objects.create_user(email=email, password=password)
         login(request, user)
+        merge_session_cart(request, user)
         messages.success(request, 'Регистрация успешна! Добро пожаловать!')
         return redirect('shop:product_list')
     
@@ -45,6 +71,7 @@ def login_view(request):
         
         if user is not None:
             login(request, user)
+            merge_session_cart(request, user)
             messages.success(request, 'Вы успешно вошли в систему.')
             return redirect('shop:product_list')
         else:
@@ -62,22 +89,42 @@ def logout_view(request):
     return redirect('shop:product_list')
 
 
+@cache_anonymous_page(product_list_key)
 def product_list(request):
     """
-    Отображает список активных товаров с пагинацией.
+    Отображает список активных товаров с фильтрами, сортировкой
+    и счётчиками фасетов (см. shop/catalog.py).
+    По умолчанию используется курсорная пагинация (?cursor=...),
+    старые ссылки вида ?page=N обслуживаются классическим Paginator.
     """
-    products = Product.objects.filter(is_active=True)
-    
-    # Пагинация: по 12 товаров на страницу
-    paginator = Paginator(products, 12)
+    # Ссылки страницы строятся из тех же параметров, что и ключ её кэша
+    request.GET = catalog.canonical_params(request.GET)
+    filters = catalog.parse_filters(request.GET)
+    products = catalog.filter_products(filters, Product.objects.for_cards())
+    key, descending = catalog.SORTS[filters['sort']]
     page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    
+    if page_number is not None:
+        # Пагинация: по 12 товаров на страницу
+        ordering = [f'-{key}', '-id'] if descending else [key, 'id']
+        paginator = Paginator(products.order_by(*ordering), PRODUCTS_PER_PAGE)
+        page_obj = paginator.get_page(page_number)
+    else:
+        paginator = KeysetPaginator(products, PRODUCTS_PER_PAGE, key, descending)
+        try:
+            page_obj = paginator.get_page(request.GET.get('cursor'))
+        except InvalidCursor:
+            page_obj = paginator.get_page(None)
     
     return render(request, 'shop/product_list.html', {
         'page_obj': page_obj,
+        'filters': filters,
+        'facets': catalog.facet_counts(filters),
+        'sorts': catalog.SORT_LABELS,
     })
 
 
+@cache_anonymous_page(product_detail_key)
 def product_detail(request, slug):
     """
     Отображает страницу товара с подробной информацией.
@@ -85,48 +132,66 @@ def product_detail(request, slug):
     product = get_object_or_404(Product, slug=slug, is_active=True)
     return render(request, 'shop/product_detail.html', {
         'product': product,
+        'recommendations': recommendations.for_product(product),
     })
 
 
-@login_required
+def search(request):
+    """
+    Поиск по каталогу с ранжированием по релевантности.
+    """
+    query = request.GET.get('q', '').strip()
+    page_obj = None
+    if query:
+        paginator = Paginator(search_products(query).for_cards(), PRODUCTS_PER_PAGE)
+        page_obj = paginator.get_page(request.GET.get('page'))
+    
+    return render(request, 'shop/search.html', {
+        'query': query,
+        'page_obj': page_obj,
+    })
+
+
+def search_suggest(request):
+    """
+    Подсказки для автодополнения: товары, слова которых начинаются с введённых.
+    """
+    query = request.GET.get('q', '').strip()
+    suggestions = []
+    if query:
+        products = search_products(query).values('name', 'slug')[:SUGGESTIONS_LIMIT]
+        suggestions = [
+            {'name': product['name'], 'url': reverse('shop:product_detail', args=[product['slug']])}
+            for product in products
+        ]
+    return JsonResponse({'query': query, 'results': suggestions})
+
+
 def add_to_cart(request, product_id):
     """
-    Добавляет товар в корзину текущего пользователя.
+    Добавляет товар в корзину текущего посетителя.
     Если товар уже есть в корзине, увеличивает количество.
     """
     product = get_object_or_404(Product, id=product_id, is_active=True)
     
-    # Получаем или создаём корзину для пользователя
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    
-    # Проверяем, есть ли уже этот товар в корзине
-    cart_item, item_created = CartItem.objects.get_or_create(
-        cart=cart,
-        product=product,
-        defaults={'price': product.price}
-    )
+    # Цена фиксируется только при первом добавлении товара
+    quantity, item_created = get_cart(request).add(product)
+    metrics.CART_MUTATIONS.inc(action='add')
     
     if not item_created:
-        # Если товар уже есть, увеличиваем количество
-        cart_item.quantity += 1
-        cart_item.save()
         messages.success(request, f'Количество товара "{product.name}" увеличено в корзине.')
     else:
-        # Если товар добавлен впервые, фиксируем цену
-        cart_item.price = product.price
-        cart_item.save()
         messages.success(request, f'Товар "{product.name}" добавлен в корзину.')
     
     return redirect('shop:product_detail', slug=product.slug)
 
 
-@login_required
 def cart_view(request):
     """
-    Отображает содержимое корзины текущего пользователя.
+    Отображает содержимое корзины текущего посетителя.
     """
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    cart_items = cart.items.all()
+    cart = get_cart(request)
+    cart_items = cart.items()
     total = cart.get_total()
     
     return render(request, 'shop/cart.html', {
@@ -136,34 +201,28 @@ def cart_view(request):
     })
 
 
-@login_required
 def update_cart_item(request, item_id):
     """
     Изменяет количество товара в корзине.
     """
-    cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-    
     if request.method == 'POST':
         quantity = int(request.POST.get('quantity', 1))
+        get_cart(request).set_quantity(item_id, quantity)
+        metrics.CART_MUTATIONS.inc(action='update' if quantity > 0 else 'remove')
         if quantity > 0:
-            cart_item.quantity = quantity
-            cart_item.save()
             messages.success(request, 'Количество товара обновлено.')
         else:
-            cart_item.delete()
             messages.success(request, 'Товар удалён из корзины.')
     
     return redirect('shop:cart')
 
 
-@login_required
 def remove_from_cart(request, item_id):
     """
     Удаляет товар из корзины.
     """
-    cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-    product_name = cart_item.product.name
-    cart_item.delete()
+    product_name = get_cart(request).remove(item_id)
+    metrics.CART_MUTATIONS.inc(action='remove')
     messages.success(request, f'Товар "{product_name}" удалён из корзины.')
     return redirect('shop:cart')
 
@@ -173,89 +232,74 @@ def checkout(request):
     """
     Отображает страницу оформления заказа и обрабатывает подтверждение.
     """
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    cart_items = cart.items.all()
-    
-    if not cart_items.exists():
-        messages.warning(request, 'Ваша корзина пуста.')
-        return redirect('shop:cart')
-    
-    total = cart.get_total()
-    
     if request.method == 'POST':
         # Оформляем заказ
-        with transaction.atomic():
-            # Создаём заказ
-            order = Order.objects.create(
-                user=request.user,
-                total_amount=total
+        try:
+            order, created = services.place_order(
+                request.user,
+                checkout_token=_parse_checkout_token(request.POST.get('checkout_token')),
             )
-            
-            # Создаём позиции заказа на основе корзины
-            # Фиксируем данные заказа, чтобы они не изменялись
-            for cart_item in cart_items:
-                OrderItem.objects.create(
-                    order=order,
-                    product=cart_item.product,
-                    quantity=cart_item.quantity,
-                    price=cart_item.price
-                )
-            
-            # Очищаем корзину после оформления заказа
-            cart.items.all().delete()
+        except services.EmptyCartError:
+            messages.warning(request, 'Ваша корзина пуста.')
+            return redirect('shop:cart')
+        
+        if not created:
+            # Повторная отправка формы: заказ уже оформлен
+            return redirect('shop:order_detail', order_id=order.id)
         
-        # --- ОТПРАВКА EMAIL-УВЕДОМЛЕНИЯ ---
-        if settings.ENABLE_EMAIL_SENDING:
-            recipient_email = request.user.email
-            if "@" in recipient_email:
-                domain = recipient_email.split('@')[1]
-                if domain == "test.local":
-                    print(f"DEBUG: Пропуск отправки email на тестовый домен: {recipient_email}")
-                    messages.info(request, "Заказ успешно оформлен! Отправка подтверждения на тестовый домен 'test.local' пропущена.")
-                else:
-                    try:
-                        subject = f'Заказ #{order.id} в магазине QuickCart успешно оформлен!'
-                        message = (
-                            f'Здравствуйте, {request.user.email}!\n\n'
-                            f'Ваш заказ #{order.id} на сумму {order.total_amount} ₽ был успешно создан.\n'
-                            f'Вы можете отследить его статус в личном кабинете на нашем сайте.\n\n'
-                            'Спасибо за покупку!'
-                        )
-                        # from_email не указываем, будет использован DEFAULT_FROM_EMAIL из settings.py
-                        recipient_list = [request.user.email]
-
-                        send_mail(subject, message, from_email=None, recipient_list=recipient_list)
-                        messages.success(request, f'Заказ #{order.id} успешно оформлен! Подтверждение отправлено на вашу почту.')
-                    except Exception as e:
-                        # Если отправка письма не удалась, заказ все равно оформлен.
-                        # Просто сообщаем пользователю об успехе оформления, но без упоминания письма.
-                        # В реальном проекте здесь стоит логировать ошибку 'e'.
-                        print(f"ERROR: Ошибка при отправке email для заказа #{order.id} на {recipient_email}: {e}")
-                        messages.success(request, f'Заказ #{order.id} успешно оформлен!')
-            else:
-                print(f"ERROR: Некорректный формат email для получателя: {recipient_email}")
-                messages.error(request, "Заказ оформлен, но возникла ошибка с форматом email для отправки подтверждения.")
+        # Письмо уже в очереди (shop/mail.py), его отправит send_outbox
+        email_status = mail.confirmation_status(request.user.email)
+        if email_status == mail.CONFIRMATION_QUEUED:
+            messages.success(request, f'Заказ #{order.id} успешно оформлен! Подтверждение будет отправлено на вашу почту.')
+        elif email_status == mail.CONFIRMATION_SKIPPED:
+            messages.info(request, "Заказ успешно оформлен! Отправка подтверждения на тестовый домен 'test.local' пропущена.")
+        elif email_status == mail.CONFIRMATION_INVALID:
+            messages.error(request, "Заказ оформлен, но возникла ошибка с форматом email для отправки подтверждения.")
         else:
-            # Отправка email отключена в настройках
             messages.success(request, f'Заказ #{order.id} успешно оформлен!')
 
         return redirect('shop:order_detail', order_id=order.id)
     
+    cart = get_cart(request)
+    cart_items = cart.items()
+    
+    if not cart_items:
+        messages.warning(request, 'Ваша корзина пуста.')
+        return redirect('shop:cart')
+    
+    total = cart.get_total()
+    
     return render(request, 'shop/checkout.html', {
         'cart': cart,
         'cart_items': cart_items,
         'total': total,
+        'checkout_token': uuid.uuid4(),
     })
 
 
+def _parse_checkout_token(value):
+    """Возвращает UUID из формы оформления или None, если токен некорректен."""
+    try:
+        return uuid.UUID(value)
+    except (TypeError, ValueError):
+        return None
+
+
 @login_required
 def order_list(request):
     """
-    Отображает список заказов текущего пользователя.
+    Отображает историю заказов текущего пользователя с курсорной пагинацией.
+    Страница — один запрос по индексу (user_id, created_at DESC); число
+    товаров и фото берутся из сводки, сохранённой в заказе при оформлении.
     """
-    orders = Order.objects.filter(user=request.user)
+    paginator = KeysetPaginator(Order.objects.filter(user=request.user), ORDERS_PER_PAGE)
+    try:
+        page_obj = paginator.get_page(request.GET.get('cursor'))
+    except InvalidCursor:
+        page_obj = paginator.get_page(None)
     return render(request, 'shop/order_list.html', {
-        'orders': orders,
+        'orders': page_obj.object_list,
+        'page_obj': page_obj,
     })
 
 
@@ -265,8 +309,78 @@ def order_detail(request, order_id):
     Отображает детальную информацию о заказе.
     """
     order = get_object_or_404(Order, id=order_id, user=request.user)
+    # Данные товаров берутся из снимка в позициях, без JOIN с каталогом
     order_items = order.items.all()
     return render(request, 'shop/order_detail.html', {
         'order': order,
         'order_items': order_items,
     })
+
+
+async def order_events(request):
+    """
+    Поток server-sent events со статусами заказов текущего пользователя.
+
+    Вместо перезагрузки страниц заказов браузер держит одно простаивающее
+    соединение и получает событие status при каждом изменении статуса.
+    Работает только под ASGI-сервером (quickcart/asgi.py): под WSGI
+    бесконечный ответ занял бы рабочий поток, поэтому там возвращается
+    204 — по стандарту EventSource после него не переподключается.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=403)
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    response = StreamingHttpResponse(
+        _order_event_stream(user.pk),
+        content_type='text/event-stream; charset=utf-8',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Отключаем буферизацию ответа в nginx
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def _order_event_stream(user_id):
+    subscription = events.get_broker().subscribe(events.user_channel(user_id))
+    try:
+        yield 'retry: 5000\n\n'
+        while True:
+            try:
+                message = await subscription.get(timeout=EVENTS_HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ': ping\n\n'
+                continue
+            yield events.format_sse(message, event='status')
+    finally:
+        # Клиент отключился: ASGI-обработчик отменяет генератор
+        subscription.close()
+
+
+@staff_member_required
+def profiling_report(request):
+    """
+    Сводка профилирования по представлениям (см. shop/profiling.py):
+    время ответа, запросы к базе, рендер шаблонов и признаки N+1.
+    """
+    if request.method == 'POST':
+        profiling.reset()
+        messages.success(request, 'Статистика профилирования сброшена.')
+        return redirect('shop:profiling_report')
+    return render(request, 'shop/profiling_report.html', {
+        'views': profiling.report(),
+        'enabled': profiling.profiling_enabled(),
+        'threshold': profiling.repeat_threshold(),
+    })
+
+
+def metrics_view(request):
+    """
+    Метрики в формате Prometheus (см. shop/metrics.py). Если задан
+    METRICS_TOKEN, требуется заголовок «Authorization: Bearer <токен>».
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=403)
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)